@@ -19,19 +19,55 @@ def create_app():
     app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
     app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
-    # Configure the database - use SQLite
+    # Configure the database - use SQLite (DATABASE_PATH points elsewhere, e.g. a scratch file for tests)
     basedir = os.path.abspath(os.path.dirname(__file__))
-    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{os.path.join(basedir, 'data', 'printing_costs.db')}"
-    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-        "pool_recycle": 300,
-        "pool_pre_ping": True,
-    }
+    database_path = os.environ.get("DATABASE_PATH", os.path.join(basedir, 'data', 'printing_costs.db'))
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{database_path}"
+    # SQLite engine profile (SQLITE_PROFILE=production|legacy): WAL, busy timeout, mmap, ...
+    from sqlite_profile import get_sqlite_pragmas, sqlite_engine_options, register_sqlite_pragmas
+    sqlite_pragmas = get_sqlite_pragmas()
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = sqlite_engine_options(sqlite_pragmas)
+
+    # Statements slower than this (milliseconds) go to the slow-query log
+    app.config["SQL_SLOW_QUERY_MS"] = float(os.environ.get("SQL_SLOW_QUERY_MS", 100))
+
+    # Backup scheduler: "type=interval" pairs (m/h/d), jitter window in seconds
+    app.config["BACKUP_SCHEDULER_ENABLED"] = os.environ.get("BACKUP_SCHEDULER_ENABLED", "1") == "1"
+    app.config["BACKUP_SCHEDULE"] = os.environ.get("BACKUP_SCHEDULE", "incremental=6h,full=1d")
+    app.config["BACKUP_SCHEDULE_JITTER"] = float(os.environ.get("BACKUP_SCHEDULE_JITTER", 600))
+
+    # Seconds a logged-in employee's id/role/active flag is trusted from the signed session cookie
+    app.config["PRINCIPAL_CACHE_SECONDS"] = float(os.environ.get("PRINCIPAL_CACHE_SECONDS", 60))
+
+    # Background job worker threads per process (0 = run `flask run-job-worker` separately)
+    app.config["JOB_WORKER_THREADS"] = int(os.environ.get("JOB_WORKER_THREADS", 1))
 
     # Initialize the app with the extension
     db.init_app(app)
+    with app.app_context():
+        register_sqlite_pragmas(db.engine, sqlite_pragmas)
+    
+    # Per-request SQL statement count and DB time
+    from sql_metrics import init_sql_metrics
+    init_sql_metrics(app)
     
+    # Public address encoded in QR codes and tracking links (else SERVER_NAME, else the request Host)
+    app.config["PUBLIC_BASE_URL"] = os.environ.get("PUBLIC_BASE_URL", "").rstrip("/")
+    
+    # QR codes: bounded in-memory LRU plus a bounded on-disk cache shared by workers
+    from qr_codes import qr_cache
+    qr_cache.configure(
+        max_entries=int(os.environ.get("QR_CACHE_SIZE", 512)),
+        disk_dir=os.environ.get("QR_DISK_CACHE_DIR", os.path.join(basedir, 'data', 'qr_cache')) or None,
+        max_disk_entries=int(os.environ.get("QR_DISK_CACHE_SIZE", 4096))
+    )
+    
+    # Rendered template fragments ({% cache %}), keyed on the catalog/settings version
+    from fragment_cache import init_fragment_cache
+    init_fragment_cache(app, max_entries=int(os.environ.get("FRAGMENT_CACHE_SIZE", 256)))
+
     # إضافة فلاتر جينجا للتعامل مع التوقيت المصري
-    from utils import format_cairo_datetime, format_relative_time
+    from utils import format_cairo_datetime, format_relative_time, format_short_order_number
     
     @app.template_filter('cairo_datetime')
     def cairo_datetime_filter(datetime_obj, format_string='%Y-%m-%d %H:%M'):
@@ -43,6 +79,11 @@ def create_app():
         """فلتر لعرض الوقت النسبي بالعربية"""
         return format_relative_time(datetime_obj)
     
+    @app.template_filter('short_order_number')
+    def short_order_number_filter(order_number):
+        """رقم الطلب المختصر لجداول الطلبات"""
+        return format_short_order_number(order_number)
+    
     return app
 
 app = create_app()
@@ -0,0 +1,86 @@
+import time
+from flask import g, session, current_app
+from sqlalchemy import select
+from app import db
+from models import Employee, ROLE_ADMIN
+from catalog_cache import get_cache_version, bump_cache_version
+
+# مفاتيح الجلسة الخاصة بتسجيل الدخول
+SESSION_KEYS = ('admin_logged_in', 'employee_id', 'employee_name', 'principal')
+
+# إصدار في جدول cache_versions: زيادته تُبطل الهويات المخزنة في جلسات كل العمليات
+PRINCIPALS = 'principals'
+
+
+def _principal_of(employee, version):
+    return {
+        'id': employee.id,
+        'username': employee.username,
+        'role': employee.role,
+        'active': bool(employee.is_active),
+        'version': version,
+        'cached_at': time.time(),
+    }
+
+
+def _is_fresh(cached, employee_id, version):
+    if not cached or cached.get('id') != employee_id or cached.get('version') != version:
+        return False
+    return time.time() - cached.get('cached_at', 0) <= current_app.config['PRINCIPAL_CACHE_SECONDS']
+
+
+def _load_principal():
+    """هوية المستخدم من نسخة الجلسة الموقّعة إن كانت حديثة، وإلا من قاعدة البيانات"""
+    employee_id = session.get('employee_id')
+    if not session.get('admin_logged_in') or not employee_id:
+        return None
+    version = get_cache_version(PRINCIPALS)
+    cached = session.get('principal')
+    if _is_fresh(cached, employee_id, version):
+        return cached
+    row = db.session.execute(
+        select(Employee.id, Employee.username, Employee.role, Employee.is_active)
+        .where(Employee.id == employee_id)
+    ).first()
+    if row is None:
+        session.pop('principal', None)
+        return None
+    principal = _principal_of(row, version)
+    session['principal'] = principal
+    return principal
+
+
+def current_principal():
+    """المستخدم الحالي (id, username, role, active) محسوباً مرة واحدة لكل طلب في g"""
+    if 'principal' not in g:
+        g.principal = _load_principal()
+    return g.principal
+
+
+def is_admin():
+    """هل المستخدم الحالي مدير نشط؟"""
+    principal = current_principal()
+    return bool(principal and principal['active'] and principal['role'] == ROLE_ADMIN)
+
+
+def login_principal(employee):
+    """تسجيل الدخول: حفظ الهوية في الجلسة وفي g"""
+    session['admin_logged_in'] = True
+    session['employee_id'] = employee.id
+    session['employee_name'] = employee.full_name
+    session['principal'] = g.principal = _principal_of(employee, get_cache_version(PRINCIPALS))
+
+
+def logout_principal():
+    for key in SESSION_KEYS:
+        session.pop(key, None)
+    g.principal = None
+
+
+def invalidate_principals():
+    """إبطال الهويات المخزنة في كل الجلسات بعد تعديل موظف (في نفس المعاملة، قبل commit)
+
+    كل العمليات تقارن إصدار الهوية المخزنة بإصدار قاعدة البيانات، فالإبطال فوري في جميعها.
+    """
+    bump_cache_version(PRINCIPALS)
+    g.pop('principal', None)
@@ -1,15 +1,68 @@
-import shutil
+import fcntl
+import gzip
 import os
+import sqlite3
+import time
 from datetime import datetime
 import json
+from sqlalchemy import select
 from models import *
 from app import db
+from snapshot_store import SnapshotStore
+
+# صفحات SQLite المنسوخة في كل خطوة (4096 بايت للصفحة افتراضياً) والمهلة بين الخطوات
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_SLEEP = 0.01
+# بعد هذا العدد من إعادة البدء (بسبب كتابات متزامنة) تُنسخ القاعدة في خطوة واحدة
+BACKUP_MAX_RESTARTS = 3
+BACKUP_BUSY_TIMEOUT = 5
+# أقل فاصل (بالثواني) بين تحديثات ملف التقدم
+BACKUP_PROGRESS_INTERVAL = 0.5
+# حالة "قيد التنفيذ" لم تُحدّث منذ هذه المدة تُعتبر متوقفة
+BACKUP_STALE_SECONDS = 120
+
+# عدد الصفوف المقروءة من قاعدة البيانات في كل دفعة أثناء التصدير
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FORMAT_VERSION = 2
+# (اسم الجدول في ملف التصدير، النموذج، أعمدة مستبعدة)
+EXPORT_TABLES = [
+    ('academic_years', AcademicYear, ()),
+    ('subjects', Subject, ()),
+    ('books', Book, ()),
+    ('printing_prices', PrintingPrice, ()),
+    ('addons', AddOn, ()),
+    ('employees', Employee, ('password',)),
+    ('orders', Order, ()),
+    ('order_number_aliases', OrderNumberAlias, ()),
+    ('order_items', OrderItem, ()),
+    ('order_addons', OrderAddon, ()),
+]
+
+
+def _json_value(value):
+    """تحويل قيم الأعمدة إلى قيم JSON (التواريخ بصيغة ISO)"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+class BackupError(Exception):
+    """فشل النسخ الاحتياطي برسالة جاهزة للعرض"""
+    pass
+
+
+class _BackupRestarted(Exception):
+    """القاعدة تغيّرت أثناء النسخ فأعادت SQLite البدء من الصفحة الأولى"""
+    pass
+
 
 class BackupManager:
     """مدير النسخ الاحتياطي للبيانات"""
     
     def __init__(self, backup_dir='backup'):
         self.backup_dir = backup_dir
+        self.progress_file = os.path.join(backup_dir, '.backup_progress')
+        self.snapshots = SnapshotStore(os.path.join(backup_dir, 'snapshots'))
         self.ensure_backup_dir()
     
     def ensure_backup_dir(self):
@@ -17,159 +70,325 @@ class BackupManager:
         if not os.path.exists(self.backup_dir):
             os.makedirs(self.backup_dir)
     
-    def create_database_backup(self):
-        """إنشاء نسخة احتياطية من قاعدة البيانات"""
+    def database_path(self):
+        """مسار ملف قاعدة البيانات الفعلي من محرك SQLAlchemy"""
+        return db.engine.url.database
+
+    def write_progress(self, **state):
+        """حفظ حالة النسخ في ملف حتى تقرأه كل عمليات الخادم"""
+        state['updated_at'] = datetime.now().isoformat()
+        tmp_path = f'{self.progress_file}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.progress_file)
+
+    def get_progress(self):
+        """حالة آخر نسخة احتياطية (أو None إذا لم تبدأ أي نسخة)"""
         try:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            
-            # نسخ ملف قاعدة البيانات
-            db_source = 'data/printing_costs.db'
-            db_backup = f'{self.backup_dir}/db_backup_{timestamp}.db'
-            
-            if os.path.exists(db_source):
-                shutil.copy2(db_source, db_backup)
-                
-                # إنشاء ملف معلومات عن النسخة الاحتياطية
-                backup_info = {
-                    'backup_date': datetime.now().isoformat(),
-                    'database_file': db_backup,
-                    'backup_type': 'database',
-                    'file_size': os.path.getsize(db_backup),
-                    'original_path': db_source
-                }
-                
-                info_file = f'{self.backup_dir}/backup_info_{timestamp}.json'
-                with open(info_file, 'w', encoding='utf-8') as f:
-                    json.dump(backup_info, f, ensure_ascii=False, indent=2)
-                
-                return {
-                    'success': True,
-                    'backup_file': db_backup,
-                    'info_file': info_file,
-                    'timestamp': timestamp
-                }
-            else:
-                return {
-                    'success': False,
-                    'error': 'لم يتم العثور على ملف قاعدة البيانات'
-                }
-                
+            with open(self.progress_file, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def is_backup_running(self):
+        progress = self.get_progress()
+        if not progress or progress.get('state') != 'running':
+            return False
+        # حالة قديمة لم تُحدّث (توقفت العملية التي كانت تنسخ)
+        updated_at = datetime.fromisoformat(progress['updated_at'])
+        return (datetime.now() - updated_at).total_seconds() < BACKUP_STALE_SECONDS
+
+    def _copy_database(self, source, target, pages_per_step, report):
+        """نسخ قاعدة البيانات بواجهة SQLite للنسخ على دفعات من الصفحات
+
+        بين كل دفعة يُترك القفل للكتّاب. إذا تغيّرت القاعدة أثناء النسخ تعيد SQLite
+        البدء؛ بعد BACKUP_MAX_RESTARTS نسخ القاعدة في خطوة واحدة (لقطة قراءة واحدة).
+        """
+        restarts = 0
+        while True:
+            state = {'remaining': None}
+
+            def progress(status, remaining, total):
+                if state['remaining'] is not None and remaining > state['remaining']:
+                    raise _BackupRestarted()
+                state['remaining'] = remaining
+                report(total - remaining, total)
+                # يُستدعى بعد كل خطوة وقد تحرر قفل القراءة؛ مهلة قصيرة حتى يكتب الآخرون
+                time.sleep(BACKUP_STEP_SLEEP)
+
+            dst = sqlite3.connect(target)
+            try:
+                if restarts >= BACKUP_MAX_RESTARTS:
+                    source.backup(dst, pages=-1)
+                else:
+                    source.backup(dst, pages=pages_per_step, progress=progress)
+                # النسخة ملف واحد مستقل بدون WAL
+                dst.execute('PRAGMA journal_mode=DELETE')
+                return restarts
+            except _BackupRestarted:
+                restarts += 1
+            finally:
+                dst.close()
+
+    def _consistent_copy(self, target, progress, pages_per_step=BACKUP_PAGES_PER_STEP):
+        """نسخة متسقة ومفحوصة من قاعدة البيانات في target مع تحديث ملف التقدم"""
+        last_report = [0.0]
+
+        def report(done, total):
+            now = time.monotonic()
+            if now - last_report[0] >= BACKUP_PROGRESS_INTERVAL:
+                last_report[0] = now
+                self.write_progress(**dict(progress, pages_done=done, pages_total=total))
+
+        db_source = self.database_path()
+        if not db_source or not os.path.exists(db_source):
+            raise BackupError('لم يتم العثور على ملف قاعدة البيانات')
+
+        self.write_progress(**progress)
+        source = sqlite3.connect(db_source, timeout=BACKUP_BUSY_TIMEOUT)
+        try:
+            page_count = source.execute('PRAGMA page_count').fetchone()[0]
+            restarts = self._copy_database(source, target, pages_per_step, report)
+        finally:
+            source.close()
+
+        # فحص سلامة النسخة نفسها قبل اعتمادها
+        self.write_progress(**dict(progress, phase='verify',
+                                    pages_done=page_count, pages_total=page_count))
+        check = sqlite3.connect(target)
+        try:
+            integrity = [row[0] for row in check.execute('PRAGMA integrity_check')]
+        finally:
+            check.close()
+        if integrity != ['ok']:
+            raise BackupError('فشل فحص سلامة النسخة: ' + '; '.join(integrity[:5]))
+
+        return {'db_source': db_source, 'page_count': page_count, 'restarts': restarts}
+
+    def create_database_backup(self, pages_per_step=BACKUP_PAGES_PER_STEP):
+        """إنشاء نسخة احتياطية متسقة من قاعدة البيانات أثناء عملها"""
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        db_backup = f'{self.backup_dir}/db_backup_{timestamp}.db'
+        # تُكتب النسخة في ملف مخفي ولا تظهر في القائمة إلا بعد نجاح الفحص
+        partial_file = f'{self.backup_dir}/.db_backup_{timestamp}.db.partial'
+        started_at = datetime.now()
+        progress = {'state': 'running', 'phase': 'copy', 'backup_file': db_backup,
+                    'started_at': started_at.isoformat(), 'pages_done': 0, 'pages_total': 0}
+
+        try:
+            copy = self._consistent_copy(partial_file, progress, pages_per_step)
+            os.replace(partial_file, db_backup)
+
+            # إنشاء ملف معلومات عن النسخة الاحتياطية
+            backup_info = {
+                'backup_date': datetime.now().isoformat(),
+                'database_file': db_backup,
+                'backup_type': 'database',
+                'method': 'sqlite_backup_api',
+                'file_size': os.path.getsize(db_backup),
+                'page_count': copy['page_count'],
+                'restarts': copy['restarts'],
+                'integrity_check': 'ok',
+                'duration_seconds': round((datetime.now() - started_at).total_seconds(), 3),
+                'original_path': copy['db_source']
+            }
+
+            info_file = f'{self.backup_dir}/backup_info_{timestamp}.json'
+            with open(info_file, 'w', encoding='utf-8') as f:
+                json.dump(backup_info, f, ensure_ascii=False, indent=2)
+
+            self.write_progress(**dict(progress, state='done', phase='done',
+                                        pages_done=copy['page_count'], pages_total=copy['page_count'],
+                                        file_size=backup_info['file_size']))
+            return {
+                'success': True,
+                'backup_file': db_backup,
+                'info_file': info_file,
+                'timestamp': timestamp
+            }
+
+        except BackupError as e:
+            self.write_progress(**dict(progress, state='failed', error=str(e)))
+            return {'success': False, 'error': str(e)}
         except Exception as e:
+            self.write_progress(**dict(progress, state='failed', error=str(e)))
             return {
                 'success': False,
                 'error': f'خطأ في إنشاء النسخة الاحتياطية: {str(e)}'
             }
-    
-    def create_data_export(self):
-        """تصدير البيانات إلى ملف JSON"""
+        finally:
+            if os.path.exists(partial_file):
+                os.remove(partial_file)
+
+    def create_incremental_backup(self, pages_per_step=BACKUP_PAGES_PER_STEP):
+        """لقطة تزايدية: نسخة متسقة تُخزن في مخزن اللقطات (الأجزاء المتغيرة فقط)"""
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        partial_file = f'{self.backup_dir}/.snapshot_{timestamp}.db.partial'
+        started_at = datetime.now()
+        progress = {'state': 'running', 'phase': 'copy', 'backup_type': 'incremental',
+                    'started_at': started_at.isoformat(), 'pages_done': 0, 'pages_total': 0}
+
         try:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            export_file = f'{self.backup_dir}/data_export_{timestamp}.json'
-            
-            # جمع البيانات من جميع الجداول
-            data_export = {
-                'export_date': datetime.now().isoformat(),
-                'academic_years': [],
-                'subjects': [],
-                'books': [],
-                'printing_prices': [],
-                'addons': [],
-                'employees': [],
-                'orders': []
+            copy = self._consistent_copy(partial_file, progress, pages_per_step)
+            self.write_progress(**dict(progress, phase='store',
+                                        pages_done=copy['page_count'], pages_total=copy['page_count']))
+            manifest = self.snapshots.create(partial_file,
+                                             page_count=copy['page_count'],
+                                             restarts=copy['restarts'],
+                                             integrity_check='ok')
+            pruned = self.snapshots.prune()
+
+            self.write_progress(**dict(progress, state='done', phase='done',
+                                        pages_done=copy['page_count'], pages_total=copy['page_count'],
+                                        snapshot_id=manifest['id'], new_bytes=manifest['new_bytes']))
+            return {
+                'success': True,
+                'snapshot_id': manifest['id'],
+                'new_chunks': manifest['new_chunks'],
+                'new_bytes': manifest['new_bytes'],
+                'pruned': pruned['removed']
             }
-            
-            # تصدير السنوات الدراسية
-            for year in AcademicYear.query.all():
-                data_export['academic_years'].append({
-                    'id': year.id,
-                    'name': year.name,
-                    'description': year.description,
-                    'is_active': year.is_active
-                })
-            
-            # تصدير المواد
-            for subject in Subject.query.all():
-                data_export['subjects'].append({
-                    'id': subject.id,
-                    'name': subject.name,
-                    'academic_year_id': subject.academic_year_id,
-                    'is_active': subject.is_active
-                })
-            
-            # تصدير الكتب
-            for book in Book.query.all():
-                data_export['books'].append({
-                    'id': book.id,
-                    'name': book.name,
-                    'pages': book.pages,
-                    'subject_id': book.subject_id,
-                    'is_active': book.is_active
-                })
-            
-            # تصدير أسعار الطباعة
-            for price in PrintingPrice.query.all():
-                data_export['printing_prices'].append({
-                    'id': price.id,
-                    'name': price.name,
-                    'price_per_page': float(price.price_per_page),
-                    'description': price.description,
-                    'is_active': price.is_active
-                })
-            
-            # تصدير الإضافات
-            for addon in AddOn.query.all():
-                data_export['addons'].append({
-                    'id': addon.id,
-                    'name': addon.name,
-                    'price': float(addon.price),
-                    'description': addon.description,
-                    'is_active': addon.is_active
-                })
-            
-            # تصدير الموظفين (بدون كلمات المرور)
-            for employee in Employee.query.all():
-                data_export['employees'].append({
-                    'id': employee.id,
-                    'username': employee.username,
-                    'name': employee.name,
-                    'role': employee.role,
-                    'is_active': employee.is_active,
-                    'created_at': employee.created_at.isoformat() if employee.created_at else None
-                })
-            
-            # تصدير الطلبات
-            for order in Order.query.all():
-                data_export['orders'].append({
-                    'id': order.id,
-                    'order_number': order.order_number,
-                    'customer_name': order.customer_name,
-                    'customer_phone': order.customer_phone,
-                    'status': order.status,
-                    'total_cost': float(order.total_cost),
-                    'created_at': order.created_at.isoformat() if order.created_at else None,
-                    'completed_at': order.completed_at.isoformat() if order.completed_at else None
-                })
-            
-            # حفظ البيانات
-            with open(export_file, 'w', encoding='utf-8') as f:
-                json.dump(data_export, f, ensure_ascii=False, indent=2)
+
+        except BackupError as e:
+            self.write_progress(**dict(progress, state='failed', error=str(e)))
+            return {'success': False, 'error': str(e)}
+        except Exception as e:
+            self.write_progress(**dict(progress, state='failed', error=str(e)))
+            return {
+                'success': False,
+                'error': f'خطأ في إنشاء اللقطة: {str(e)}'
+            }
+        finally:
+            if os.path.exists(partial_file):
+                os.remove(partial_file)
+
+    def restore_snapshot(self, snapshot_id):
+        """إعادة بناء لقطة كملف قاعدة بيانات في مجلد النسخ (للتحميل أو الاستعادة)"""
+        try:
+            target = f'{self.backup_dir}/db_restored_{snapshot_id}.db'
+            self.snapshots.restore(snapshot_id, target)
+            return {'success': True, 'backup_file': target}
+        except Exception as e:
+            return {'success': False, 'error': f'خطأ في استعادة اللقطة: {str(e)}'}
+
+    def delete_snapshot(self, snapshot_id):
+        try:
+            self.snapshots.delete(snapshot_id)
+            return {'success': True}
+        except Exception as e:
+            return {'success': False, 'error': f'خطأ في حذف اللقطة: {str(e)}'}
+
+    def prune_snapshots(self):
+        """تطبيق سياسة الاحتفاظ (الجد - الأب - الابن) على اللقطات"""
+        try:
+            result = self.snapshots.prune()
+            return dict(result, success=True)
+        except Exception as e:
+            return {'success': False, 'error': f'خطأ في تنظيف اللقطات: {str(e)}'}
+
+    def get_storage_usage(self):
+        """المساحة المستخدمة فعلياً: الملفات الكاملة + مخزن اللقطات"""
+        files_bytes = sum(item['size'] for item in self.get_backup_list() if item['type'] != 'snapshot')
+        usage = self.snapshots.usage()
+        usage['files_bytes'] = files_bytes
+        usage['total_bytes'] = files_bytes + usage['stored_bytes']
+        return usage
+
+    def run_backup(self, backup_type, trigger='manual', compress=False):
+        """تنفيذ نسخة احتياطية وتسجيلها في جدول backup_runs (الحالة والمدة)"""
+        # قفل على مستوى نظام الملفات: نسخة واحدة فقط في كل العمليات (يدوية أو مجدولة)
+        lock_file = open(os.path.join(self.backup_dir, '.backup_run.lock'), 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return {'success': False, 'error': 'توجد نسخة احتياطية قيد التنفيذ بالفعل'}
+        try:
+            return self._run_backup_locked(backup_type, trigger, compress)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    def _run_backup_locked(self, backup_type, trigger, compress):
+        run = BackupRun(backup_type=backup_type, trigger=trigger, status='running',
+                        started_at=datetime.utcnow())
+        db.session.add(run)
+        db.session.commit()
+
+        started = time.monotonic()
+        try:
+            if backup_type == 'full':
+                result = self.create_full_backup(compress=compress)
+                if not result['success']:
+                    result['error'] = (result['database_backup'].get('error')
+                                       or result['data_export'].get('error'))
+                result['backup_file'] = result['database_backup'].get('backup_file')
+            elif backup_type == 'incremental':
+                result = self.create_incremental_backup()
+            else:
+                result = self.create_database_backup()
+        except Exception as e:
+            result = {'success': False, 'error': str(e)}
+
+        run.status = 'success' if result.get('success') else 'failed'
+        run.finished_at = datetime.utcnow()
+        run.duration_seconds = round(time.monotonic() - started, 3)
+        run.message = result.get('error') if not result.get('success') else (
+            result.get('snapshot_id') or result.get('backup_file'))
+        db.session.commit()
+        return result
+
+    def _iter_table_rows(self, table, exclude=()):
+        """قراءة صفوف الجدول على دفعات (yield_per) بدون تحميله كاملاً في الذاكرة"""
+        columns = [column for column in table.columns if column.name not in exclude]
+        query = (select(*columns)
+                 .order_by(*table.primary_key.columns)
+                 .execution_options(yield_per=EXPORT_BATCH_SIZE))
+        for row in db.session.execute(query).mappings():
+            yield {name: _json_value(value) for name, value in row.items()}
+
+    def create_data_export(self, compress=False):
+        """تصدير البيانات إلى ملف NDJSON (سطر لكل سجل) مع ضغط gzip اختياري"""
+        partial_file = None
+        try:
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            export_file = f'{self.backup_dir}/data_export_{timestamp}.ndjson'
+            if compress:
+                export_file += '.gz'
+            partial_file = f'{self.backup_dir}/.data_export_{timestamp}.partial'
+
+            records_count = {}
+            opener = gzip.open if compress else open
+            with opener(partial_file, 'wt', encoding='utf-8') as f:
+                def write_line(item):
+                    f.write(json.dumps(item, ensure_ascii=False, separators=(',', ':')))
+                    f.write('\n')
+
+                write_line({'type': 'header', 'export_date': datetime.now().isoformat(),
+                            'format_version': EXPORT_FORMAT_VERSION,
+                            'tables': [name for name, _model, _exclude in EXPORT_TABLES]})
+
+                for name, model, exclude in EXPORT_TABLES:
+                    count = 0
+                    for record in self._iter_table_rows(model.__table__, exclude):
+                        write_line({'table': name, 'data': record})
+                        count += 1
+                    records_count[name] = count
+
+                write_line({'type': 'summary', 'records_count': records_count})
+
+            os.replace(partial_file, export_file)
             
             return {
                 'success': True,
                 'export_file': export_file,
                 'timestamp': timestamp,
-                'records_count': {
-                    'academic_years': len(data_export['academic_years']),
-                    'subjects': len(data_export['subjects']),
-                    'books': len(data_export['books']),
-                    'printing_prices': len(data_export['printing_prices']),
-                    'addons': len(data_export['addons']),
-                    'employees': len(data_export['employees']),
-                    'orders': len(data_export['orders'])
-                }
+                'records_count': records_count
             }
             
         except Exception as e:
+            if partial_file and os.path.exists(partial_file):
+                os.remove(partial_file)
             return {
                 'success': False,
                 'error': f'خطأ في تصدير البيانات: {str(e)}'
@@ -185,16 +404,30 @@ class BackupManager:
             
             for filename in os.listdir(self.backup_dir):
                 filepath = os.path.join(self.backup_dir, filename)
+                # الملفات المخفية: حالة التقدم والنسخ غير المكتملة
+                if filename.startswith('.'):
+                    continue
                 if os.path.isfile(filepath):
                     file_info = {
                         'filename': filename,
                         'filepath': filepath,
                         'size': os.path.getsize(filepath),
                         'created_at': datetime.fromtimestamp(os.path.getctime(filepath)),
-                        'type': 'database' if filename.endswith('.db') else 'export' if filename.endswith('.json') else 'info'
+                        'type': 'database' if filename.endswith('.db') else 'export' if filename.startswith('data_export_') else 'info'
                     }
                     backups.append(file_info)
             
+            # اللقطات التزايدية: الحجم الكامل للقطة والمساحة الجديدة التي أضافتها
+            for snapshot in self.snapshots.list():
+                backups.append({
+                    'filename': snapshot['id'],
+                    'filepath': None,
+                    'size': snapshot['file_size'],
+                    'stored_size': snapshot['new_bytes'],
+                    'created_at': snapshot['created_at'],
+                    'type': 'snapshot'
+                })
+            
             # ترتيب حسب التاريخ (الأحدث أولاً)
             backups.sort(key=lambda x: x['created_at'], reverse=True)
             return backups
@@ -214,10 +447,16 @@ class BackupManager:
         except Exception as e:
             return {'success': False, 'error': f'خطأ في حذف الملف: {str(e)}'}
     
-    def create_full_backup(self):
+    def create_full_backup(self, compress=False):
         """إنشاء نسخة احتياطية كاملة (قاعدة البيانات + تصدير البيانات)"""
         db_result = self.create_database_backup()
-        export_result = self.create_data_export()
+        if db_result.get('success'):
+            progress = self.get_progress() or {}
+            self.write_progress(**dict(progress, state='running', phase='export'))
+        export_result = self.create_data_export(compress=compress)
+        if db_result.get('success'):
+            self.write_progress(**dict(progress, state='done' if export_result.get('success') else 'failed',
+                                        phase='done', error=export_result.get('error')))
         
         return {
             'database_backup': db_result,
@@ -0,0 +1,190 @@
+import fcntl
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from app import app, db
+from models import BackupRun
+from backup_manager import BackupManager, BACKUP_STALE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# إعادة المحاولة بعد فشل النسخة بدلاً من انتظار الفترة كاملة
+RETRY_AFTER = timedelta(minutes=30)
+# كل كم ثانية يتحقق المجدول من النسخ المستحقة
+TICK_SECONDS = 60
+
+_UNITS = {'m': 60, 'h': 3600, 'd': 86400}
+
+BACKUP_TYPE_NAMES = {
+    'database': 'نسخ قاعدة البيانات',
+    'full': 'نسخة كاملة',
+    'incremental': 'لقطة تزايدية',
+}
+
+
+def parse_schedule(value):
+    """تحويل 'incremental=6h,full=1d' إلى {'incremental': timedelta(hours=6), ...}"""
+    schedule = {}
+    for part in (value or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        backup_type, _, interval = part.partition('=')
+        backup_type = backup_type.strip()
+        interval = interval.strip().lower()
+        if backup_type not in BACKUP_TYPE_NAMES or not interval or interval[-1] not in _UNITS:
+            raise ValueError(f'Invalid backup schedule entry: {part!r}')
+        schedule[backup_type] = timedelta(seconds=float(interval[:-1]) * _UNITS[interval[-1]])
+    return schedule
+
+
+class BackupScheduler:
+    """جدولة النسخ الاحتياطية في خيط خلفي مستقل عن طلبات الويب
+
+    كل عمليات gunicorn تشغّل الخيط، لكن عملية واحدة فقط تحمل قفل المجدول
+    (flock) وتنفذ النسخ؛ إذا توقفت يحرر النظام القفل وتتولاه عملية أخرى.
+    """
+
+    def __init__(self, backup_dir='backup'):
+        self.backup_dir = backup_dir
+        self.started_at = datetime.utcnow()
+        self._thread = None
+        self._thread_pid = None
+        self._lock_file = None
+        self._start_lock = threading.Lock()
+
+    def get_schedule(self):
+        return parse_schedule(app.config.get('BACKUP_SCHEDULE'))
+
+    def jitter_for(self, backup_type, last_run):
+        """تأخير عشوائي ثابت لكل موعد (نفس القيمة في كل العمليات وعند العرض)"""
+        window = app.config.get('BACKUP_SCHEDULE_JITTER', 0)
+        if not window:
+            return timedelta(0)
+        seed = f'{backup_type}:{last_run.id if last_run else 0}'
+        return timedelta(seconds=random.Random(seed).uniform(0, window))
+
+    def _last_run(self, backup_type):
+        return db.session.execute(
+            select(BackupRun)
+            .where(BackupRun.backup_type == backup_type)
+            .order_by(BackupRun.started_at.desc(), BackupRun.id.desc())
+            .limit(1)
+        ).scalar_one_or_none()
+
+    def due_at(self, backup_type, interval, last_run):
+        """موعد النسخة التالية (UTC) بعد آخر تشغيل + الفترة + التأخير العشوائي"""
+        jitter = self.jitter_for(backup_type, last_run)
+        if last_run is None:
+            # لم تُنفذ من قبل: أول نسخة بعد بدء التشغيل + التأخير
+            return self.started_at + jitter
+        wait = min(interval, RETRY_AFTER) if last_run.status == 'failed' else interval
+        return last_run.started_at + wait + jitter
+
+    def get_jobs(self):
+        """حالة كل نسخة مجدولة لعرضها في صفحة الإدارة"""
+        jobs = []
+        for backup_type, interval in self.get_schedule().items():
+            last_run = self._last_run(backup_type)
+            jobs.append({
+                'backup_type': backup_type,
+                'name': BACKUP_TYPE_NAMES[backup_type],
+                'interval': interval,
+                'last_run': last_run,
+                'next_run_at': self.due_at(backup_type, interval, last_run),
+            })
+        return jobs
+
+    def get_history(self, limit=20):
+        return db.session.execute(
+            select(BackupRun).order_by(BackupRun.started_at.desc(), BackupRun.id.desc()).limit(limit)
+        ).scalars().all()
+
+    def _mark_abandoned_runs(self, manager):
+        """تشغيلات بقيت "قيد التنفيذ" لأن العملية توقفت قبل انتهائها"""
+        if manager.is_backup_running():
+            return
+        cutoff = datetime.utcnow() - timedelta(seconds=BACKUP_STALE_SECONDS)
+        abandoned = db.session.execute(
+            select(BackupRun).where(BackupRun.status == 'running', BackupRun.started_at < cutoff)
+        ).scalars().all()
+        for run in abandoned:
+            run.status = 'failed'
+            run.finished_at = datetime.utcnow()
+            run.message = 'انقطعت العملية قبل انتهاء النسخة'
+        if abandoned:
+            db.session.commit()
+
+    def run_pending(self, now=None):
+        """تنفيذ النسخ المستحقة؛ يُرجع قائمة (النوع، النتيجة)"""
+        now = now or datetime.utcnow()
+        manager = BackupManager(self.backup_dir)
+        self._mark_abandoned_runs(manager)
+
+        results = []
+        for job in self.get_jobs():
+            if job['next_run_at'] > now or manager.is_backup_running():
+                continue
+            logger.info('Running scheduled %s backup', job['backup_type'])
+            result = manager.run_backup(job['backup_type'], trigger='schedule', compress=True)
+            if not result.get('success'):
+                logger.warning('Scheduled %s backup failed: %s', job['backup_type'], result.get('error'))
+            results.append((job['backup_type'], result))
+        return results
+
+    def _acquire_leadership(self):
+        """محاولة أخذ قفل المجدول بدون انتظار؛ يبقى محجوزاً طوال عمر العملية"""
+        if self._lock_file is not None:
+            return True
+        os.makedirs(self.backup_dir, exist_ok=True)
+        lock_file = open(os.path.join(self.backup_dir, '.scheduler.lock'), 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        logger.info('Backup scheduler running in process %s', os.getpid())
+        return True
+
+    def _loop(self):
+        while True:
+            try:
+                if self._acquire_leadership():
+                    with app.app_context():
+                        self.run_pending()
+            except Exception:
+                logger.exception('Backup scheduler tick failed')
+            time.sleep(TICK_SECONDS)
+
+    def start(self):
+        """تشغيل خيط المجدول مرة واحدة لكل عملية (بعد fork أيضاً)"""
+        with self._start_lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._lock_file = None
+            self._thread_pid = os.getpid()
+            self._thread = threading.Thread(target=self._loop, name='backup-scheduler', daemon=True)
+            self._thread.start()
+
+
+backup_scheduler = BackupScheduler()
+
+
+@app.before_request
+def _start_backup_scheduler():
+    # يبدأ مع أول طلب في كل عملية حتى يعمل مع gunicorn (بعد fork) وخادم التطوير
+    if app.config.get('BACKUP_SCHEDULER_ENABLED') and not app.testing:
+        backup_scheduler.start()
+
+
+@app.cli.command('run-scheduled-backups')
+def run_scheduled_backups_command():
+    """Run any backups that are due now (for cron instead of the in-process scheduler)."""
+    for backup_type, result in backup_scheduler.run_pending():
+        status = 'ok' if result.get('success') else f'failed: {result.get("error")}'
+        print(f'{backup_type}: {status}')
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Insert and lookup cost of UUID4 vs ULID order numbers in a UNIQUE index.
+
+Creates one scratch SQLite database per scheme with the orders table from
+models.py, inserts orders in small transactions (like print_invoice does),
+then times unique-index lookups of random and of recent orders:
+
+    python benchmarks/order_number_keys.py --orders 200000 --cache-kib 2048
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import bindparam, create_engine, event, insert, select, text
+
+from ulid_codec import new_ulid
+
+SCHEMES = {
+    'uuid4': lambda: str(uuid.uuid4()),
+    'ulid': new_ulid,
+}
+
+
+def index_size(conn):
+    """Bytes used by the order_number index (dbstat when compiled in, else None)"""
+    try:
+        return conn.execute(text(
+            "SELECT SUM(pgsize) FROM dbstat WHERE name LIKE 'sqlite_autoindex_orders%'"
+        )).scalar()
+    except Exception:
+        return None
+
+
+def run(scheme, orders, batch, lookups, cache_kib):
+    from models import Order
+
+    generate = SCHEMES[scheme]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        engine = create_engine(f'sqlite:///{path}')
+
+        def configure(dbapi_connection, record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
+            # a page cache smaller than the index, as on a long-running shop database
+            cursor.execute(f'PRAGMA cache_size=-{cache_kib}')
+            cursor.close()
+
+        event.listen(engine, 'connect', configure)
+        Order.__table__.create(engine)
+
+        numbers = []
+        started = time.perf_counter()
+        with engine.connect() as conn:
+            for start in range(0, orders, batch):
+                rows = [{'order_number': generate(), 'total_cost': 10.0, 'status': 'new',
+                         'created_at': datetime.utcnow()}
+                        for _ in range(min(batch, orders - start))]
+                with conn.begin():
+                    conn.execute(insert(Order.__table__), rows)
+                numbers.extend(row['order_number'] for row in rows)
+        insert_seconds = time.perf_counter() - started
+
+        rng = random.Random(11)
+        recent = numbers[-max(1, orders // 20):]
+        timings = {'random': [], 'recent': []}
+        with engine.connect() as conn:
+            lookup = select(Order.__table__.c.id).where(Order.__table__.c.order_number == bindparam('n'))
+            for kind, pool in (('random', numbers), ('recent', recent)):
+                for _ in range(lookups):
+                    number = rng.choice(pool)
+                    started = time.perf_counter()
+                    conn.execute(lookup, {'n': number}).scalar()
+                    timings[kind].append((time.perf_counter() - started) * 1e6)
+            size = index_size(conn)
+            conn.execute(text('PRAGMA wal_checkpoint(TRUNCATE)'))
+        engine.dispose()
+        return {
+            'key_chars': len(numbers[0]),
+            'inserts_per_s': orders / insert_seconds,
+            'index_kib': size / 1024 if size else None,
+            'file_kib': os.path.getsize(path) / 1024,
+            'random_us': statistics.median(timings['random']),
+            'recent_us': statistics.median(timings['recent']),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=200000)
+    parser.add_argument('--batch', type=int, default=20, help='orders per transaction')
+    parser.add_argument('--lookups', type=int, default=20000)
+    parser.add_argument('--cache-kib', type=int, default=2048)
+    args = parser.parse_args()
+
+    print(f'{args.orders} orders, {args.batch} per transaction, page cache {args.cache_kib} KiB')
+    print(f'{"scheme":<8} {"chars":>5} {"inserts/s":>10} {"index KiB":>10} {"file KiB":>9} '
+          f'{"random us":>10} {"recent us":>10}')
+    for scheme in SCHEMES:
+        result = run(scheme, args.orders, args.batch, args.lookups, args.cache_kib)
+        index_kib = f'{result["index_kib"]:.0f}' if result['index_kib'] else 'n/a'
+        print(f'{scheme:<8} {result["key_chars"]:>5} {result["inserts_per_s"]:>10.0f} {index_kib:>10} '
+              f'{result["file_kib"]:>9.0f} {result["random_us"]:>10.1f} {result["recent_us"]:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
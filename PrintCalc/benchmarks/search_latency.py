@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Catalog search latency on a synthetic catalog of many books.
+
+Builds the in-memory index from a fabricated catalog snapshot (no database
+needed) and times a mix of exact, prefix, fuzzy and multi-word queries:
+
+    python benchmarks/search_latency.py --books 30000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog_cache import CatalogSnapshot
+from catalog_search import SearchIndex
+
+YEARS = ['الصف الأول الابتدائي', 'الصف الثاني الابتدائي', 'الصف الثالث الابتدائي',
+         'الصف الرابع الابتدائي', 'الصف الخامس الابتدائي', 'الصف السادس الابتدائي',
+         'الصف الأول الإعدادي', 'الصف الثاني الإعدادي', 'الصف الثالث الإعدادي',
+         'الصف الأول الثانوي', 'الصف الثاني الثانوي', 'الصف الثالث الثانوي']
+SUBJECTS = ['اللغة العربية', 'الرياضيات', 'العلوم', 'الدراسات الاجتماعية', 'اللغة الإنجليزية',
+            'الفيزياء', 'الكيمياء', 'الأحياء', 'التاريخ', 'الجغرافيا', 'الفلسفة', 'علم النفس']
+SERIES = ['سلاح التلميذ', 'الأضواء', 'المعاصر', 'الامتحان', 'بيان', 'الوسام', 'نيوتن',
+          'المرشد', 'الشامل', 'التفوق', 'القمة', 'الإمام', 'جيم', 'كيان', 'المتميز']
+PARTS = ['الترم الأول', 'الترم الثاني', 'مراجعة نهائية', 'كراسة التدريبات', 'بنك الأسئلة', 'شرح']
+
+QUERIES = ['رياضيات', 'الرياضيات', 'رياض', 'سلاح التلميذ علوم', 'الاضواء كيمياء',
+           'الكيمبا', 'فيزيا', 'مراجعه نهائيه', 'الصف الثالث الثانوي فيزياء', 'بنك', 'نيوتن',
+           'اللغه العربيه الترم الثاني', 'تاريخ', 'جغرافيا الامام', 'ق']
+
+
+def make_snapshot(books):
+    rng = random.Random(7)
+    years = []
+    book_id = subject_id = 0
+    per_subject = max(1, books // (len(YEARS) * len(SUBJECTS)))
+    for year_id, year_name in enumerate(YEARS, start=1):
+        year = {'id': year_id, 'name': year_name, 'description': '', 'subjects': [], 'books': []}
+        for subject_name in SUBJECTS:
+            subject_id += 1
+            subject = {'id': subject_id, 'name': subject_name, 'year_id': year_id,
+                       'year_name': year_name, 'books': []}
+            for _ in range(per_subject):
+                book_id += 1
+                subject['books'].append({
+                    'id': book_id,
+                    'name': f'{rng.choice(SERIES)} {subject_name} {rng.choice(PARTS)} {book_id}',
+                    'page_count': rng.randint(40, 400), 'description': '',
+                    'subject_id': subject_id, 'subject_name': subject_name,
+                    'year_id': year_id, 'year_name': year_name,
+                })
+            year['subjects'].append(subject)
+            year['books'].extend(subject['books'])
+        years.append(year)
+    return CatalogSnapshot(1, years)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--books', type=int, default=30000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    snapshot = make_snapshot(args.books)
+    started = time.perf_counter()
+    index = SearchIndex(snapshot)
+    build_ms = (time.perf_counter() - started) * 1000
+    print(f'{len(index.books)} books, {len(index.terms)} terms, index built in {build_ms:.0f} ms')
+
+    print(f'{"query":<32} {"hits":>6} {"median ms":>10} {"max ms":>8}')
+    for query in QUERIES:
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            results = index.search(query)
+            timings.append((time.perf_counter() - started) * 1000)
+        print(f'{query:<32} {len(results):>6} {statistics.median(timings):>10.2f} {max(timings):>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Order-insert throughput with several concurrent writer processes.
+
+Compares the legacy engine settings (no PRAGMAs) with an SQLite profile
+from sqlite_profile.py on a scratch copy of the schema:
+
+    python benchmarks/sqlite_writers.py --writers 4 --orders 500
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.exc import OperationalError
+
+from sqlite_profile import get_sqlite_pragmas, sqlite_engine_options, register_sqlite_pragmas
+
+
+def make_engine(path, profile):
+    pragmas = get_sqlite_pragmas(profile)
+    engine = create_engine(f'sqlite:///{path}', **sqlite_engine_options(pragmas))
+    register_sqlite_pragmas(engine, pragmas)
+    return engine
+
+
+def writer(path, profile, orders, items_per_order, results):
+    from models import Order, OrderItem
+
+    engine = make_engine(path, profile)
+    done = 0
+    locked = 0
+    try:
+        for _ in range(orders):
+            try:
+                with engine.begin() as conn:
+                    order_id = conn.execute(insert(Order.__table__).values(
+                        order_number=str(uuid.uuid4()),
+                        customer_name='benchmark',
+                        total_cost=10.0,
+                        status='new',
+                        created_at=datetime.utcnow()
+                    )).inserted_primary_key[0]
+                    conn.execute(insert(OrderItem.__table__), [
+                        {'order_id': order_id, 'book_id': 1, 'quantity': 1, 'unit_cost': 5.0, 'total_cost': 5.0}
+                        for _ in range(items_per_order)
+                    ])
+                done += 1
+            except OperationalError:
+                # "database is locked" after the busy timeout
+                locked += 1
+    finally:
+        engine.dispose()
+        results.put((done, locked))
+
+
+def run(profile, writers, orders, items_per_order):
+    from app import db
+    from models import AcademicYear, Subject, Book
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        engine = make_engine(path, profile)
+        db.metadata.create_all(engine)
+        # one book for the order items to reference (foreign_keys=ON in production)
+        with engine.begin() as conn:
+            conn.execute(insert(AcademicYear.__table__).values(id=1, name='benchmark'))
+            conn.execute(insert(Subject.__table__).values(id=1, name='benchmark', year_id=1))
+            conn.execute(insert(Book.__table__).values(id=1, name='benchmark', page_count=100, subject_id=1))
+        engine.dispose()
+
+        # spawn, not fork: SQLite state must not be inherited from this process
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        processes = [
+            context.Process(target=writer, args=(path, profile, orders, items_per_order, results))
+            for _ in range(writers)
+        ]
+        start = time.perf_counter()
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start
+
+        done = locked = 0
+        for _ in processes:
+            d, l = results.get()
+            done += d
+            locked += l
+    return done, locked, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--orders', type=int, default=300, help='orders per writer')
+    parser.add_argument('--items', type=int, default=3, help='order items per order')
+    parser.add_argument('--profiles', default='legacy,production')
+    args = parser.parse_args()
+
+    print(f'{args.writers} writers x {args.orders} orders ({args.items} items each)')
+    for profile in args.profiles.split(','):
+        done, locked, elapsed = run(profile, args.writers, args.orders, args.items)
+        print(f'{profile:>12}: {done / elapsed:8.1f} orders/s  '
+              f'{done} committed  {locked} "database is locked"  {elapsed:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+import json
+import secrets
+from datetime import datetime, timedelta
+from flask import session, g
+from sqlalchemy import delete, select, func
+from app import db
+from models import CartSession
+
+# مدة صلاحية السلة منذ آخر تعديل
+CART_TTL = timedelta(hours=12)
+# الحد الأقصى لعدد السلال المخزنة؛ تُحذف الأقدم عند تجاوزه
+MAX_CARTS = 5000
+# الحد الأقصى لحجم السلة والحساب الأخير لكل جلسة (بالبايت)
+MAX_CART_BYTES = 256 * 1024
+
+
+class CartTooLargeError(ValueError):
+    """السلة تجاوزت الحجم المسموح به"""
+    pass
+
+
+class CartStore:
+    """تخزين السلة وآخر حساب في قاعدة البيانات بدلاً من كوكي الجلسة
+
+    الكوكي يحمل فقط رمزاً قصيراً، والبيانات مشتركة بين كل عمليات gunicorn.
+    لا تقوم الدوال بالحفظ النهائي؛ المسار المستدعي هو من ينفذ db.session.commit().
+    """
+
+    def _token(self, create=False):
+        token = session.get('cart_token')
+        if token is None and create:
+            token = secrets.token_urlsafe(12)
+            session['cart_token'] = token
+        return token
+
+    def _load(self):
+        """تحميل سجل الجلسة مرة واحدة لكل طلب"""
+        if 'cart_entry' in g:
+            return g.cart_entry
+
+        entry = None
+        token = self._token()
+        if token:
+            entry = db.session.get(CartSession, token)
+            if entry is not None and entry.updated_at < datetime.utcnow() - CART_TTL:
+                db.session.delete(entry)
+                entry = None
+
+        # نقل السلال القديمة المخزنة في الكوكي إلى الخادم
+        legacy_cart = session.pop('cart', None)
+        session.pop('last_calculation', None)
+        g.cart_entry = entry
+        if legacy_cart and entry is None:
+            self.save_cart(legacy_cart)
+            db.session.commit()
+        return g.cart_entry
+
+    def get_cart(self):
+        entry = self._load()
+        if entry is None or not entry.cart:
+            return []
+        return json.loads(entry.cart)
+
+    def get_calculation(self):
+        entry = self._load()
+        if entry is None or not entry.calculation:
+            return None
+        return json.loads(entry.calculation)
+
+    def _entry_for_write(self):
+        entry = self._load()
+        if entry is None:
+            self.evict()
+            entry = CartSession(token=self._token(create=True))
+            db.session.add(entry)
+            g.cart_entry = entry
+        entry.updated_at = datetime.utcnow()
+        return entry
+
+    @staticmethod
+    def _dumps(value):
+        data = json.dumps(value, ensure_ascii=False)
+        if len(data.encode('utf-8')) > MAX_CART_BYTES:
+            raise CartTooLargeError('السلة كبيرة جداً، يرجى تقسيم الطلب')
+        return data
+
+    def save_cart(self, cart):
+        """حفظ السلة وإلغاء الحساب الأخير لأنه لم يعد مطابقاً لها"""
+        entry = self._entry_for_write()
+        entry.cart = self._dumps(cart)
+        entry.calculation = None
+
+    def save_calculation(self, calculation):
+        entry = self._entry_for_write()
+        entry.calculation = self._dumps(calculation)
+
+    def clear(self):
+        """حذف السلة والحساب بعد إتمام الطلب"""
+        entry = self._load()
+        if entry is not None:
+            db.session.delete(entry)
+        g.cart_entry = None
+
+    def evict(self):
+        """حذف السلال المنتهية ثم الأقدم إذا تجاوز العدد الحد الأقصى"""
+        cutoff = datetime.utcnow() - CART_TTL
+        db.session.execute(delete(CartSession).where(CartSession.updated_at < cutoff))
+
+        count = db.session.execute(select(func.count()).select_from(CartSession)).scalar()
+        overflow = count - MAX_CARTS + 1
+        if overflow > 0:
+            oldest = select(CartSession.token).order_by(CartSession.updated_at).limit(overflow)
+            db.session.execute(delete(CartSession).where(CartSession.token.in_(oldest)))
+
+
+cart_store = CartStore()
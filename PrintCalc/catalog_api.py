@@ -0,0 +1,139 @@
+import bisect
+import hashlib
+import threading
+from pagination import encode_cursor, decode_cursor
+from catalog_cache import CATALOG, SETTINGS
+from pricing import pricing_engine
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+class CatalogApiError(Exception):
+    """معاملات غير صالحة في طلب واجهة الكتالوج"""
+    pass
+
+
+def _years(catalog, tables):
+    return [{'id': year['id'], 'name': year['name'], 'description': year['description']}
+            for year in catalog.years]
+
+
+def _subjects(catalog, tables):
+    return [{'id': subject['id'], 'name': subject['name'],
+             'year_id': subject['year_id'], 'year_name': subject['year_name']}
+            for year in catalog.years for subject in year['subjects']]
+
+
+def _books(catalog, tables):
+    return list(catalog.books_by_id.values())
+
+
+def _printing_prices(catalog, tables):
+    return list(tables.printing_prices.values())
+
+
+def _addons(catalog, tables):
+    return list(tables.addons.values())
+
+
+# المورد ← (ذاكرة الإصدار التي يتبعها, دالة الصفوف, الحقول, المرشحات المسموحة)
+CATALOG_RESOURCES = {
+    'years': (CATALOG, _years, ('id', 'name', 'description'), ()),
+    'subjects': (CATALOG, _subjects, ('id', 'name', 'year_id', 'year_name'), ('year_id',)),
+    'books': (CATALOG, _books,
+              ('id', 'name', 'page_count', 'description', 'subject_id', 'subject_name', 'year_id', 'year_name'),
+              ('subject_id', 'year_id')),
+    'printing_prices': (SETTINGS, _printing_prices,
+                        ('id', 'name', 'price_per_unit', 'pages_per_unit', 'description'), ()),
+    'addons': (SETTINGS, _addons, ('id', 'name', 'price', 'description'), ()),
+}
+
+
+def parse_catalog_params(resource, args):
+    """قراءة cursor و limit و fields والمرشحات من معاملات الرابط والتحقق منها"""
+    _, _, fields, filters = CATALOG_RESOURCES[resource]
+
+    cursor = args.get('cursor') or None
+    after_id = None
+    if cursor:
+        key = decode_cursor(cursor, [int])
+        if key is None:
+            raise CatalogApiError('مؤشر الصفحة غير صالح')
+        after_id = key[0]
+
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise CatalogApiError('limit يجب أن يكون رقماً')
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    selected = fields
+    if args.get('fields'):
+        requested = [name.strip() for name in args['fields'].split(',') if name.strip()]
+        unknown = [name for name in requested if name not in fields]
+        if unknown:
+            raise CatalogApiError(f'حقول غير معروفة: {", ".join(unknown)}')
+        # المعرف يُرجع دائماً (يُبنى عليه المؤشر)
+        selected = tuple(name for name in fields if name == 'id' or name in requested)
+
+    where = {}
+    for name in filters:
+        if args.get(name):
+            try:
+                where[name] = int(args[name])
+            except ValueError:
+                raise CatalogApiError(f'{name} يجب أن يكون رقماً')
+
+    return {'after_id': after_id, 'cursor': cursor, 'limit': limit, 'fields': selected, 'where': where}
+
+
+def catalog_etag(resource, version, params):
+    """ETag يتغير فقط مع إصدار الكتالوج/الإعدادات أو معاملات الطلب"""
+    where = ','.join(f'{name}={value}' for name, value in sorted(params['where'].items()))
+    key = f"{resource}|{version}|{params['cursor']}|{params['limit']}|{','.join(params['fields'])}|{where}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+class CatalogApi:
+    """صفحات الموارد من اللقطات الموجودة في الذاكرة، مرتبة بالمعرف مرة واحدة لكل إصدار"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sorted = {}
+
+    def _rows(self, resource):
+        cache_name, build, _, _ = CATALOG_RESOURCES[resource]
+        tables = pricing_engine.get_tables()
+        version = tables.version[0] if cache_name == CATALOG else tables.version[1]
+        cached = self._sorted.get(resource)
+        if cached is not None and cached[0] == version:
+            return cached
+        with self._lock:
+            rows = sorted(build(tables.catalog, tables), key=lambda row: row['id'])
+            cached = (version, rows, [row['id'] for row in rows])
+            self._sorted[resource] = cached
+            return cached
+
+    def page(self, resource, params):
+        version, rows, ids = self._rows(resource)
+        start = bisect.bisect_right(ids, params['after_id']) if params['after_id'] is not None else 0
+        where = params['where']
+        items = []
+        has_next = False
+        for row in rows[start:]:
+            if any(row[name] != value for name, value in where.items()):
+                continue
+            if len(items) == params['limit']:
+                has_next = True
+                break
+            items.append({name: row[name] for name in params['fields']})
+        return {
+            'resource': resource,
+            'version': version,
+            'items': items,
+            'next_cursor': encode_cursor([items[-1]['id']]) if has_next else None,
+        }
+
+
+catalog_api = CatalogApi()
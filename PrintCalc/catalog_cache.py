@@ -0,0 +1,163 @@
+import logging
+import threading
+from sqlalchemy import select, update
+from app import db
+from models import AcademicYear, Subject, Book, CacheVersion
+
+logger = logging.getLogger(__name__)
+
+CATALOG = 'catalog'
+SETTINGS = 'settings'
+
+
+def get_cache_version(name):
+    """قراءة رقم الإصدار الحالي لذاكرة مؤقتة معينة (0 إذا لم يُسجَّل بعد)"""
+    version = db.session.execute(
+        select(CacheVersion.version).where(CacheVersion.name == name)
+    ).scalar()
+    return version or 0
+
+
+def bump_cache_version(name):
+    """زيادة رقم الإصدار داخل نفس المعاملة قبل الحفظ حتى تُبطل كل العمليات نسختها المحلية"""
+    result = db.session.execute(
+        update(CacheVersion)
+        .where(CacheVersion.name == name)
+        .values(version=CacheVersion.version + 1)
+    )
+    if result.rowcount == 0:
+        db.session.add(CacheVersion(name=name, version=1))
+
+
+class CatalogSnapshot:
+    """لقطة للقراءة فقط من شجرة الكتالوج النشط (سنة ← مادة ← كتاب)"""
+
+    def __init__(self, version, years):
+        self.version = version
+        self.years = years
+        self.books_by_id = {}
+        for year in years:
+            for subject in year['subjects']:
+                for book in subject['books']:
+                    self.books_by_id[book['id']] = book
+
+    def book(self, book_id):
+        """الحصول على كتاب نشط بالمعرف أو None"""
+        return self.books_by_id.get(book_id)
+
+    def years_with_books(self):
+        """السنوات التي تحتوي على كتب نشطة مع قائمة مسطحة بكتبها"""
+        return [
+            {'year': year, 'books': year['books']}
+            for year in self.years if year['books']
+        ]
+
+
+class CatalogCache:
+    """ذاكرة مؤقتة داخل العملية للقطة الكتالوج يتم إبطالها برقم الإصدار"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self.stats = {'hits': 0, 'misses': 0, 'rebuilds': 0}
+
+    def get(self):
+        """إرجاع اللقطة الحالية وإعادة بنائها فقط إذا تغيّر إصدار الكتالوج"""
+        version = get_cache_version(CATALOG)
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version:
+            with self._lock:
+                self.stats['hits'] += 1
+            return snapshot
+
+        with self._lock:
+            self.stats['misses'] += 1
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.version != version:
+                snapshot = self._build(version)
+                self._snapshot = snapshot
+                self.stats['rebuilds'] += 1
+                logger.info('Rebuilt catalog snapshot v%s (%d books)', version, len(snapshot.books_by_id))
+            return snapshot
+
+    def clear(self):
+        """حذف اللقطة المحلية لإجبار إعادة البناء عند القراءة التالية"""
+        with self._lock:
+            self._snapshot = None
+
+    def get_stats(self):
+        """إحصائيات الإصابة والإخفاق وإعادة البناء"""
+        with self._lock:
+            stats = dict(self.stats)
+        snapshot = self._snapshot
+        stats['version'] = snapshot.version if snapshot else None
+        stats['books'] = len(snapshot.books_by_id) if snapshot else 0
+        return stats
+
+    def _build(self, version):
+        """بناء الشجرة بثلاث استعلامات فقط بدلاً من استعلام لكل سنة ومادة"""
+        years = db.session.execute(
+            select(AcademicYear.id, AcademicYear.name, AcademicYear.description)
+            .where(AcademicYear.is_active == True)
+            .order_by(AcademicYear.id)
+        ).all()
+        subjects = db.session.execute(
+            select(Subject.id, Subject.name, Subject.year_id)
+            .where(Subject.is_active == True)
+            .order_by(Subject.id)
+        ).all()
+        books = db.session.execute(
+            select(Book.id, Book.name, Book.page_count, Book.description, Book.subject_id)
+            .where(Book.is_active == True)
+            .order_by(Book.id)
+        ).all()
+
+        years_by_id = {}
+        for row in years:
+            years_by_id[row.id] = {
+                'id': row.id,
+                'name': row.name,
+                'description': row.description,
+                'subjects': [],
+                'books': []
+            }
+
+        subjects_by_id = {}
+        for row in subjects:
+            year = years_by_id.get(row.year_id)
+            if year is None:
+                continue
+            subject = {
+                'id': row.id,
+                'name': row.name,
+                'year_id': row.year_id,
+                'year_name': year['name'],
+                'books': []
+            }
+            subjects_by_id[row.id] = subject
+            year['subjects'].append(subject)
+
+        for row in books:
+            subject = subjects_by_id.get(row.subject_id)
+            if subject is None:
+                continue
+            book = {
+                'id': row.id,
+                'name': row.name,
+                'page_count': row.page_count,
+                'description': row.description,
+                'subject_id': subject['id'],
+                'subject_name': subject['name'],
+                'year_id': subject['year_id'],
+                'year_name': subject['year_name']
+            }
+            subject['books'].append(book)
+
+        # ترتيب كتب السنة حسب المادة كما كانت تُعرض سابقاً
+        for year in years_by_id.values():
+            year['books'] = [book for subject in year['subjects'] for book in subject['books']]
+
+        return CatalogSnapshot(version, list(years_by_id.values()))
+
+
+catalog_cache = CatalogCache()
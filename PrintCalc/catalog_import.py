@@ -0,0 +1,321 @@
+import csv
+import io
+import json
+import os
+import secrets
+import tempfile
+import time
+import click
+from openpyxl import load_workbook
+from sqlalchemy import select, insert, update
+from app import app, db
+from models import AcademicYear, Subject, Book
+from catalog_cache import bump_cache_version, CATALOG
+from counters import adjust_counter
+
+# أعمدة ملف الاستيراد (الأسماء الإنجليزية أو العربية في صف العناوين)
+IMPORT_COLUMNS = {
+    'year': ('year', 'السنة', 'السنة الدراسية'),
+    'subject': ('subject', 'المادة', 'المادة الدراسية'),
+    'book': ('book', 'الكتاب', 'اسم الكتاب'),
+    'page_count': ('page_count', 'pages', 'عدد الصفحات'),
+    'description': ('description', 'الوصف'),
+}
+REQUIRED_COLUMNS = ('year', 'subject')
+
+MAX_IMPORT_ROWS = 20000
+# ملفات المعاينة تنتظر التأكيد لمدة محدودة فقط
+PENDING_IMPORT_TTL = 3600
+PENDING_IMPORT_DIR = os.path.join(tempfile.gettempdir(), 'printcalc_imports')
+
+
+class CatalogImportError(Exception):
+    """ملف استيراد غير صالح (رسالة جاهزة للعرض)"""
+    pass
+
+
+def _clean(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return ' '.join(str(value).split())
+
+
+def _read_csv(data):
+    try:
+        text = data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise CatalogImportError('يجب حفظ ملف CSV بترميز UTF-8')
+    return list(csv.reader(io.StringIO(text)))
+
+
+def _read_xlsx(data):
+    try:
+        workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    except Exception:
+        raise CatalogImportError('تعذر قراءة ملف Excel')
+    try:
+        return [list(row) for row in workbook.worksheets[0].iter_rows(values_only=True)]
+    finally:
+        workbook.close()
+
+
+def read_import_file(filename, data):
+    """قراءة ملف CSV أو XLSX إلى قائمة صفوف: [(رقم السطر, {العمود: القيمة})]"""
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension == '.csv':
+        table = _read_csv(data)
+    elif extension == '.xlsx':
+        table = _read_xlsx(data)
+    else:
+        raise CatalogImportError('نوع الملف غير مدعوم، يرجى رفع ملف CSV أو XLSX')
+
+    if not table:
+        raise CatalogImportError('الملف فارغ')
+
+    aliases = {alias.lower(): column for column, names in IMPORT_COLUMNS.items() for alias in names}
+    positions = {}
+    for index, header in enumerate(table[0]):
+        column = aliases.get(_clean(header).lower())
+        if column and column not in positions:
+            positions[column] = index
+    missing = [IMPORT_COLUMNS[column][1] for column in REQUIRED_COLUMNS if column not in positions]
+    if missing:
+        raise CatalogImportError(f'أعمدة مطلوبة غير موجودة: {"، ".join(missing)}')
+
+    rows = []
+    for line, values in enumerate(table[1:], start=2):
+        row = {column: _clean(values[index]) if index < len(values) else ''
+               for column, index in positions.items()}
+        if any(row.values()):
+            rows.append((line, row))
+    if len(rows) > MAX_IMPORT_ROWS:
+        raise CatalogImportError(f'عدد الصفوف أكبر من الحد المسموح ({MAX_IMPORT_ROWS})')
+    return rows
+
+
+def _validate_rows(rows):
+    """التحقق من الصفوف؛ يُرجع (الصفوف الصالحة, الأخطاء)"""
+    valid = []
+    errors = []
+    seen = {}
+    for line, row in rows:
+        year, subject, book = row['year'], row['subject'], row.get('book', '')
+        if not year or not subject:
+            errors.append({'line': line, 'error': 'السنة والمادة مطلوبتان'})
+            continue
+        if len(year) > 100 or len(subject) > 100 or len(book) > 200:
+            errors.append({'line': line, 'error': 'الاسم أطول من المسموح'})
+            continue
+        page_count = None
+        if book:
+            try:
+                page_count = int(row.get('page_count', ''))
+            except ValueError:
+                page_count = 0
+            if page_count <= 0:
+                errors.append({'line': line, 'error': 'عدد الصفحات يجب أن يكون رقماً أكبر من صفر'})
+                continue
+        key = (year, subject, book)
+        if key in seen:
+            errors.append({'line': line, 'error': f'صف مكرر (نفس السطر {seen[key]})'})
+            continue
+        seen[key] = line
+        valid.append({'line': line, 'year': year, 'subject': subject, 'book': book,
+                      'page_count': page_count, 'description': row.get('description', '')})
+    return valid, errors
+
+
+def plan_import(rows):
+    """مقارنة الملف بالكتالوج الحالي (بدون أي كتابة): ما سيُضاف وما سيُحدّث وما لم يتغير
+
+    المطابقة بالاسم: السنة بالاسم، المادة بالاسم داخل السنة، والكتاب بالاسم داخل المادة.
+    """
+    valid, errors = _validate_rows(rows)
+
+    year_names = {row['year'] for row in valid}
+    years = dict(db.session.execute(
+        select(AcademicYear.name, AcademicYear.id).where(AcademicYear.name.in_(year_names))
+    ).all()) if year_names else {}
+
+    subjects = {}
+    if years:
+        for subject_id, year_id, name in db.session.execute(
+            select(Subject.id, Subject.year_id, Subject.name)
+            .where(Subject.year_id.in_(years.values()))
+            .order_by(Subject.id)
+        ):
+            subjects.setdefault((year_id, name), subject_id)
+
+    books = {}
+    if subjects:
+        for book in db.session.execute(
+            select(Book.id, Book.subject_id, Book.name, Book.page_count, Book.description)
+            .where(Book.subject_id.in_(subjects.values()))
+            .order_by(Book.id)
+        ):
+            books.setdefault((book.subject_id, book.name), book)
+
+    plan = {
+        'new_years': [],
+        'new_subjects': [],
+        'new_books': [],
+        'updated_books': [],
+        'unchanged': 0,
+        'errors': errors,
+        'rows': len(rows),
+    }
+    new_years = set()
+    new_subjects = set()
+    for row in valid:
+        year_id = years.get(row['year'])
+        if year_id is None and row['year'] not in new_years:
+            new_years.add(row['year'])
+            plan['new_years'].append(row['year'])
+
+        subject_id = subjects.get((year_id, row['subject'])) if year_id else None
+        subject_key = (row['year'], row['subject'])
+        if subject_id is None and subject_key not in new_subjects:
+            new_subjects.add(subject_key)
+            plan['new_subjects'].append({'year': row['year'], 'subject': row['subject']})
+
+        if not row['book']:
+            continue
+        existing = books.get((subject_id, row['book'])) if subject_id else None
+        if existing is None:
+            plan['new_books'].append({key: row[key] for key in
+                                      ('line', 'year', 'subject', 'book', 'page_count', 'description')})
+            continue
+        # الوصف الفارغ في الملف لا يمسح الوصف الحالي
+        description = row['description'] or existing.description
+        if existing.page_count == row['page_count'] and (existing.description or '') == (description or ''):
+            plan['unchanged'] += 1
+        else:
+            plan['updated_books'].append({
+                'id': existing.id, 'line': row['line'],
+                'year': row['year'], 'subject': row['subject'], 'book': row['book'],
+                'old_page_count': existing.page_count, 'page_count': row['page_count'],
+                'old_description': existing.description, 'description': description,
+            })
+    return plan
+
+
+def has_changes(plan):
+    return any(plan[key] for key in ('new_years', 'new_subjects', 'new_books', 'updated_books'))
+
+
+def apply_import(rows):
+    """تطبيق الاستيراد في معاملة واحدة بعمليات مجمّعة، مع تحديث الكاش مرة واحدة في النهاية
+
+    يُعاد حساب الخطة داخل المعاملة نفسها، فالنتيجة تعكس الكتالوج وقت التطبيق لا وقت المعاينة.
+    """
+    try:
+        plan = plan_import(rows)
+        if plan['errors']:
+            db.session.rollback()
+            return dict(plan, success=False, error='الملف يحتوي على أخطاء، يرجى تصحيحها أولاً')
+        if not has_changes(plan):
+            db.session.rollback()
+            return dict(plan, success=True)
+
+        if plan['new_years']:
+            db.session.execute(insert(AcademicYear), [
+                {'name': name, 'description': '', 'is_active': True} for name in plan['new_years']
+            ])
+        year_names = {item['year'] for item in plan['new_subjects']} | {item['year'] for item in plan['new_books']}
+        year_ids = dict(db.session.execute(
+            select(AcademicYear.name, AcademicYear.id).where(AcademicYear.name.in_(year_names))
+        ).all()) if year_names else {}
+
+        if plan['new_subjects']:
+            db.session.execute(insert(Subject), [
+                {'name': item['subject'], 'year_id': year_ids[item['year']], 'description': '', 'is_active': True}
+                for item in plan['new_subjects']
+            ])
+        subject_ids = {}
+        if plan['new_books']:
+            for subject_id, year_id, name in db.session.execute(
+                select(Subject.id, Subject.year_id, Subject.name)
+                .where(Subject.year_id.in_({year_ids[item['year']] for item in plan['new_books']}))
+                .order_by(Subject.id)
+            ):
+                subject_ids.setdefault((year_id, name), subject_id)
+            db.session.execute(insert(Book), [
+                {'name': item['book'], 'page_count': item['page_count'], 'description': item['description'],
+                 'is_active': True, 'subject_id': subject_ids[(year_ids[item['year']], item['subject'])]}
+                for item in plan['new_books']
+            ])
+        if plan['updated_books']:
+            # تحديث مجمّع بالمفتاح الأساسي (executemany واحد)
+            db.session.execute(update(Book), [
+                {'id': item['id'], 'page_count': item['page_count'], 'description': item['description']}
+                for item in plan['updated_books']
+            ])
+
+        adjust_counter('years', len(plan['new_years']))
+        adjust_counter('subjects', len(plan['new_subjects']))
+        adjust_counter('books', len(plan['new_books']))
+        bump_cache_version(CATALOG)
+        db.session.commit()
+        return dict(plan, success=True)
+    except Exception as e:
+        db.session.rollback()
+        return dict(success=False, error=str(e))
+
+
+def save_pending_import(rows):
+    """حفظ صفوف المعاينة حتى يؤكدها المستخدم؛ يُرجع رمزاً يُحفظ في الجلسة"""
+    os.makedirs(PENDING_IMPORT_DIR, exist_ok=True)
+    now = time.time()
+    for filename in os.listdir(PENDING_IMPORT_DIR):
+        path = os.path.join(PENDING_IMPORT_DIR, filename)
+        try:
+            if now - os.path.getmtime(path) > PENDING_IMPORT_TTL:
+                os.remove(path)
+        except OSError:
+            pass
+    token = secrets.token_hex(16)
+    with open(os.path.join(PENDING_IMPORT_DIR, f'{token}.json'), 'w', encoding='utf-8') as f:
+        json.dump(rows, f, ensure_ascii=False)
+    return token
+
+
+def load_pending_import(token):
+    """قراءة صفوف معاينة محفوظة وحذفها (تُستخدم مرة واحدة)؛ None إذا انتهت صلاحيتها"""
+    if not token or not all(c in '0123456789abcdef' for c in token):
+        return None
+    path = os.path.join(PENDING_IMPORT_DIR, f'{token}.json')
+    try:
+        if time.time() - os.path.getmtime(path) > PENDING_IMPORT_TTL:
+            os.remove(path)
+            return None
+        with open(path, encoding='utf-8') as f:
+            rows = [(line, row) for line, row in json.load(f)]
+        os.remove(path)
+        return rows
+    except (OSError, ValueError):
+        return None
+
+
+@app.cli.command('import-catalog')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--apply', 'apply_changes', is_flag=True, help='Write the changes (default is a dry run).')
+def import_catalog_command(path, apply_changes):
+    """Import years, subjects and books from a CSV/XLSX file (dry run unless --apply)."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    try:
+        rows = read_import_file(path, data)
+    except CatalogImportError as e:
+        raise click.ClickException(str(e))
+    plan = apply_import(rows) if apply_changes else plan_import(rows)
+    for error in plan.get('errors', []):
+        print(f"line {error['line']}: {error['error']}")
+    if plan.get('success') is False:
+        raise click.ClickException(plan['error'])
+    print(f"new years: {len(plan['new_years'])}, new subjects: {len(plan['new_subjects'])}, "
+          f"new books: {len(plan['new_books'])}, updated books: {len(plan['updated_books'])}, "
+          f"unchanged: {plan['unchanged']}")
+    if not apply_changes:
+        print('Dry run: nothing was written (use --apply).')
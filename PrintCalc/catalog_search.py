@@ -0,0 +1,171 @@
+import bisect
+import heapq
+import re
+import threading
+from catalog_cache import catalog_cache
+
+# التشكيل وعلامات القرآن والتطويل
+_DIACRITICS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+_FOLD = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ئ': 'ي', 'ة': 'ه', 'ؤ': 'و',
+    '٠': '0', '١': '1', '٢': '2', '٣': '3', '٤': '4',
+    '٥': '5', '٦': '6', '٧': '7', '٨': '8', '٩': '9',
+})
+_TOKEN = re.compile(r'\w+')
+
+# وزن الحقل × وزن نوع المطابقة = نقاط الكتاب لكل كلمة في البحث
+FIELD_WEIGHTS = {'name': 3, 'subject_name': 2, 'year_name': 1}
+MATCH_WEIGHTS = {'exact': 3, 'prefix': 2, 'fuzzy': 1}
+# أقصر كلمة تُقبل فيها مطابقة تقريبية (حرف واحد مختلف/زائد/ناقص)
+FUZZY_MIN_LENGTH = 3
+# حد لعدد الكلمات المطابقة لبادئة قصيرة جداً (حرف أو حرفان)
+MAX_PREFIX_TERMS = 500
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+def normalize_arabic(text):
+    """توحيد الكتابة للبحث: إزالة التشكيل وتوحيد الألف والياء والتاء المربوطة والأرقام"""
+    return _DIACRITICS.sub('', text or '').translate(_FOLD).lower()
+
+
+def _strip_article(token):
+    return token[2:] if token.startswith('ال') and len(token) > 3 else token
+
+
+def tokenize(text):
+    """كلمات النص بعد التوحيد وحذف "ال" التعريف (الرياضيات = رياضيات)"""
+    return [_strip_article(token) for token in _TOKEN.findall(normalize_arabic(text))]
+
+
+def _deletions(term):
+    """كل صيغ الكلمة بحذف حرف واحد (للمطابقة التقريبية بمسافة تحرير 1)"""
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+class SearchIndex:
+    """فهرس مقلوب للكتب النشطة في لقطة كتالوج واحدة (للقراءة فقط)"""
+
+    def __init__(self, snapshot):
+        self.version = snapshot.version
+        self.books = list(snapshot.books_by_id.values())
+        # كلمة ← {رقم الكتاب في self.books: أعلى وزن حقل}
+        self.postings = {}
+        for position, book in enumerate(self.books):
+            for field, weight in FIELD_WEIGHTS.items():
+                for token in tokenize(book[field]):
+                    entry = self.postings.setdefault(token, {})
+                    if entry.get(position, 0) < weight:
+                        entry[position] = weight
+        self.terms = sorted(self.postings)
+        self.deletions = {}
+        for term in self.terms:
+            # الأرقام (مثل رقم الطبعة) تُطابق كما هي فقط
+            if len(term) >= FUZZY_MIN_LENGTH and not term.isdigit():
+                for variant in _deletions(term) | {term}:
+                    self.deletions.setdefault(variant, set()).add(term)
+
+    def _prefix_terms(self, token, matches):
+        start = bisect.bisect_left(self.terms, token)
+        for term in self.terms[start:start + MAX_PREFIX_TERMS]:
+            if not term.startswith(token):
+                break
+            matches.setdefault(term, 'exact' if term == token else 'prefix')
+
+    def _fuzzy_terms(self, token, matches):
+        if len(token) >= FUZZY_MIN_LENGTH and not token.isdigit():
+            for variant in _deletions(token) | {token}:
+                for term in self.deletions.get(variant, ()):
+                    matches.setdefault(term, 'fuzzy')
+
+    def _matching_terms(self, token):
+        """الكلمات المفهرسة المطابقة لكلمة البحث: {الكلمة: نوع المطابقة}
+
+        المطابقة التقريبية احتياطية فقط: تُستخدم إذا لم تطابق الكلمة أي كلمة ولا بادئة.
+        """
+        variants = [_strip_article(token)]
+        # "ال" + حرف أثناء الكتابة: قد تكون بداية كلمة معرّفة أو كلمة تبدأ بـ "ال"
+        if token.startswith('ال') and len(token) == 3:
+            variants.append(token[2:])
+        matches = {}
+        for variant in variants:
+            self._prefix_terms(variant, matches)
+        if not matches:
+            for variant in variants:
+                self._fuzzy_terms(variant, matches)
+        return matches
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """الكتب التي تطابق كل كلمات البحث، الأعلى نقاطاً أولاً"""
+        tokens = list(dict.fromkeys(_TOKEN.findall(normalize_arabic(query))))
+        if not tokens:
+            return []
+
+        # أندر كلمة أولاً: الكلمات الشائعة (مثل "الصف") تُفحص فقط على الكتب المتبقية
+        token_matches = []
+        for token in tokens:
+            matches = self._matching_terms(token)
+            size = sum(len(self.postings[term]) for term in matches)
+            token_matches.append((size, matches))
+        token_matches.sort(key=lambda item: item[0])
+
+        scores = None
+        for size, matches in token_matches:
+            weighted = [(MATCH_WEIGHTS[kind], self.postings[term]) for term, kind in matches.items()]
+            if scores is not None and len(scores) * len(weighted) < size:
+                # قلة من الكتب المتبقية: فحصها مباشرة أرخص من المرور على كل قوائم الكلمة
+                narrowed = {}
+                for position, total in scores.items():
+                    best = 0
+                    for match_weight, postings in weighted:
+                        field_weight = postings.get(position)
+                        if field_weight and match_weight * field_weight > best:
+                            best = match_weight * field_weight
+                    if best:
+                        narrowed[position] = total + best
+                scores = narrowed
+            else:
+                token_scores = {}
+                for match_weight, postings in weighted:
+                    for position, field_weight in postings.items():
+                        score = match_weight * field_weight
+                        if token_scores.get(position, 0) < score:
+                            token_scores[position] = score
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {position: total + token_scores[position]
+                              for position, total in scores.items() if position in token_scores}
+            if not scores:
+                return []
+
+        ranked = heapq.nsmallest(limit, scores.items(),
+                                 key=lambda item: (-item[1], self.books[item[0]]['name']))
+        return [dict(self.books[position], score=score) for position, score in ranked]
+
+
+class CatalogSearch:
+    """فهرس البحث داخل العملية؛ يُعاد بناؤه عندما يتغير إصدار لقطة الكتالوج"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+
+    def get_index(self):
+        snapshot = catalog_cache.get()
+        index = self._index
+        if index is not None and index.version == snapshot.version:
+            return index
+        with self._lock:
+            index = self._index
+            if index is None or index.version != snapshot.version:
+                index = SearchIndex(snapshot)
+                self._index = index
+            return index
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        return self.get_index().search(query, max(1, min(limit, MAX_LIMIT)))
+
+
+catalog_search = CatalogSearch()
@@ -0,0 +1,103 @@
+import logging
+from sqlalchemy import select, update, delete, func
+from app import app, db
+from models import AcademicYear, Subject, Book, Employee, Order, Counter
+
+logger = logging.getLogger(__name__)
+
+ORDER_STATUSES = ('new', 'in_progress', 'completed')
+
+# كل العدادات المعروضة على لوحات التحكم
+COUNTER_NAMES = (
+    'orders_total',
+    'orders_new',
+    'orders_in_progress',
+    'orders_completed',
+    'employees_total',
+    'employees_active',
+    'years',
+    'subjects',
+    'books',
+)
+
+
+def order_status_counter(status):
+    """اسم عداد الطلبات لحالة معينة"""
+    return f'orders_{status}'
+
+
+def adjust_counter(name, delta):
+    """تعديل عداد داخل نفس المعاملة الحالية (يُحفظ مع commit المسار)
+
+    إذا لم يكن العداد موجوداً يتم تجاهل التعديل، وسيُعاد حسابه بالكامل عند القراءة التالية.
+    """
+    if not delta:
+        return
+    db.session.execute(
+        update(Counter).where(Counter.name == name).values(value=Counter.value + delta)
+    )
+
+
+def move_order_status(old_status, new_status, count=1):
+    """نقل طلب (أو عدة طلبات) من حالة إلى أخرى في العدادات"""
+    if old_status == new_status:
+        return
+    if old_status in ORDER_STATUSES:
+        adjust_counter(order_status_counter(old_status), -count)
+    if new_status in ORDER_STATUSES:
+        adjust_counter(order_status_counter(new_status), count)
+
+
+def compute_counters():
+    """حساب كل العدادات من الجداول مباشرة"""
+    values = dict.fromkeys(COUNTER_NAMES, 0)
+
+    for status, count in db.session.execute(
+        select(Order.status, func.count()).group_by(Order.status)
+    ):
+        values['orders_total'] += count
+        if status in ORDER_STATUSES:
+            values[order_status_counter(status)] = count
+
+    values['employees_total'] = db.session.execute(select(func.count()).select_from(Employee)).scalar()
+    values['employees_active'] = db.session.execute(
+        select(func.count()).select_from(Employee).where(Employee.is_active == True)
+    ).scalar()
+    values['years'] = db.session.execute(select(func.count()).select_from(AcademicYear)).scalar()
+    values['subjects'] = db.session.execute(select(func.count()).select_from(Subject)).scalar()
+    values['books'] = db.session.execute(select(func.count()).select_from(Book)).scalar()
+    return values
+
+
+def rebuild_counters():
+    """إعادة بناء جدول العدادات من الصفر (للمطابقة أو أول تشغيل)"""
+    values = compute_counters()
+    db.session.execute(delete(Counter))
+    db.session.add_all(Counter(name=name, value=value) for name, value in values.items())
+    db.session.commit()
+    logger.info('Rebuilt dashboard counters: %s', values)
+    return values
+
+
+def get_counters():
+    """قراءة كل العدادات باستعلام واحد، مع إعادة البناء إذا كان الجدول ناقصاً"""
+    values = dict(db.session.execute(select(Counter.name, Counter.value)).all())
+    if any(name not in values for name in COUNTER_NAMES):
+        values = rebuild_counters()
+    return values
+
+
+@app.cli.command('reconcile-counters')
+def reconcile_counters_command():
+    """Rebuild the dashboard counters table from the source tables."""
+    before = dict(db.session.execute(select(Counter.name, Counter.value)).all())
+    after = rebuild_counters()
+    for name in COUNTER_NAMES:
+        marker = '' if before.get(name) == after[name] else '  (fixed)'
+        print(f'{name}: {before.get(name)} -> {after[name]}{marker}')
+
+
+if __name__ == '__main__':
+    with app.app_context():
+        db.create_all()
+        print(rebuild_counters())
@@ -0,0 +1,41 @@
+from jinja2 import nodes
+from jinja2.ext import Extension
+from page_cache import LRUCache
+
+# أجزاء القوالب المعروضة: (اسم الجزء, الإصدار, ...) -> Markup
+fragment_cache = LRUCache(max_entries=256)
+
+
+class FragmentCacheExtension(Extension):
+    """وسم {% cache 'name', version, ... %} ... {% endcache %}
+
+    يُعرض محتوى الوسم مرة واحدة لكل مفتاح ويُعاد من الذاكرة بعد ذلك. المفتاح يجب أن
+    يتضمن إصدار الكتالوج/الإعدادات وأي حالة خاصة بالمستخدم تظهر داخل الجزء.
+    البيانات الثقيلة تُحمّل داخل الوسم، فلا تُستعلم عند وجود الجزء في الذاكرة.
+    """
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method('_render_cached', [nodes.List(key)]), [], [], body
+        ).set_lineno(lineno)
+
+    def _render_cached(self, key, caller):
+        key = tuple(key)
+        html = fragment_cache.get(key)
+        if html is None:
+            html = caller()
+            fragment_cache.set(key, html)
+        return html
+
+
+def init_fragment_cache(app, max_entries=256):
+    """تفعيل وسم cache في قوالب التطبيق"""
+    fragment_cache.max_entries = max_entries
+    app.jinja_env.add_extension(FragmentCacheExtension)
@@ -0,0 +1,238 @@
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+from app import app, db
+from models import Job
+from backup_manager import BackupManager
+from restore import validate_backup, restore_backup
+from rollups import rebuild_rollups
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ('queued', 'running', 'succeeded', 'failed')
+
+# مهلة إعادة المحاولة: RETRY_BASE_SECONDS * 2^(المحاولة - 1)
+RETRY_BASE_SECONDS = 30
+# مهمة "قيد التنفيذ" أطول من هذا تعتبر متوقفة (توقفت العملية) وتعاد للطابور
+JOB_TIMEOUT = timedelta(hours=2)
+# أقصى انتظار للعامل بين فحصين للطابور
+POLL_SECONDS = 2.0
+
+JOB_HANDLERS = {}
+
+_wake = threading.Event()
+
+
+class JobFailed(Exception):
+    """فشل المهمة برسالة جاهزة للعرض (يُعاد المحاولة حتى max_attempts)"""
+    pass
+
+
+def job_handler(kind):
+    """تسجيل دالة تنفذ نوعاً من المهام: handler(payload) -> dict قابل للتحويل إلى JSON"""
+    def decorator(f):
+        JOB_HANDLERS[kind] = f
+        return f
+    return decorator
+
+
+def enqueue(kind, payload=None, max_attempts=3):
+    """إضافة مهمة للطابور (بدون commit؛ تُحفظ مع معاملة الطلب)"""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f'Unknown job kind: {kind}')
+    job = Job(kind=kind, payload=json.dumps(payload or {}, ensure_ascii=False),
+              status='queued', max_attempts=max_attempts, run_after=datetime.utcnow())
+    db.session.add(job)
+    # إيقاظ عمال هذه العملية بعد حفظ المعاملة (انظر _wake_after_commit)
+    db.session.info['wake_job_workers'] = True
+    return job
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_after_commit(session):
+    if session.info.pop('wake_job_workers', False):
+        _wake.set()
+
+
+def job_to_dict(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error,
+    }
+
+
+def job_message(job):
+    """رسالة مختصرة لنتيجة مهمة منتهية (تُعرض كرسالة flash)"""
+    if job.status == 'failed':
+        return f'فشلت المهمة: {job.error}'
+    result = json.loads(job.result) if job.result else {}
+    return result.get('message') or 'تمت المهمة بنجاح'
+
+
+def requeue_stale_jobs():
+    """إعادة المهام العالقة في "قيد التنفيذ" (عامل توقف) إلى الطابور"""
+    cutoff = datetime.utcnow() - JOB_TIMEOUT
+    result = db.session.execute(
+        update(Job)
+        .where(Job.status == 'running', Job.started_at < cutoff)
+        .values(status='queued', run_after=datetime.utcnow(), error='انتهت مهلة العامل')
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def claim_next_job(worker_id):
+    """حجز أقدم مهمة مستحقة؛ التحديث المشروط يضمن ألا يأخذها عاملان"""
+    now = datetime.utcnow()
+    while True:
+        job_id = db.session.execute(
+            select(Job.id)
+            .where(Job.status == 'queued', Job.run_after <= now)
+            .order_by(Job.run_after, Job.id)
+            .limit(1)
+        ).scalar()
+        if job_id is None:
+            db.session.rollback()
+            return None
+        claimed = db.session.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == 'queued')
+            .values(status='running', started_at=now, worker=worker_id,
+                    attempts=Job.attempts + 1)
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, job_id)
+
+
+def run_job(job):
+    """تنفيذ مهمة محجوزة وتسجيل النتيجة أو جدولة إعادة المحاولة"""
+    handler = JOB_HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise JobFailed(f'Unknown job kind: {job.kind}')
+        result = handler(json.loads(job.payload or '{}'))
+        if isinstance(result, dict) and result.get('success') is False:
+            raise JobFailed(result.get('error') or 'فشلت المهمة')
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(Job, job.id)
+        job.error = str(e)
+        if job.attempts < job.max_attempts:
+            job.status = 'queued'
+            job.run_after = datetime.utcnow() + timedelta(
+                seconds=RETRY_BASE_SECONDS * 2 ** (job.attempts - 1))
+        else:
+            job.status = 'failed'
+            job.finished_at = datetime.utcnow()
+        if not isinstance(e, JobFailed):
+            logger.exception('Job %s (%s) failed', job.id, job.kind)
+        db.session.commit()
+        return job
+
+    job = db.session.get(Job, job.id)
+    job.status = 'succeeded'
+    job.finished_at = datetime.utcnow()
+    job.error = None
+    job.result = json.dumps(result, ensure_ascii=False, default=str)
+    db.session.commit()
+    return job
+
+
+def work(worker_id=None, stop_when_idle=False, stop_event=None):
+    """حلقة العامل: تنفيذ المهام المستحقة واحدة تلو الأخرى"""
+    worker_id = worker_id or f'{os.getpid()}:{threading.get_ident()}'
+    processed = 0
+    while not (stop_event and stop_event.is_set()):
+        try:
+            with app.app_context():
+                job = claim_next_job(worker_id)
+                if job is not None:
+                    run_job(job)
+                    processed += 1
+                    continue
+        except Exception:
+            logger.exception('Job worker %s failed to process the queue', worker_id)
+        if stop_when_idle:
+            return processed
+        _wake.wait(POLL_SECONDS)
+        _wake.clear()
+    return processed
+
+
+class JobWorkerPool:
+    """خيوط عاملة داخل كل عملية؛ المهام تُحجز من الجدول فلا تتكرر بين العمليات"""
+
+    def __init__(self):
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self, threads=1):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            with app.app_context():
+                requeue_stale_jobs()
+            for number in range(threads):
+                threading.Thread(target=work, name=f'job-worker-{number}', daemon=True).start()
+
+
+job_workers = JobWorkerPool()
+
+
+@app.before_request
+def _start_job_workers():
+    # مثل مجدول النسخ: يبدأ مع أول طلب في كل عملية (بعد fork في gunicorn)
+    threads = app.config.get('JOB_WORKER_THREADS', 1)
+    if threads and not app.testing:
+        job_workers.start(threads)
+
+
+@app.cli.command('run-job-worker')
+def run_job_worker_command():
+    """Run a job worker in the foreground (instead of the in-process threads)."""
+    requeue_stale_jobs()
+    work(worker_id=f'cli:{os.getpid()}')
+
+
+# ---- معالجات المهام ----
+
+@job_handler('backup')
+def _backup_job(payload):
+    return BackupManager().run_backup(payload.get('backup_type', 'full'), trigger='manual',
+                                      compress=payload.get('compress', False))
+
+
+@job_handler('export')
+def _export_job(payload):
+    return BackupManager().create_data_export(compress=payload.get('compress', False))
+
+
+@job_handler('validate_backup')
+def _validate_backup_job(payload):
+    return validate_backup(BackupManager(), payload['name'])
+
+
+@job_handler('restore_backup')
+def _restore_backup_job(payload):
+    return restore_backup(BackupManager(), payload['name'])
+
+
+@job_handler('rebuild_rollups')
+def _rebuild_rollups_job(payload):
+    result = rebuild_rollups()
+    result['message'] = f"تمت إعادة بناء التقارير: {result['days']} يوم"
+    return result
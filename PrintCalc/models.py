@@ -1,8 +1,12 @@
 from app import db
-from sqlalchemy import Column, Integer, String, Float, Text, Boolean, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Float, Text, Boolean, ForeignKey, Date, DateTime, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
-import uuid
+from ulid_codec import new_ulid
+
+# Employee roles
+ROLE_ADMIN = 'admin'
+ROLE_EMPLOYEE = 'employee'
 
 class AcademicYear(db.Model):
     """Model for academic years (e.g., أولى ابتدائي، ثانية ابتدائي)"""
@@ -85,6 +89,7 @@ class Employee(db.Model):
     password = Column(String(255), nullable=False)
     full_name = Column(String(100), nullable=False)
     phone = Column(String(20))
+    role = Column(String(20), nullable=False, default=ROLE_EMPLOYEE, server_default=ROLE_EMPLOYEE)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     last_login = Column(DateTime, nullable=True)
@@ -98,13 +103,14 @@ class Order(db.Model):
     __tablename__ = 'orders'
     
     id = Column(Integer, primary_key=True)
-    order_number = Column(String(36), unique=True, nullable=False, default=lambda: str(uuid.uuid4()))
+    # ULID (26 chars, time-ordered); orders created before them kept a 36-char UUID4
+    order_number = Column(String(36), unique=True, nullable=False, default=new_ulid)
     customer_name = Column(String(100))
     customer_phone = Column(String(20))
     total_cost = Column(Float, nullable=False)
     status = Column(String(20), default='new')  # new, in_progress, completed
     printing_type_id = Column(Integer, ForeignKey('printing_prices.id'))
-    selected_addons = Column(Text)  # JSON string of selected addons
+    selected_addons = Column(Text)  # Legacy JSON list of add-on ids (orders before order_addons)
     created_at = Column(DateTime, default=datetime.utcnow)
     completed_at = Column(DateTime)
     employee_id = Column(Integer, ForeignKey('employees.id'))
@@ -113,10 +119,44 @@ class Order(db.Model):
     printing_type = relationship('PrintingPrice', backref='orders')
     employee = relationship('Employee', backref='orders')
     order_items = relationship('OrderItem', backref='order', lazy=True, cascade='all, delete-orphan')
+    order_addons = relationship('OrderAddon', backref='order', lazy=True, cascade='all, delete-orphan')
+    
+    # Keyset pagination of the order lists (newest first, optionally by status)
+    __table_args__ = (
+        Index('ix_orders_status_created_at_id', 'status', 'created_at', 'id'),
+        Index('ix_orders_created_at_id', 'created_at', 'id'),
+    )
     
     def __repr__(self):
         return f'<Order {self.order_number}>'
 
+class OrderNumberAlias(db.Model):
+    """Old UUID order numbers of orders renumbered to ULIDs, so printed links keep working"""
+    __tablename__ = 'order_number_aliases'
+    
+    legacy_number = Column(String(36), primary_key=True)
+    order_id = Column(Integer, ForeignKey('orders.id'), nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<OrderNumberAlias {self.legacy_number}>'
+
+class OrderAddon(db.Model):
+    """Add-ons charged on an order, with the price at the time of the order"""
+    __tablename__ = 'order_addons'
+    
+    id = Column(Integer, primary_key=True)
+    order_id = Column(Integer, ForeignKey('orders.id'), nullable=False, index=True)
+    addon_id = Column(Integer, nullable=False)  # no FK: add-ons can be deleted, orders keep their history
+    price = Column(Float, nullable=False)
+    
+    # Usage and revenue per add-on
+    __table_args__ = (
+        Index('ix_order_addons_addon_id_order_id', 'addon_id', 'order_id'),
+    )
+    
+    def __repr__(self):
+        return f'<OrderAddon order={self.order_id} addon={self.addon_id}>'
+
 class OrderItem(db.Model):
     """Model for items in each order"""
     __tablename__ = 'order_items'
@@ -133,3 +173,130 @@ class OrderItem(db.Model):
     
     def __repr__(self):
         return f'<OrderItem {self.book_id} x{self.quantity}>'
+
+class CacheVersion(db.Model):
+    """Version counters used to invalidate in-process caches across workers"""
+    __tablename__ = 'cache_versions'
+    
+    name = Column(String(50), primary_key=True)  # e.g., "catalog"
+    version = Column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<CacheVersion {self.name}={self.version}>'
+
+class CartSession(db.Model):
+    """Server-side cart and last calculation, keyed by a short session token"""
+    __tablename__ = 'cart_sessions'
+    
+    token = Column(String(32), primary_key=True)
+    cart = Column(Text)  # JSON list of cart items
+    calculation = Column(Text)  # JSON of the last cost calculation
+    updated_at = Column(DateTime, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<CartSession {self.token}>'
+
+class Counter(db.Model):
+    """Incrementally maintained counts shown on the dashboards"""
+    __tablename__ = 'counters'
+    
+    name = Column(String(50), primary_key=True)  # e.g., "orders_new", "books"
+    value = Column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<Counter {self.name}={self.value}>'
+
+class BackupRun(db.Model):
+    """History of backup runs (scheduled or manual) with status and duration"""
+    __tablename__ = 'backup_runs'
+    
+    id = Column(Integer, primary_key=True)
+    backup_type = Column(String(20), nullable=False)  # database, full, incremental
+    trigger = Column(String(20), nullable=False, default='manual')  # manual, schedule
+    status = Column(String(20), nullable=False, default='running')  # running, success, failed
+    started_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = Column(DateTime)
+    duration_seconds = Column(Float)
+    message = Column(Text)  # backup file / snapshot id, or the error
+    
+    __table_args__ = (
+        Index('ix_backup_runs_type_started_at', 'backup_type', 'started_at'),
+    )
+    
+    def __repr__(self):
+        return f'<BackupRun {self.backup_type} {self.status}>'
+
+class Job(db.Model):
+    """Background job queued by a request and run by the local job worker"""
+    __tablename__ = 'jobs'
+    
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(50), nullable=False)  # e.g., "backup", "export"
+    payload = Column(Text)  # JSON arguments for the handler
+    status = Column(String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    run_after = Column(DateTime, default=datetime.utcnow, nullable=False)  # retry backoff
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    worker = Column(String(50))  # pid/thread that claimed the job
+    result = Column(Text)  # JSON result of the handler
+    error = Column(Text)
+    
+    __table_args__ = (
+        Index('ix_jobs_status_run_after_id', 'status', 'run_after', 'id'),
+        Index('ix_jobs_created_at', 'created_at'),
+    )
+    
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
+
+class DailySales(db.Model):
+    """Daily rollup of copies, pages and printing revenue per book and printing type"""
+    __tablename__ = 'daily_sales'
+    
+    # Cairo calendar day; ids are not foreign keys so history survives catalog deletes
+    day = Column(Date, primary_key=True)
+    book_id = Column(Integer, primary_key=True)
+    printing_type_id = Column(Integer, primary_key=True)  # 0 when the order has none
+    subject_id = Column(Integer)
+    year_id = Column(Integer)
+    # Counted on the day the order was created
+    order_lines = Column(Integer, nullable=False, default=0)
+    copies = Column(Integer, nullable=False, default=0)
+    pages = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0)
+    # Counted on the day the order was completed
+    completed_copies = Column(Integer, nullable=False, default=0)
+    completed_pages = Column(Integer, nullable=False, default=0)
+    completed_revenue = Column(Float, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<DailySales {self.day} book={self.book_id}>'
+
+class DailyAddonSales(db.Model):
+    """Daily rollup of how many orders selected each add-on and what they paid for it"""
+    __tablename__ = 'daily_addon_sales'
+    
+    day = Column(Date, primary_key=True)
+    addon_id = Column(Integer, primary_key=True)
+    orders = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0, server_default='0')
+    
+    def __repr__(self):
+        return f'<DailyAddonSales {self.day} addon={self.addon_id}>'
+
+class DailyOrderStats(db.Model):
+    """Daily rollup of order counts and revenue (created and completed)"""
+    __tablename__ = 'daily_order_stats'
+    
+    day = Column(Date, primary_key=True)
+    orders = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0)
+    addons_revenue = Column(Float, nullable=False, default=0)
+    completed_orders = Column(Integer, nullable=False, default=0)
+    completed_revenue = Column(Float, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<DailyOrderStats {self.day}>'
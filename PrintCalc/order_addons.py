@@ -0,0 +1,79 @@
+import json
+import logging
+from collections import defaultdict
+import click
+from sqlalchemy import select, insert, func
+from app import app, db
+from models import AddOn, Order, OrderItem, OrderAddon
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def record_order_addons(order_id, addons):
+    """حفظ إضافات الطلب بسعرها وقت الطلب في عملية INSERT مجمّعة واحدة (بدون commit)"""
+    if addons:
+        db.session.execute(insert(OrderAddon), [
+            {'order_id': order_id, 'addon_id': addon['id'], 'price': addon['price']}
+            for addon in addons
+        ])
+
+
+def _charged_prices(addon_ids, charged, prices):
+    """أسعار إضافات طلب قديم: الأسعار الحالية موزونة لتساوي ما دُفع فعلاً للإضافات"""
+    current = [prices.get(addon_id, 0.0) for addon_id in addon_ids]
+    total = sum(current)
+    if total > 0:
+        return [round(price * charged / total, 2) for price in current]
+    return [round(charged / len(addon_ids), 2)] * len(addon_ids)
+
+
+def backfill_order_addons(batch_size=BACKFILL_BATCH_SIZE):
+    """تحويل عمود selected_addons (JSON) للطلبات القديمة إلى صفوف order_addons
+
+    الطلبات التي لها صفوف بالفعل تُتخطى، فيمكن تشغيلها أكثر من مرة.
+    """
+    prices = dict(db.session.execute(select(AddOn.id, AddOn.price)).all())
+    has_rows = select(OrderAddon.id).where(OrderAddon.order_id == Order.id).exists()
+    converted = 0
+    last_id = 0
+    while True:
+        orders = db.session.execute(
+            select(Order.id, Order.total_cost, Order.selected_addons)
+            .where(Order.id > last_id, Order.selected_addons.isnot(None),
+                   Order.selected_addons != '[]', ~has_rows)
+            .order_by(Order.id)
+            .limit(batch_size)
+        ).all()
+        if not orders:
+            break
+        last_id = orders[-1].id
+        items_total = defaultdict(float, db.session.execute(
+            select(OrderItem.order_id, func.sum(OrderItem.total_cost))
+            .where(OrderItem.order_id.in_([order.id for order in orders]))
+            .group_by(OrderItem.order_id)
+        ).all())
+        rows = []
+        for order in orders:
+            addon_ids = [int(addon_id) for addon_id in json.loads(order.selected_addons or '[]')]
+            if not addon_ids:
+                continue
+            charged = max(order.total_cost - items_total[order.id], 0.0)
+            for addon_id, price in zip(addon_ids, _charged_prices(addon_ids, charged, prices)):
+                rows.append({'order_id': order.id, 'addon_id': addon_id, 'price': price})
+        if rows:
+            db.session.execute(insert(OrderAddon), rows)
+        db.session.commit()
+        converted += len(orders)
+    if converted:
+        logger.info('Backfilled order_addons for %d orders', converted)
+    return converted
+
+
+@app.cli.command('backfill-order-addons')
+@click.option('--batch-size', default=BACKFILL_BATCH_SIZE, show_default=True)
+def backfill_order_addons_command(batch_size):
+    """Convert the legacy selected_addons JSON of old orders to order_addons rows."""
+    converted = backfill_order_addons(batch_size)
+    print(f'Converted add-ons of {converted} orders')
@@ -0,0 +1,93 @@
+import logging
+import re
+import time
+from datetime import timezone
+import click
+from sqlalchemy import select, insert, update, func
+from app import app, db
+from models import Order, OrderNumberAlias
+from ulid_codec import new_ulid, normalize_ulid, ulid_timestamp
+
+logger = logging.getLogger(__name__)
+
+LEGACY_LENGTH = 36
+_LEGACY_PATTERN = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
+# فرق الساعة المسموح بين العمليات قبل اعتبار الرقم "من المستقبل"
+FUTURE_TOLERANCE_MS = 5 * 60 * 1000
+MIGRATION_BATCH_SIZE = 1000
+
+
+def canonical_order_number(text):
+    """الصيغة القياسية لرقم طلب من رابط، أو None إذا لم يكن من الممكن وجود طلب بهذا الرقم
+
+    لا يستعلم قاعدة البيانات: الأرقام المشوهة وأرقام ULID بوقت مستقبلي تُرفض مباشرة.
+    """
+    ulid = normalize_ulid(text)
+    if ulid is not None:
+        if ulid_timestamp(ulid) > time.time() * 1000 + FUTURE_TOLERANCE_MS:
+            return None
+        return ulid
+    text = (text or '').lower()
+    return text if _LEGACY_PATTERN.fullmatch(text) else None
+
+
+def migrated_order_number(number):
+    """الرقم الجديد لطلب قديم أعيد ترقيمه (أو None)"""
+    if len(number) != LEGACY_LENGTH:
+        return None
+    return db.session.execute(
+        select(Order.order_number)
+        .join(OrderNumberAlias, OrderNumberAlias.order_id == Order.id)
+        .where(OrderNumberAlias.legacy_number == number)
+    ).scalar()
+
+
+def migrated_order_numbers(numbers):
+    """الأرقام الجديدة لعدة أرقام UUID قديمة في استعلام واحد: {الرقم القديم: الرقم الجديد}"""
+    legacy = [number for number in numbers if len(number) == LEGACY_LENGTH]
+    if not legacy:
+        return {}
+    return dict(db.session.execute(
+        select(OrderNumberAlias.legacy_number, Order.order_number)
+        .join(Order, OrderNumberAlias.order_id == Order.id)
+        .where(OrderNumberAlias.legacy_number.in_(legacy))
+    ).all())
+
+
+def _created_ms(created_at):
+    return int(created_at.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def migrate_order_numbers(batch_size=MIGRATION_BATCH_SIZE):
+    """إعادة ترقيم الطلبات ذات أرقام UUID إلى ULID بوقت إنشائها، مع حفظ الرقم القديم كاسم بديل"""
+    migrated = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(Order.id, Order.order_number, Order.created_at)
+            .where(Order.id > last_id, func.length(Order.order_number) == LEGACY_LENGTH)
+            .order_by(Order.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        db.session.execute(insert(OrderNumberAlias), [
+            {'legacy_number': row.order_number, 'order_id': row.id} for row in rows
+        ])
+        db.session.execute(update(Order), [
+            {'id': row.id, 'order_number': new_ulid(_created_ms(row.created_at)) if row.created_at else new_ulid()}
+            for row in rows
+        ])
+        db.session.commit()
+        last_id = rows[-1].id
+        migrated += len(rows)
+        logger.info('Renumbered %d orders (up to id %d)', migrated, last_id)
+    return migrated
+
+
+@app.cli.command('migrate-order-numbers')
+@click.option('--batch-size', default=MIGRATION_BATCH_SIZE, show_default=True)
+def migrate_order_numbers_command(batch_size):
+    """Renumber UUID orders to ULIDs; the old numbers keep resolving."""
+    migrated = migrate_order_numbers(batch_size)
+    print(f'Renumbered {migrated} orders')
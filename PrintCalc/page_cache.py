@@ -0,0 +1,45 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """ذاكرة مؤقتة محدودة الحجم داخل العملية (الأقدم استخداماً يُحذف أولاً)"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def pop(self, key):
+        with self._lock:
+            return self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# صفحات تتبع الطلبات المعروضة: order_number -> (etag, html)
+order_page_cache = LRUCache(max_entries=2048)
@@ -0,0 +1,86 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import tuple_
+
+
+def encode_cursor(values):
+    """ترميز قيم المفتاح (مثل created_at و id) في نص قصير آمن للروابط"""
+    data = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(data, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, types):
+    """فك ترميز المؤشر؛ يُرجع None إذا كان غير صالح"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        data = json.loads(raw)
+        if len(data) != len(types):
+            return None
+        return tuple(
+            datetime.fromisoformat(value) if kind is datetime else kind(value)
+            for value, kind in zip(data, types)
+        )
+    except (ValueError, TypeError):
+        return None
+
+
+class KeysetPage:
+    """صفحة نتائج بترقيم المفتاح (keyset) بدلاً من OFFSET"""
+
+    def __init__(self, items, has_next, has_prev, next_cursor, prev_cursor, total, per_page):
+        self.items = items
+        self.has_next = has_next
+        self.has_prev = has_prev
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+        self.per_page = per_page
+
+    @property
+    def pages(self):
+        """عدد الصفحات التقريبي من الإجمالي المخزن"""
+        if not self.total:
+            return 0
+        return (self.total + self.per_page - 1) // self.per_page
+
+
+def keyset_paginate(query, columns, types, cursor=None, direction='next', per_page=20, total=None):
+    """ترقيم تنازلي حسب columns (مثل created_at ثم id) بتكلفة ثابتة لأي صفحة
+
+    direction='next' يجلب الصفوف الأقدم من المؤشر، و'prev' يجلب الأحدث منه.
+    """
+    key = decode_cursor(cursor, types)
+    row_key = tuple_(*columns)
+
+    if key is not None and direction == 'prev':
+        rows = (query.filter(row_key > tuple_(*key))
+                .order_by(*[column.asc() for column in columns])
+                .limit(per_page + 1).all())
+        has_more = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        has_prev, has_next = has_more, True
+    else:
+        if key is not None:
+            query = query.filter(row_key < tuple_(*key))
+        rows = (query.order_by(*[column.desc() for column in columns])
+                .limit(per_page + 1).all())
+        items = rows[:per_page]
+        has_next = len(rows) > per_page
+        has_prev = key is not None
+
+    def item_cursor(item):
+        return encode_cursor([getattr(item, column.key) for column in columns])
+
+    return KeysetPage(
+        items=items,
+        has_next=has_next and bool(items),
+        has_prev=has_prev and bool(items),
+        next_cursor=item_cursor(items[-1]) if items else None,
+        prev_cursor=item_cursor(items[0]) if items else None,
+        total=total,
+        per_page=per_page
+    )
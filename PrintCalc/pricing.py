@@ -0,0 +1,229 @@
+import math
+import threading
+from sqlalchemy import select
+from app import db
+from models import PrintingPrice, AddOn
+from catalog_cache import catalog_cache, get_cache_version, SETTINGS
+
+# الحد الأقصى لعدد السطور في طلب تسعير واحد
+MAX_QUOTE_LINES = 2000
+
+
+class PricingError(ValueError):
+    """خطأ في بيانات التسعير (كتاب أو نوع طباعة أو إضافة غير متاحة)"""
+    pass
+
+
+def units_for_pages(page_count, pages_per_unit):
+    """عدد وحدات الطباعة اللازمة لنسخة واحدة"""
+    return math.ceil(page_count / pages_per_unit)
+
+
+def _to_int(value, message):
+    # int() يقطع الكسور بصمت: 2.9 ليست كمية أو معرفاً صحيحاً
+    if isinstance(value, float) and not value.is_integer():
+        raise PricingError(message)
+    try:
+        return int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise PricingError(message)
+
+
+class PriceTables:
+    """جداول الأسعار النشطة محمّلة مرة واحدة لكل إصدار من الكتالوج والإعدادات"""
+
+    def __init__(self, version, catalog, printing_prices, addons):
+        self.version = version
+        self.catalog = catalog
+        self.printing_prices = printing_prices
+        self.addons = addons
+
+    def book(self, book_id):
+        book = self.catalog.book(_to_int(book_id, 'معرف الكتاب غير صحيح'))
+        if book is None:
+            raise PricingError(f'الكتاب رقم {book_id} غير متاح')
+        return book
+
+    def printing_price(self, price_id):
+        price = self.printing_prices.get(_to_int(price_id, 'نوع الطباعة غير صحيح'))
+        if price is None:
+            raise PricingError(f'نوع الطباعة رقم {price_id} غير متاح')
+        return price
+
+    def addon_list(self, addon_ids):
+        if addon_ids is None:
+            return []
+        # نص مثل "11" يُقرأ حرفاً حرفاً إذا مُرر كما هو
+        if not isinstance(addon_ids, list):
+            raise PricingError('قائمة الإضافات غير صحيحة')
+        addons = []
+        for addon_id in addon_ids:
+            addon = self.addons.get(_to_int(addon_id, 'معرف الإضافة غير صحيح'))
+            if addon is None:
+                raise PricingError(f'الإضافة رقم {addon_id} غير متاحة')
+            addons.append(addon)
+        return addons
+
+
+class PricingEngine:
+    """محرك التسعير الموحد للسلة وصفحة الكتاب الواحد وواجهة /api/quote"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tables = None
+
+    def get_tables(self):
+        """إرجاع جداول الأسعار وإعادة تحميلها فقط عند تغيّر الكتالوج أو الإعدادات"""
+        catalog = catalog_cache.get()
+        version = (catalog.version, get_cache_version(SETTINGS))
+        tables = self._tables
+        if tables is not None and tables.version == version:
+            return tables
+
+        with self._lock:
+            tables = self._tables
+            if tables is None or tables.version != version:
+                tables = self._load(version, catalog)
+                self._tables = tables
+            return tables
+
+    def _load(self, version, catalog):
+        printing_prices = {}
+        for row in db.session.execute(
+            select(PrintingPrice.id, PrintingPrice.name, PrintingPrice.price_per_unit,
+                   PrintingPrice.pages_per_unit, PrintingPrice.description)
+            .where(PrintingPrice.is_active == True)
+            .order_by(PrintingPrice.id)
+        ):
+            printing_prices[row.id] = {
+                'id': row.id,
+                'name': row.name,
+                'price_per_unit': row.price_per_unit,
+                'pages_per_unit': row.pages_per_unit,
+                'description': row.description
+            }
+
+        addons = {}
+        for row in db.session.execute(
+            select(AddOn.id, AddOn.name, AddOn.price, AddOn.description)
+            .where(AddOn.is_active == True)
+            .order_by(AddOn.id)
+        ):
+            addons[row.id] = {
+                'id': row.id,
+                'name': row.name,
+                'price': row.price,
+                'description': row.description
+            }
+
+        return PriceTables(version, catalog, printing_prices, addons)
+
+    @staticmethod
+    def price_book(page_count, printing_price, quantity=1):
+        """تسعير كتاب واحد: ceil(الصفحات / صفحات الوحدة) × سعر الوحدة × الكمية"""
+        units_needed = units_for_pages(page_count, printing_price['pages_per_unit'])
+        cost_per_copy = units_needed * printing_price['price_per_unit']
+        return units_needed, cost_per_copy, cost_per_copy * quantity
+
+    def price_cart(self, cart, printing_price_id, addon_ids):
+        """حساب تكلفة السلة كاملة؛ الإضافات تُحسب مرة واحدة للطلب"""
+        tables = self.get_tables()
+        printing_price = tables.printing_price(printing_price_id)
+        selected_addons = tables.addon_list(addon_ids)
+
+        books_details = []
+        total_printing_cost = 0
+        for cart_item in cart:
+            book = tables.book(cart_item['id'])
+            quantity = cart_item.get('quantity', 1)
+            units_needed, cost_per_copy, line_total = self.price_book(
+                book['page_count'], printing_price, quantity
+            )
+            total_printing_cost += line_total
+            books_details.append({
+                'id': book['id'],
+                'name': book['name'],
+                'pages': book['page_count'],
+                'quantity': quantity,
+                'units_needed': units_needed,
+                'printing_cost_per_copy': cost_per_copy,
+                'total_printing_cost': line_total,
+                'subject_name': book['subject_name'],
+                'year_name': book['year_name']
+            })
+
+        addons_cost = sum(addon['price'] for addon in selected_addons)
+        return {
+            'books_details': books_details,
+            'printing_price': dict(printing_price),
+            'total_printing_cost': total_printing_cost,
+            'selected_addons': [dict(addon) for addon in selected_addons],
+            'addons_cost': addons_cost,
+            'total_cost': total_printing_cost + addons_cost
+        }
+
+    def quote(self, lines):
+        """تسعير عدة سطور (كتاب، كمية، نوع طباعة، إضافات لكل نسخة) في تمريرة واحدة
+
+        يُرجع (النتيجة، الأخطاء)؛ عند وجود أخطاء تكون النتيجة None.
+        """
+        if not isinstance(lines, list) or not lines:
+            return None, [{'line': None, 'error': 'يجب إرسال قائمة سطور غير فارغة'}]
+        if len(lines) > MAX_QUOTE_LINES:
+            return None, [{'line': None, 'error': f'الحد الأقصى {MAX_QUOTE_LINES} سطر في الطلب الواحد'}]
+
+        tables = self.get_tables()
+        results = []
+        errors = []
+        total_printing_cost = 0
+        total_addons_cost = 0
+
+        for index, line in enumerate(lines):
+            try:
+                if not isinstance(line, dict):
+                    raise PricingError('صيغة السطر غير صحيحة')
+                book = tables.book(line.get('book_id'))
+                printing_price = tables.printing_price(line.get('printing_price_id'))
+                quantity = _to_int(line.get('quantity', 1), 'الكمية غير صحيحة')
+                if quantity < 1:
+                    raise PricingError('الكمية يجب أن تكون أكبر من صفر')
+                addons = tables.addon_list(line.get('addon_ids'))
+            except PricingError as e:
+                errors.append({'line': index, 'error': str(e)})
+                continue
+
+            units_needed, cost_per_copy, printing_total = self.price_book(
+                book['page_count'], printing_price, quantity
+            )
+            addons_per_copy = sum(addon['price'] for addon in addons)
+            addons_total = addons_per_copy * quantity
+            total_printing_cost += printing_total
+            total_addons_cost += addons_total
+            results.append({
+                'line': index,
+                'book_id': book['id'],
+                'book_name': book['name'],
+                'pages': book['page_count'],
+                'quantity': quantity,
+                'printing_price_id': printing_price['id'],
+                'units_needed': units_needed,
+                'printing_cost_per_copy': cost_per_copy,
+                'addon_ids': [addon['id'] for addon in addons],
+                'addons_cost_per_copy': addons_per_copy,
+                'unit_cost': cost_per_copy + addons_per_copy,
+                'total_cost': printing_total + addons_total
+            })
+
+        if errors:
+            return None, errors
+
+        return {
+            'version': list(tables.version),
+            'lines': results,
+            'total_printing_cost': total_printing_cost,
+            'addons_cost': total_addons_cost,
+            'total_cost': total_printing_cost + total_addons_cost
+        }, []
+
+
+pricing_engine = PricingEngine()
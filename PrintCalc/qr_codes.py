@@ -0,0 +1,151 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+import qrcode
+import qrcode.image.svg
+
+QR_FORMATS = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+# إعدادات الرسم؛ تدخل في ETag حتى يتغيّر إذا تغيّرت
+QR_BOX_SIZE = 10
+QR_BORDER = 4
+# فحص حجم مجلد القرص بعد كل هذا العدد من الكتابات في العملية
+QR_DISK_PRUNE_EVERY = 64
+
+
+def qr_etag(data, fmt):
+    """ETag قوي مشتق من المحتوى المرمّز وإعدادات الرسم فقط (بدون توليد الصورة)"""
+    key = f'{data}|{fmt}|{QR_BOX_SIZE}|{QR_BORDER}'.encode('utf-8')
+    return hashlib.sha256(key).hexdigest()[:32]
+
+
+def render_qr(data, fmt='png'):
+    """توليد صورة QR بصيغة PNG أو SVG"""
+    qr = qrcode.QRCode(box_size=QR_BOX_SIZE, border=QR_BORDER)
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    buffer = io.BytesIO()
+    if fmt == 'svg':
+        qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(buffer)
+    else:
+        qr.make_image(fill_color="black", back_color="white").save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class QRCodeCache:
+    """ذاكرة LRU محدودة لصور QR مع ذاكرة قرص اختيارية مشتركة بين العمليات"""
+
+    def __init__(self, max_entries=512, disk_dir=None, max_disk_entries=4096):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._disk_writes = 0
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'disk_evictions': 0}
+
+    def configure(self, max_entries=None, disk_dir=None, max_disk_entries=None):
+        if max_entries is not None:
+            self.max_entries = max_entries
+        if max_disk_entries is not None:
+            self.max_disk_entries = max_disk_entries
+        self.disk_dir = disk_dir
+
+    def _disk_path(self, etag, fmt):
+        return os.path.join(self.disk_dir, f'{etag}.{fmt}')
+
+    def get(self, data, fmt):
+        """قراءة الصورة من الذاكرة ثم القرص؛ يُرجع None عند عدم وجودها"""
+        key = qr_etag(data, fmt)
+        with self._lock:
+            image = self._entries.get(key)
+            if image is not None:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return image
+
+        if self.disk_dir:
+            path = self._disk_path(key, fmt)
+            try:
+                with open(path, 'rb') as f:
+                    image = f.read()
+                # تحديث وقت التعديل: الحذف من القرص يبدأ بالأقدم استخداماً
+                os.utime(path)
+            except FileNotFoundError:
+                image = None
+            if image is not None:
+                self._store(key, image)
+                with self._lock:
+                    self.stats['disk_hits'] += 1
+                return image
+        return None
+
+    def get_or_render(self, data, fmt, persist=True):
+        """الصورة من الذاكرة أو القرص أو بتوليدها؛ persist=False لا يكتبها على القرص"""
+        image = self.get(data, fmt)
+        if image is not None:
+            return image
+
+        with self._lock:
+            self.stats['misses'] += 1
+        image = render_qr(data, fmt)
+        key = qr_etag(data, fmt)
+        self._store(key, image)
+
+        if self.disk_dir and persist:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            # الكتابة في ملف مؤقت ثم إعادة التسمية حتى لا تقرأ عملية أخرى ملفاً ناقصاً
+            path = self._disk_path(key, fmt)
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(image)
+            os.replace(tmp_path, path)
+            with self._lock:
+                self._disk_writes += 1
+                prune = self._disk_writes % QR_DISK_PRUNE_EVERY == 1
+            if prune:
+                self.prune_disk()
+        return image
+
+    def prune_disk(self):
+        """حذف أقدم ملفات القرص استخداماً حتى لا يتجاوز عددها max_disk_entries"""
+        entries = []
+        try:
+            for entry in os.scandir(self.disk_dir):
+                if not entry.name.endswith('.tmp'):
+                    try:
+                        entries.append((entry.stat().st_mtime, entry.path))
+                    except FileNotFoundError:
+                        pass
+        except FileNotFoundError:
+            return 0
+        excess = len(entries) - self.max_disk_entries
+        if excess <= 0:
+            return 0
+        entries.sort()
+        removed = 0
+        for _mtime, path in entries[:excess]:
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self.stats['disk_evictions'] += removed
+        return removed
+
+    def _store(self, key, image):
+        with self._lock:
+            self._entries[key] = image
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+qr_cache = QRCodeCache()
@@ -0,0 +1,79 @@
+import logging
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """عدد استعلامات SQL تجاوز الحد المسموح به للمسار"""
+    pass
+
+
+class QueryCounter:
+    """يعدّ الاستعلامات المنفذة في الخيط الحالي داخل كتلة with"""
+
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    for counter in getattr(_local, 'counters', ()):
+        counter.count += 1
+        counter.statements.append(statement)
+
+
+@contextmanager
+def count_queries():
+    """عدّ استعلامات SQL داخل الكتلة
+
+        with count_queries() as counter:
+            client.get('/order/...')
+        assert counter.count <= 3
+    """
+    counter = QueryCounter()
+    counters = getattr(_local, 'counters', None)
+    if counters is None:
+        counters = _local.counters = []
+    counters.append(counter)
+    try:
+        yield counter
+    finally:
+        counters.remove(counter)
+
+
+@contextmanager
+def assert_max_queries(limit, label='block'):
+    """مساعد للاختبارات: يفشل إذا نفذت الكتلة أكثر من limit استعلام"""
+    with count_queries() as counter:
+        yield counter
+    if counter.count > limit:
+        raise QueryBudgetExceeded(
+            f'{label} ran {counter.count} SQL statements (budget {limit}):\n'
+            + '\n'.join(counter.statements)
+        )
+
+
+def query_budget(limit):
+    """ميزانية استعلامات لمسار: خطأ في وضع الاختبار (app.testing) وتحذير في التطوير والإنتاج"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            with count_queries() as counter:
+                response = f(*args, **kwargs)
+            if counter.count > limit:
+                message = f'{f.__name__} ran {counter.count} SQL statements (budget {limit})'
+                if current_app.testing:
+                    raise QueryBudgetExceeded(message + ':\n' + '\n'.join(counter.statements))
+                logger.warning(message)
+            return response
+        return decorated_function
+    return decorator
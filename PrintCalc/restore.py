@@ -0,0 +1,425 @@
+import gzip
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+import click
+from sqlalchemy import DateTime, update, select, func
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.schema import CreateIndex, CreateTable
+from app import app, db
+from models import CacheVersion, Job, BackupRun, Employee, ROLE_ADMIN, ROLE_EMPLOYEE
+from backup_manager import BackupManager, EXPORT_TABLES, EXPORT_FORMAT_VERSION
+from catalog_cache import CATALOG, SETTINGS, get_cache_version
+from schema import upgrade_schema
+from rollups import rebuild_rollups, rollups_missing
+from order_addons import backfill_order_addons
+from auth import PRINCIPALS
+
+# عدد الصفوف في كل executemany أثناء الاستيراد (كل جدول في معاملة واحدة)
+RESTORE_BATCH_SIZE = 5000
+# كلمة مرور مؤقتة لا تطابق أي إدخال: التصدير لا يحتوي كلمات مرور الموظفين
+# (تُستبدل من القاعدة الحالية قبل التطبيق، انظر _carry_over_passwords)
+UNUSABLE_PASSWORD = '!'
+
+_SQLITE_DIALECT = sqlite.dialect()
+_TABLES_BY_NAME = {name: model.__table__ for name, model, _exclude in EXPORT_TABLES}
+# جداول تشغيلية تبقى كما هي في القاعدة الحالية عند الاستعادة (المهمة الجارية نفسها وسجل النسخ)
+CARRY_OVER_TABLES = (Job.__table__, BackupRun.__table__)
+
+
+class RestoreError(Exception):
+    """فشل الاستعادة أو التحقق برسالة جاهزة للعرض"""
+    pass
+
+
+def resolve_backup(manager, name):
+    """تحديد نوع النسخة من اسمها: ملف .db أو ملف تصدير NDJSON أو معرف لقطة"""
+    if os.path.basename(name) != name or name.startswith('.'):
+        raise RestoreError(f'اسم نسخة غير صالح: {name}')
+    path = os.path.join(manager.backup_dir, name)
+    if name.endswith('.db') and os.path.isfile(path):
+        return 'database', path
+    if name.startswith('data_export_') and name.endswith(('.ndjson', '.ndjson.gz')) and os.path.isfile(path):
+        return 'export', path
+    if name.startswith('snap_') and manager.snapshots.exists(name):
+        return 'snapshot', name
+    raise RestoreError(f'النسخة غير موجودة أو لا يمكن استعادتها: {name}')
+
+
+def _read_export(path):
+    """قراءة ملف التصدير سطراً بسطر مع موضع القراءة في الملف (لحساب التقدم)"""
+    with open(path, 'rb') as raw:
+        stream = gzip.GzipFile(fileobj=raw) if path.endswith('.gz') else raw
+        for line in stream:
+            if line.strip():
+                yield json.loads(line), raw.tell()
+
+
+def _sqlite_value(column, value):
+    """تحويل قيم JSON إلى صيغة التخزين التي يستخدمها SQLAlchemy في SQLite"""
+    if value is not None and isinstance(column.type, DateTime):
+        return datetime.fromisoformat(value).strftime('%Y-%m-%d %H:%M:%S.%f')
+    return value
+
+
+def _create_tables(conn):
+    """إنشاء كل الجداول بدون الفهارس (تُنشأ بعد تحميل البيانات)"""
+    for table in db.metadata.sorted_tables:
+        conn.execute(str(CreateTable(table).compile(dialect=_SQLITE_DIALECT)))
+
+
+def _create_indexes(conn):
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            conn.execute(str(CreateIndex(index).compile(dialect=_SQLITE_DIALECT)))
+
+
+def build_from_export(export_path, target, report=None):
+    """إعادة بناء قاعدة بيانات جديدة من ملف تصدير NDJSON
+
+    إدراج جماعي (executemany) بمعاملة واحدة لكل جدول، بدون فهارس وبدون فحص
+    المفاتيح الأجنبية أثناء التحميل؛ ثم تُنشأ الفهارس ويُفحص الملف كاملاً.
+    """
+    size = os.path.getsize(export_path)
+    conn = sqlite3.connect(target, isolation_level=None)
+    try:
+        # ملف جديد مؤقت: لا حاجة لسجل المعاملات أثناء البناء
+        conn.execute('PRAGMA journal_mode=OFF')
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.execute('PRAGMA foreign_keys=OFF')
+        _create_tables(conn)
+
+        records_count = {}
+        summary = None
+        current = None  # (table_name, insert_sql, columns)
+        batch = []
+
+        def flush():
+            if batch:
+                conn.executemany(current[1], batch)
+                batch.clear()
+
+        for item, position in _read_export(export_path):
+            if item.get('type') == 'header':
+                if item.get('format_version') != EXPORT_FORMAT_VERSION:
+                    raise RestoreError(f'إصدار ملف التصدير غير مدعوم: {item.get("format_version")}')
+                continue
+            if item.get('type') == 'summary':
+                summary = item['records_count']
+                continue
+
+            name = item['table']
+            if current is None or current[0] != name:
+                flush()
+                if current is not None:
+                    conn.execute('COMMIT')
+                table = _TABLES_BY_NAME.get(name)
+                if table is None:
+                    raise RestoreError(f'جدول غير معروف في ملف التصدير: {name}')
+                columns = list(table.columns)
+                placeholders = ', '.join('?' for _ in columns)
+                insert_sql = (f'INSERT INTO {table.name} ({", ".join(c.name for c in columns)}) '
+                              f'VALUES ({placeholders})')
+                current = (name, insert_sql, columns)
+                records_count[name] = 0
+                conn.execute('BEGIN')
+
+            data = item['data']
+            if name == 'employees':
+                if 'password' not in data:
+                    data['password'] = UNUSABLE_PASSWORD
+                # ملفات تصدير أقدم من عمود الدور
+                if not data.get('role'):
+                    data['role'] = ROLE_ADMIN if data.get('username') == 'admin' else ROLE_EMPLOYEE
+            batch.append(tuple(_sqlite_value(column, data.get(column.name)) for column in current[2]))
+            records_count[name] += 1
+            if len(batch) >= RESTORE_BATCH_SIZE:
+                flush()
+                if report:
+                    report('load', position, size)
+
+        flush()
+        if current is not None:
+            conn.execute('COMMIT')
+
+        if summary is None:
+            raise RestoreError('ملف التصدير غير مكتمل (لا يوجد سطر الملخص)')
+        if any(summary.get(name, 0) != count for name, count in records_count.items()):
+            raise RestoreError('عدد السجلات لا يطابق ملخص ملف التصدير')
+
+        if report:
+            report('index', size, size)
+        _create_indexes(conn)
+        conn.execute('ANALYZE')
+        return records_count
+    finally:
+        conn.close()
+
+
+def build_database(manager, name, target, report=None):
+    """بناء ملف قاعدة بيانات كامل في target من أي نوع نسخة"""
+    kind, source = resolve_backup(manager, name)
+    if kind == 'export':
+        build_from_export(source, target, report)
+    elif kind == 'snapshot':
+        if report:
+            report('load', 0, 1)
+        manager.snapshots.restore(source, target)
+    else:
+        if report:
+            report('load', 0, 1)
+        src = sqlite3.connect(source)
+        dst = sqlite3.connect(target)
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
+    return kind
+
+
+def check_database(path):
+    """فحص السلامة والمفاتيح الأجنبية وعدّ سجلات الجداول المصدّرة"""
+    conn = sqlite3.connect(path)
+    try:
+        integrity = [row[0] for row in conn.execute('PRAGMA integrity_check')]
+        foreign_key_errors = len(conn.execute('PRAGMA foreign_key_check').fetchall())
+        existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        records_count = {
+            name: conn.execute(f'SELECT COUNT(*) FROM {table.name}').fetchone()[0]
+            for name, table in _TABLES_BY_NAME.items() if table.name in existing
+        }
+    finally:
+        conn.close()
+    if integrity != ['ok']:
+        raise RestoreError('فشل فحص سلامة قاعدة البيانات المستعادة: ' + '; '.join(integrity[:5]))
+    if foreign_key_errors:
+        raise RestoreError(f'قاعدة البيانات المستعادة بها {foreign_key_errors} مرجع مفقود (foreign key)')
+    return records_count
+
+
+def _carry_over_passwords(conn):
+    """ملفات التصدير لا تحتوي كلمات المرور: نأخذها من الموظفين الحاليين بنفس اسم المستخدم
+
+    إذا لم يبق مدير يمكنه الدخول، يُحتفظ بحسابات المديرين الحالية حتى لا يُغلق التطبيق على الجميع.
+    """
+    if not conn.execute('SELECT 1 FROM main.employees WHERE password = ? LIMIT 1', (UNUSABLE_PASSWORD,)).fetchone():
+        return
+    # المطابقة باسم المستخدم فقط: المعرف قد يكون أُعيد استخدامه لموظف آخر بعد التصدير
+    by_username = dict(conn.execute('SELECT username, password FROM live.employees').fetchall())
+    conn.executemany('UPDATE main.employees SET password = ? WHERE id = ?', [
+        (by_username[username], employee_id)
+        for employee_id, username in conn.execute(
+            'SELECT id, username FROM main.employees WHERE password = ?', (UNUSABLE_PASSWORD,)).fetchall()
+        if username in by_username
+    ])
+
+    usable_admin = conn.execute('SELECT 1 FROM main.employees WHERE role = ? AND is_active AND password != ? LIMIT 1',
+                                (ROLE_ADMIN, UNUSABLE_PASSWORD)).fetchone()
+    if usable_admin:
+        return
+    columns = [column.name for column in Employee.__table__.columns if column.name != 'id']
+    for username, password in conn.execute('SELECT username, password FROM live.employees WHERE role = ? AND is_active',
+                                           (ROLE_ADMIN,)).fetchall():
+        updated = conn.execute('UPDATE main.employees SET password = ?, role = ?, is_active = 1 WHERE username = ?',
+                               (password, ROLE_ADMIN, username)).rowcount
+        if not updated:
+            conn.execute(f'INSERT INTO main.employees ({", ".join(columns)}) '
+                         f'SELECT {", ".join(columns)} FROM live.employees WHERE username = ?', (username,))
+
+
+def _carry_over_tables(scratch, live_path):
+    """نسخ الجداول التشغيلية من القاعدة الحالية إلى الملف المستعاد قبل تطبيقه"""
+    conn = sqlite3.connect(scratch, isolation_level=None)
+    try:
+        conn.execute('ATTACH DATABASE ? AS live', (live_path,))
+        conn.execute('BEGIN')
+        for table in CARRY_OVER_TABLES:
+            exists = conn.execute("SELECT 1 FROM main.sqlite_master WHERE type='table' AND name=?",
+                                  (table.name,)).fetchone()
+            if not exists:
+                conn.execute(str(CreateTable(table).compile(dialect=_SQLITE_DIALECT)))
+            columns = ', '.join(column.name for column in table.columns)
+            conn.execute(f'DELETE FROM main.{table.name}')
+            conn.execute(f'INSERT INTO main.{table.name} ({columns}) SELECT {columns} FROM live.{table.name}')
+        _carry_over_passwords(conn)
+        conn.execute('COMMIT')
+        conn.execute('DETACH DATABASE live')
+    finally:
+        conn.close()
+
+
+def _progress_reporter(manager, progress):
+    last_report = [0.0]
+
+    def report(phase, done, total):
+        now = time.monotonic()
+        if phase != progress.get('phase') or now - last_report[0] >= 0.5:
+            last_report[0] = now
+            progress['phase'] = phase
+            manager.write_progress(**dict(progress, pages_done=int(100 * done / total) if total else 0,
+                                          pages_total=100, unit='percent'))
+    return report
+
+
+def _scratch_path(directory):
+    fd, path = tempfile.mkstemp(prefix='.restore_', suffix='.db', dir=directory)
+    os.close(fd)
+    os.remove(path)
+    return path
+
+
+def validate_backup(manager, name):
+    """استعادة تجريبية في ملف مؤقت لقياس زمن الاستعادة والتأكد من صلاحية النسخة"""
+    progress = {'state': 'running', 'phase': 'load', 'backup_type': 'validate',
+                'backup_file': name, 'started_at': datetime.now().isoformat()}
+    scratch = None
+    started = time.monotonic()
+    try:
+        scratch = _scratch_path(manager.backup_dir)
+        report = _progress_reporter(manager, progress)
+        kind = build_database(manager, name, scratch, report)
+        report('verify', 1, 1)
+        records_count = check_database(scratch)
+        duration = round(time.monotonic() - started, 3)
+        manager.write_progress(**dict(progress, state='done', phase='done',
+                                      pages_done=100, pages_total=100, unit='percent'))
+        return {
+            'success': True,
+            'kind': kind,
+            'duration_seconds': duration,
+            'file_size': os.path.getsize(scratch),
+            'records_count': records_count,
+            'message': f'النسخة {name} صالحة؛ زمن الاستعادة {duration:.2f} ثانية'
+        }
+    except Exception as e:
+        manager.write_progress(**dict(progress, state='failed', error=str(e)))
+        return {'success': False, 'error': f'فشل التحقق من النسخة {name}: {e}'}
+    finally:
+        if scratch and os.path.exists(scratch):
+            os.remove(scratch)
+
+
+def restore_backup(manager, name):
+    """استبدال بيانات قاعدة البيانات الحالية بمحتوى نسخة احتياطية
+
+    تُبنى النسخة وتُفحص في ملف مؤقت أولاً، وتُؤخذ نسخة أمان من القاعدة الحالية،
+    ثم يُنسخ الملف المؤقت إلى القاعدة الحالية بواجهة SQLite للنسخ (معاملة واحدة
+    تراها كل العمليات المتصلة فوراً) بدلاً من استبدال الملف تحت الاتصالات المفتوحة.
+    """
+    progress = {'state': 'running', 'phase': 'load', 'backup_type': 'restore',
+                'backup_file': name, 'started_at': datetime.now().isoformat()}
+    scratch = None
+    started = time.monotonic()
+    try:
+        scratch = _scratch_path(manager.backup_dir)
+        report = _progress_reporter(manager, progress)
+        kind = build_database(manager, name, scratch, report)
+        report('verify', 1, 1)
+        records_count = check_database(scratch)
+
+        report('safety_backup', 0, 1)
+        safety = manager.create_database_backup()
+        if not safety.get('success'):
+            raise RestoreError(f'تعذر أخذ نسخة أمان قبل الاستعادة: {safety.get("error")}')
+
+        # جدول الموظفين يُستبدل أيضاً: الهويات المخزنة في الجلسات تُقرأ من جديد
+        versions = {name: get_cache_version(name) for name in (CATALOG, SETTINGS, PRINCIPALS)}
+        db.session.remove()
+
+        report('apply', 0, 1)
+        _carry_over_tables(scratch, manager.database_path())
+        live = sqlite3.connect(manager.database_path(), timeout=30)
+        src = sqlite3.connect(scratch)
+        try:
+            src.backup(live)
+        finally:
+            src.close()
+            live.close()
+        # اتصالات المجمع قد تحمل حالة من الملف القديم
+        db.engine.dispose()
+
+        # جداول/فهارس أحدث من النسخة، وإبطال ذاكرة الكتالوج والإعدادات والهويات في كل العمليات
+        if not upgrade_schema():
+            # ملفات التصدير الأقدم من جدول order_addons تحمل الإضافات في عمود JSON فقط
+            converted = backfill_order_addons()
+            # التجميعات مشتقة من الطلبات: ملفات التصدير والنسخ الأقدم لا تحتويها
+            if converted or rollups_missing():
+                rebuild_rollups()
+        for cache_name, version in versions.items():
+            restored = get_cache_version(cache_name)
+            result = db.session.execute(
+                update(CacheVersion).where(CacheVersion.name == cache_name)
+                .values(version=max(version, restored) + 1))
+            if result.rowcount == 0:
+                db.session.add(CacheVersion(name=cache_name, version=max(version, restored) + 1))
+        db.session.commit()
+
+        duration = round(time.monotonic() - started, 3)
+        manager.write_progress(**dict(progress, state='done', phase='done',
+                                      pages_done=100, pages_total=100, unit='percent'))
+        message = f'تمت استعادة النسخة {name} في {duration:.2f} ثانية؛ نسخة الأمان: {safety["backup_file"]}'
+        if kind == 'export':
+            # كلمات المرور نُقلت من الموظفين الحاليين؛ الباقون يحتاجون كلمة مرور جديدة من صفحة الموظفين
+            without_password = db.session.execute(
+                select(func.count(Employee.id)).where(Employee.password == UNUSABLE_PASSWORD)).scalar()
+            if without_password:
+                message += (f'. {without_password} موظف غير موجود في القاعدة الحالية بدون كلمة مرور: '
+                            'عيّنها من صفحة الموظفين')
+        return {
+            'success': True,
+            'kind': kind,
+            'duration_seconds': duration,
+            'records_count': records_count,
+            'safety_backup': safety['backup_file'],
+            'message': message
+        }
+    except Exception as e:
+        db.session.rollback()
+        manager.write_progress(**dict(progress, state='failed', error=str(e)))
+        return {'success': False, 'error': f'فشلت استعادة النسخة {name}: {e}'}
+    finally:
+        if scratch and os.path.exists(scratch):
+            os.remove(scratch)
+
+
+@app.cli.command('validate-backup')
+@click.argument('name')
+def validate_backup_command(name):
+    """Restore a backup (file name or snapshot id) into a scratch file and report the time."""
+    result = validate_backup(BackupManager(), name)
+    if not result['success']:
+        raise click.ClickException(result['error'])
+    print(result['message'])
+    for table, count in result['records_count'].items():
+        print(f'  {table}: {count}')
+
+
+@app.cli.command('restore-backup')
+@click.argument('name')
+@click.option('--target', help='Build into this new database file instead of replacing the live database.')
+def restore_backup_command(name, target):
+    """Restore a backup (file name or snapshot id) into the live database or a new file."""
+    manager = BackupManager()
+    if target:
+        if os.path.exists(target):
+            raise click.ClickException(f'{target} already exists')
+        started = time.monotonic()
+        try:
+            build_database(manager, name, target)
+            records_count = check_database(target)
+        except Exception:
+            if os.path.exists(target):
+                os.remove(target)
+            raise
+        print(f'Restored {name} into {target} in {time.monotonic() - started:.2f}s')
+        for table, count in records_count.items():
+            print(f'  {table}: {count}')
+        return
+    result = restore_backup(manager, name)
+    if not result['success']:
+        raise click.ClickException(result['error'])
+    print(result['message'])
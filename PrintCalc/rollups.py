@@ -0,0 +1,230 @@
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from sqlalchemy import select, delete, func, true
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app import app, db
+from models import (AcademicYear, Subject, Book, PrintingPrice, AddOn, Order, OrderItem, OrderAddon,
+                    DailySales, DailyAddonSales, DailyOrderStats)
+from utils import convert_utc_to_cairo, get_current_cairo_time
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_BATCH_SIZE = 5000
+
+SALES_COLUMNS = ('order_lines', 'copies', 'pages', 'revenue',
+                 'completed_copies', 'completed_pages', 'completed_revenue')
+ORDER_COLUMNS = ('orders', 'revenue', 'addons_revenue', 'completed_orders', 'completed_revenue')
+ADDON_COLUMNS = ('orders', 'revenue')
+
+
+def cairo_day(utc_datetime):
+    """اليوم (بتوقيت القاهرة) الذي يُحسب فيه وقت UTC مخزن"""
+    return convert_utc_to_cairo(utc_datetime).date()
+
+
+class _RollupDelta:
+    """فروق التجميعات في الذاكرة؛ تُكتب بعملية upsert مجمّعة واحدة لكل جدول"""
+
+    def __init__(self):
+        self.sales = defaultdict(lambda: dict.fromkeys(SALES_COLUMNS, 0))
+        self.sales_dims = {}
+        self.addons = defaultdict(lambda: dict.fromkeys(ADDON_COLUMNS, 0))
+        self.orders = defaultdict(lambda: dict.fromkeys(ORDER_COLUMNS, 0))
+
+    def collect(self, condition, completed=False, sign=1):
+        """إضافة (أو طرح) الطلبات المطابقة للشرط: يوم الإنشاء، أو يوم الإكمال إذا completed"""
+        day_column = Order.completed_at if completed else Order.created_at
+        prefix = 'completed_' if completed else ''
+        condition = condition & day_column.isnot(None)
+
+        items_total = defaultdict(float)
+        rows = db.session.execute(
+            select(Order.id, day_column.label('at'), Order.printing_type_id,
+                   OrderItem.book_id, OrderItem.quantity, OrderItem.total_cost,
+                   Book.page_count, Book.subject_id, Subject.year_id)
+            .join(OrderItem, OrderItem.order_id == Order.id)
+            .outerjoin(Book, Book.id == OrderItem.book_id)
+            .outerjoin(Subject, Subject.id == Book.subject_id)
+            .where(condition)
+            .execution_options(yield_per=ROLLUP_BATCH_SIZE)
+        )
+        for row in rows:
+            key = (cairo_day(row.at), row.book_id, row.printing_type_id or 0)
+            values = self.sales[key]
+            if not completed:
+                values['order_lines'] += sign
+            values[prefix + 'copies'] += sign * row.quantity
+            values[prefix + 'pages'] += sign * row.quantity * (row.page_count or 0)
+            values[prefix + 'revenue'] += sign * row.total_cost
+            self.sales_dims[key] = (row.subject_id, row.year_id)
+            items_total[row.id] += row.total_cost
+
+        rows = db.session.execute(
+            select(Order.id, day_column.label('at'), Order.total_cost)
+            .where(condition)
+            .execution_options(yield_per=ROLLUP_BATCH_SIZE)
+        )
+        for row in rows:
+            values = self.orders[cairo_day(row.at)]
+            values[prefix + 'orders'] += sign
+            values[prefix + 'revenue'] += sign * row.total_cost
+            if not completed:
+                values['addons_revenue'] += sign * (row.total_cost - items_total.get(row.id, 0))
+
+        if completed:
+            return
+        rows = db.session.execute(
+            select(day_column.label('at'), OrderAddon.addon_id, OrderAddon.price)
+            .join(Order, Order.id == OrderAddon.order_id)
+            .where(condition)
+            .execution_options(yield_per=ROLLUP_BATCH_SIZE)
+        )
+        for row in rows:
+            values = self.addons[(cairo_day(row.at), row.addon_id)]
+            values['orders'] += sign
+            values['revenue'] += sign * row.price
+
+    def write(self):
+        """كتابة الفروق (بدون commit): INSERT ... ON CONFLICT DO UPDATE يجمع على الموجود"""
+        _upsert(DailySales, ('day', 'book_id', 'printing_type_id'), SALES_COLUMNS, [
+            dict(values, day=day, book_id=book_id, printing_type_id=printing_type_id,
+                 subject_id=self.sales_dims[(day, book_id, printing_type_id)][0],
+                 year_id=self.sales_dims[(day, book_id, printing_type_id)][1])
+            for (day, book_id, printing_type_id), values in self.sales.items()
+        ], dims=('subject_id', 'year_id'))
+        _upsert(DailyAddonSales, ('day', 'addon_id'), ADDON_COLUMNS, [
+            dict(values, day=day, addon_id=addon_id)
+            for (day, addon_id), values in self.addons.items() if values['orders']
+        ])
+        _upsert(DailyOrderStats, ('day',), ORDER_COLUMNS, [
+            dict(values, day=day) for day, values in self.orders.items()
+        ])
+
+
+def _upsert(model, keys, columns, rows, dims=()):
+    if not rows:
+        return
+    table = model.__table__
+    stmt = sqlite_insert(table)
+    set_ = {column: table.c[column] + stmt.excluded[column] for column in columns}
+    # الكتاب قد ينتقل لمادة أخرى: الصف يحتفظ بالمادة/السنة وقت أول بيع في اليوم
+    set_.update({column: func.coalesce(table.c[column], stmt.excluded[column]) for column in dims})
+    db.session.execute(stmt.on_conflict_do_update(index_elements=list(keys), set_=set_), rows)
+
+
+def record_orders_created(order_ids):
+    """تحديث التجميعات بطلبات جديدة (داخل معاملة إنشاء الطلب)"""
+    delta = _RollupDelta()
+    delta.collect(Order.id.in_(order_ids))
+    delta.write()
+
+
+def record_orders_completed(order_ids, sign=1):
+    """تحديث تجميعات الإكمال؛ sign=-1 عند إرجاع طلب مكتمل لحالة أخرى (قبل تغيير completed_at)"""
+    delta = _RollupDelta()
+    delta.collect(Order.id.in_(order_ids), completed=True, sign=sign)
+    delta.write()
+
+
+def rebuild_rollups():
+    """إعادة بناء كل التجميعات من الطلبات (أول تشغيل، بعد الاستعادة، أو للمطابقة)"""
+    # الحذف أولاً يحجز قفل الكتابة، فلا تُضاف طلبات أثناء القراءة
+    for model in (DailySales, DailyAddonSales, DailyOrderStats):
+        db.session.execute(delete(model))
+    delta = _RollupDelta()
+    delta.collect(true())
+    delta.collect(Order.status == 'completed', completed=True)
+    delta.write()
+    db.session.commit()
+    result = {'days': len(delta.orders), 'sales_rows': len(delta.sales), 'addon_rows': len(delta.addons)}
+    logger.info('Rebuilt reporting rollups: %s', result)
+    return result
+
+
+def rollups_missing():
+    """هل توجد طلبات بدون أي تجميعات (قاعدة بيانات أقدم من جداول التقارير)؟"""
+    has_orders = db.session.execute(select(Order.id).limit(1)).first() is not None
+    has_rollups = db.session.execute(select(DailyOrderStats.day).limit(1)).first() is not None
+    return has_orders and not has_rollups
+
+
+def _display_name(names, item_id):
+    if not item_id:
+        return 'غير محدد'
+    # عناصر حُذفت من الكتالوج تبقى في التقارير برقمها
+    return names.get(item_id) or f'#{item_id}'
+
+
+def default_report_range(days=30):
+    end = get_current_cairo_time().date()
+    return end - timedelta(days=days - 1), end
+
+
+def get_report(start, end):
+    """تقرير الفترة [start, end] من جداول التجميع فقط (والأسماء من جداول الكتالوج الصغيرة)"""
+    def in_range(model):
+        return model.day.between(start, end)
+
+    daily = {row.day: dict(row._mapping, copies=0, pages=0) for row in db.session.execute(
+        select(*DailyOrderStats.__table__.c).where(in_range(DailyOrderStats))
+    )}
+    for day, copies, pages in db.session.execute(
+        select(DailySales.day, func.sum(DailySales.copies), func.sum(DailySales.pages))
+        .where(in_range(DailySales)).group_by(DailySales.day)
+    ):
+        row = daily.setdefault(day, dict(dict.fromkeys(ORDER_COLUMNS, 0), day=day, copies=0, pages=0))
+        row['copies'] = copies
+        row['pages'] = pages
+
+    totals = dict.fromkeys(ORDER_COLUMNS + ('copies', 'pages'), 0)
+    for row in daily.values():
+        for column in totals:
+            totals[column] += row[column]
+
+    def breakdown(column, names):
+        rows = db.session.execute(
+            select(column,
+                   func.sum(DailySales.copies).label('copies'),
+                   func.sum(DailySales.pages).label('pages'),
+                   func.sum(DailySales.revenue).label('revenue'),
+                   func.sum(DailySales.completed_copies).label('completed_copies'))
+            .where(in_range(DailySales))
+            .group_by(column)
+            .order_by(func.sum(DailySales.revenue).desc())
+        )
+        return [dict(row._mapping, id=row[0], name=_display_name(names, row[0])) for row in rows]
+
+    def names_of(model):
+        return dict(db.session.execute(select(model.id, model.name)).all())
+
+    addon_names = names_of(AddOn)
+    addons = [
+        {'id': addon_id, 'name': _display_name(addon_names, addon_id), 'orders': orders, 'revenue': revenue}
+        for addon_id, orders, revenue in db.session.execute(
+            select(DailyAddonSales.addon_id, func.sum(DailyAddonSales.orders), func.sum(DailyAddonSales.revenue))
+            .where(in_range(DailyAddonSales))
+            .group_by(DailyAddonSales.addon_id)
+            .order_by(func.sum(DailyAddonSales.orders).desc())
+        )
+    ]
+
+    return {
+        'start': start,
+        'end': end,
+        'totals': totals,
+        'daily': [daily[day] for day in sorted(daily)],
+        'books': breakdown(DailySales.book_id, names_of(Book)),
+        'subjects': breakdown(DailySales.subject_id, names_of(Subject)),
+        'years': breakdown(DailySales.year_id, names_of(AcademicYear)),
+        'printing_types': breakdown(DailySales.printing_type_id, names_of(PrintingPrice)),
+        'addons': addons,
+    }
+
+
+@app.cli.command('backfill-rollups')
+def backfill_rollups_command():
+    """Rebuild the daily reporting rollups from the orders tables."""
+    result = rebuild_rollups()
+    print(f"Rebuilt rollups: {result['days']} days, {result['sales_rows']} book rows, "
+          f"{result['addon_rows']} add-on rows")
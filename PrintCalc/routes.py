@@ -1,28 +1,57 @@
-import math
-import json
-import qrcode
-import io
-import base64
-from datetime import datetime
-from flask import render_template, request, redirect, url_for, flash, jsonify, session
+import hashlib
+from datetime import date, datetime
+from flask import render_template, request, redirect, url_for, flash, jsonify, session, abort, make_response
 from functools import wraps
+from sqlalchemy import update
+from sqlalchemy.orm import joinedload, selectinload, contains_eager
 from app import app, db
-from models import AcademicYear, Subject, Book, PrintingPrice, AddOn, Employee, Order, OrderItem
+from models import AcademicYear, Subject, Book, PrintingPrice, AddOn, Employee, Order, OrderItem, Job, ROLE_ADMIN
+from auth import current_principal, is_admin, login_principal, logout_principal, invalidate_principals
 from werkzeug.security import check_password_hash, generate_password_hash
 from backup_manager import BackupManager
+from backup_scheduler import backup_scheduler
+from job_queue import enqueue, job_to_dict, job_message, JOB_STATUSES
 from utils import get_current_cairo_time
+from catalog_cache import catalog_cache, bump_cache_version, get_cache_version, CATALOG, SETTINGS
+from catalog_api import catalog_api, parse_catalog_params, catalog_etag, CATALOG_RESOURCES, CatalogApiError
+from catalog_search import catalog_search
+from pricing import pricing_engine, PricingError
+from cart_store import cart_store, CartTooLargeError
+from counters import get_counters, adjust_counter, move_order_status, order_status_counter
+from pagination import keyset_paginate
+from query_budget import query_budget
+from sql_metrics import get_route_stats, get_slow_queries
+from qr_codes import qr_cache, qr_etag, QR_FORMATS
+from page_cache import order_page_cache
+from order_numbers import canonical_order_number, migrated_order_number, migrated_order_numbers
+from order_addons import record_order_addons
+from rollups import record_orders_created, record_orders_completed, rollups_missing, get_report, default_report_range
+from catalog_import import (read_import_file, plan_import, apply_import, has_changes,
+                            save_pending_import, load_pending_import, CatalogImportError)
 
 # Admin credentials
 ADMIN_USERNAME = "admin"
 ADMIN_PASSWORD = "admin123"
 
+def _login_redirect():
+    """Redirect to the login page unless an active employee is logged in"""
+    principal = current_principal()
+    if principal and principal['active']:
+        return None
+    logout_principal()
+    if principal:
+        flash('تم إيقاف هذا الحساب. يرجى التواصل مع المدير.', 'error')
+    else:
+        flash('يجب تسجيل الدخول للوصول لهذه الصفحة', 'error')
+    return redirect(url_for('admin_login'))
+
 def admin_required(f):
-    """Decorator to require ADMIN authentication (admin user only)"""
+    """Decorator to require ADMIN authentication (admin role only)"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if not session.get('admin_logged_in'):
-            flash('يجب تسجيل الدخول للوصول لهذه الصفحة', 'error')
-            return redirect(url_for('admin_login'))
+        response = _login_redirect()
+        if response:
+            return response
         if not is_admin():
             flash('ليس لديك صلاحية للوصول لهذه الصفحة. مخصصة للمدير فقط.', 'error')
             return redirect(url_for('employee_dashboard'))
@@ -33,31 +62,16 @@ def employee_required(f):
     """Decorator to require any employee authentication (admin or employee)"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if not session.get('admin_logged_in'):
-            flash('يجب تسجيل الدخول للوصول لهذه الصفحة', 'error')
-            return redirect(url_for('admin_login'))
-        return f(*args, **kwargs)
+        return _login_redirect() or f(*args, **kwargs)
     return decorated_function
 
 def login_required(f):
     """Decorator to require any authentication (admin or employee)"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if not session.get('admin_logged_in'):
-            flash('يجب تسجيل الدخول للوصول لهذه الصفحة', 'error')
-            return redirect(url_for('admin_login'))
-        return f(*args, **kwargs)
+        return _login_redirect() or f(*args, **kwargs)
     return decorated_function
 
-def is_admin():
-    """Check if current user is admin"""
-    # Check if logged in and if it's admin user
-    employee_id = session.get('employee_id')
-    if employee_id:
-        employee = Employee.query.get(employee_id)
-        return employee and employee.username == 'admin'
-    return False
-
 # Main routes
 @app.route('/')
 @login_required
@@ -85,13 +99,11 @@ def admin_login():
             employee.login_count = (employee.login_count or 0) + 1
             db.session.commit()
             
-            session['admin_logged_in'] = True
-            session['employee_id'] = employee.id
-            session['employee_name'] = employee.full_name
+            login_principal(employee)
             flash(f'مرحباً {employee.full_name}، تم تسجيل الدخول بنجاح', 'success')
             
             # Redirect based on user role
-            if employee.username == 'admin':
+            if employee.role == ROLE_ADMIN:
                 return redirect(url_for('admin_dashboard'))
             else:
                 return redirect(url_for('employee_dashboard'))
@@ -103,9 +115,7 @@ def admin_login():
 @app.route('/admin/logout')
 def admin_logout():
     """Admin logout"""
-    session.pop('admin_logged_in', None)
-    session.pop('employee_id', None)
-    session.pop('employee_name', None)
+    logout_principal()
     flash('تم تسجيل الخروج بنجاح', 'success')
     return redirect(url_for('index'))
 
@@ -114,34 +124,40 @@ def admin_logout():
 @admin_required
 def admin_dashboard():
     """Admin dashboard"""
-    years_count = AcademicYear.query.count()
-    subjects_count = Subject.query.count()
-    books_count = Book.query.count()
-    
-    # Get order statistics
-    total_orders = Order.query.count()
-    new_orders = Order.query.filter_by(status='new').count()
-    in_progress_orders = Order.query.filter_by(status='in_progress').count()
-    completed_orders = Order.query.filter_by(status='completed').count()
+    # All dashboard counts come from the incrementally maintained counters table
+    counters = get_counters()
     
     # Get employee statistics
-    total_employees = Employee.query.count()
-    active_employees = Employee.query.filter_by(is_active=True).count()
     recent_employees = Employee.query.filter(Employee.last_login.isnot(None)).order_by(Employee.last_login.desc()).limit(5).all()
     
     return render_template('admin/dashboard.html', 
-                         years_count=years_count,
-                         subjects_count=subjects_count,
-                         books_count=books_count,
-                         total_orders=total_orders,
-                         new_orders=new_orders,
-                         in_progress_orders=in_progress_orders,
-                         completed_orders=completed_orders,
-                         total_employees=total_employees,
-                         active_employees=active_employees,
+                         years_count=counters['years'],
+                         subjects_count=counters['subjects'],
+                         books_count=counters['books'],
+                         total_orders=counters['orders_total'],
+                         new_orders=counters['orders_new'],
+                         in_progress_orders=counters['orders_in_progress'],
+                         completed_orders=counters['orders_completed'],
+                         total_employees=counters['employees_total'],
+                         active_employees=counters['employees_active'],
                          recent_employees=recent_employees,
                          employee_name=session.get('employee_name', 'الموظف'))
 
+@app.route('/admin/cache/stats')
+@admin_required
+def admin_cache_stats():
+    """Catalog cache hit/miss/rebuild counters for this worker"""
+    return jsonify(catalog_cache.get_stats())
+
+@app.route('/admin/db-stats')
+@admin_required
+def admin_db_stats():
+    """Worst routes by DB time and recent slow queries for this worker"""
+    return render_template('admin/db_stats.html',
+                         route_stats=get_route_stats(),
+                         slow_queries=get_slow_queries(),
+                         slow_threshold=app.config.get('SQL_SLOW_QUERY_MS'))
+
 @app.route('/admin/years')
 @admin_required
 def admin_years():
@@ -159,6 +175,8 @@ def add_year():
     if name:
         year = AcademicYear(name=name, description=description)
         db.session.add(year)
+        adjust_counter('years', 1)
+        bump_cache_version(CATALOG)
         db.session.commit()
         flash('تم إضافة السنة الدراسية بنجاح', 'success')
     else:
@@ -176,6 +194,7 @@ def edit_year(year_id):
     year.description = request.form.get('description', year.description)
     year.is_active = request.form.get('is_active') == 'on'
     
+    bump_cache_version(CATALOG)
     db.session.commit()
     flash('تم تحديث السنة الدراسية بنجاح', 'success')
     
@@ -186,7 +205,12 @@ def edit_year(year_id):
 def delete_year(year_id):
     """Delete academic year"""
     year = AcademicYear.query.get_or_404(year_id)
+    # Subjects and books are removed with the year (cascade)
+    adjust_counter('years', -1)
+    adjust_counter('subjects', -len(year.subjects))
+    adjust_counter('books', -sum(len(subject.books) for subject in year.subjects))
     db.session.delete(year)
+    bump_cache_version(CATALOG)
     db.session.commit()
     flash('تم حذف السنة الدراسية بنجاح', 'success')
     
@@ -211,6 +235,8 @@ def add_subject():
     if name and year_id:
         subject = Subject(name=name, description=description, year_id=year_id)
         db.session.add(subject)
+        adjust_counter('subjects', 1)
+        bump_cache_version(CATALOG)
         db.session.commit()
         flash('تم إضافة المادة بنجاح', 'success')
     else:
@@ -229,6 +255,7 @@ def edit_subject(subject_id):
     subject.year_id = request.form.get('year_id', subject.year_id)
     subject.is_active = request.form.get('is_active') == 'on'
     
+    bump_cache_version(CATALOG)
     db.session.commit()
     flash('تم تحديث المادة بنجاح', 'success')
     
@@ -239,7 +266,11 @@ def edit_subject(subject_id):
 def delete_subject(subject_id):
     """Delete subject"""
     subject = Subject.query.get_or_404(subject_id)
+    # Books are removed with the subject (cascade)
+    adjust_counter('subjects', -1)
+    adjust_counter('books', -len(subject.books))
     db.session.delete(subject)
+    bump_cache_version(CATALOG)
     db.session.commit()
     flash('تم حذف المادة بنجاح', 'success')
     
@@ -249,9 +280,12 @@ def delete_subject(subject_id):
 @admin_required
 def admin_books():
     """Manage books"""
-    books = Book.query.join(Subject).join(AcademicYear).all()
-    subjects = Subject.query.filter_by(is_active=True).all()
-    return render_template('admin/books.html', books=books, subjects=subjects)
+    # The page body is a cached fragment: these queries only run when it is re-rendered
+    books = (Book.query.join(Subject).join(AcademicYear)
+             .options(contains_eager(Book.subject).contains_eager(Subject.academic_year)))
+    subjects = Subject.query.filter_by(is_active=True).options(joinedload(Subject.academic_year))
+    return render_template('admin/books.html', books_query=books, subjects_query=subjects,
+                           catalog_version=get_cache_version(CATALOG))
 
 @app.route('/admin/books/add', methods=['POST'])
 @admin_required
@@ -268,6 +302,8 @@ def add_book():
             if page_count > 0:
                 book = Book(name=name, page_count=page_count, description=description, subject_id=subject_id)
                 db.session.add(book)
+                adjust_counter('books', 1)
+                bump_cache_version(CATALOG)
                 db.session.commit()
                 flash('تم إضافة الكتاب بنجاح', 'success')
             else:
@@ -302,6 +338,7 @@ def edit_book(book_id):
     book.subject_id = request.form.get('subject_id', book.subject_id)
     book.is_active = request.form.get('is_active') == 'on'
     
+    bump_cache_version(CATALOG)
     db.session.commit()
     flash('تم تحديث الكتاب بنجاح', 'success')
     
@@ -312,19 +349,65 @@ def edit_book(book_id):
 def delete_book(book_id):
     """Delete book"""
     book = Book.query.get_or_404(book_id)
+    adjust_counter('books', -1)
     db.session.delete(book)
+    bump_cache_version(CATALOG)
     db.session.commit()
     flash('تم حذف الكتاب بنجاح', 'success')
     
     return redirect(url_for('admin_books'))
 
+@app.route('/admin/catalog/import')
+@admin_required
+def catalog_import():
+    """Upload a CSV/XLSX file of years, subjects and books"""
+    return render_template('admin/catalog_import.html', plan=None)
+
+@app.route('/admin/catalog/import/preview', methods=['POST'])
+@admin_required
+def catalog_import_preview():
+    """Dry run: show what the uploaded file would change without writing anything"""
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        flash('يرجى اختيار ملف للاستيراد', 'error')
+        return redirect(url_for('catalog_import'))
+    try:
+        rows = read_import_file(upload.filename, upload.read())
+    except CatalogImportError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('catalog_import'))
+
+    plan = plan_import(rows)
+    db.session.rollback()
+    if has_changes(plan) and not plan['errors']:
+        session['catalog_import'] = save_pending_import(rows)
+    else:
+        session.pop('catalog_import', None)
+    return render_template('admin/catalog_import.html', plan=plan, filename=upload.filename)
+
+@app.route('/admin/catalog/import/apply', methods=['POST'])
+@admin_required
+def catalog_import_apply():
+    """Apply the previewed import in a single transaction"""
+    rows = load_pending_import(session.pop('catalog_import', None))
+    if rows is None:
+        flash('انتهت صلاحية المعاينة، يرجى رفع الملف مرة أخرى', 'error')
+        return redirect(url_for('catalog_import'))
+
+    result = apply_import(rows)
+    if result['success']:
+        flash(f"تم الاستيراد: {len(result['new_years'])} سنة، {len(result['new_subjects'])} مادة، "
+              f"{len(result['new_books'])} كتاب جديد، و{len(result['updated_books'])} كتاب محدّث", 'success')
+        return redirect(url_for('admin_books'))
+    flash(f"فشل الاستيراد: {result['error']}", 'error')
+    return redirect(url_for('catalog_import'))
+
 @app.route('/admin/settings')
 @admin_required
 def admin_settings():
     """Manage printing prices and add-ons"""
-    printing_prices = PrintingPrice.query.all()
-    addons = AddOn.query.all()
-    return render_template('admin/settings.html', printing_prices=printing_prices, addons=addons)
+    return render_template('admin/settings.html', printing_prices_query=PrintingPrice.query,
+                           addons_query=AddOn.query, settings_version=get_cache_version(SETTINGS))
 
 @app.route('/admin/settings/printing-price/add', methods=['POST'])
 @admin_required
@@ -347,6 +430,7 @@ def add_printing_price():
                 description=description
             )
             db.session.add(printing_price)
+            bump_cache_version(SETTINGS)
             db.session.commit()
             flash('تم إضافة نوع الطباعة بنجاح', 'success')
         except ValueError:
@@ -374,6 +458,7 @@ def edit_printing_price(price_id):
     printing_price.description = request.form.get('description', printing_price.description)
     printing_price.is_active = request.form.get('is_active') == 'on'
     
+    bump_cache_version(SETTINGS)
     db.session.commit()
     flash('تم تحديث نوع الطباعة بنجاح', 'success')
     
@@ -385,6 +470,7 @@ def delete_printing_price(price_id):
     """Delete printing price"""
     printing_price = PrintingPrice.query.get_or_404(price_id)
     db.session.delete(printing_price)
+    bump_cache_version(SETTINGS)
     db.session.commit()
     flash('تم حذف نوع الطباعة بنجاح', 'success')
     
@@ -403,6 +489,7 @@ def add_addon():
             price = float(price)
             addon = AddOn(name=name, price=price, description=description)
             db.session.add(addon)
+            bump_cache_version(SETTINGS)
             db.session.commit()
             flash('تم إضافة الإضافة بنجاح', 'success')
         except ValueError:
@@ -429,6 +516,7 @@ def edit_addon(addon_id):
     addon.description = request.form.get('description', addon.description)
     addon.is_active = request.form.get('is_active') == 'on'
     
+    bump_cache_version(SETTINGS)
     db.session.commit()
     flash('تم تحديث الإضافة بنجاح', 'success')
     
@@ -440,6 +528,7 @@ def delete_addon(addon_id):
     """Delete add-on"""
     addon = AddOn.query.get_or_404(addon_id)
     db.session.delete(addon)
+    bump_cache_version(SETTINGS)
     db.session.commit()
     flash('تم حذف الإضافة بنجاح', 'success')
     
@@ -468,30 +557,42 @@ def user_select_books():
     # Allow both admin and employees to access cost calculation
     # (This is now allowed for all logged-in users)
     
-    # Initialize cart if not exists
-    if 'cart' not in session:
-        session['cart'] = []
-    
-    years = AcademicYear.query.filter_by(is_active=True).all()
-    years_with_books = []
-    
-    for year in years:
-        subjects = Subject.query.filter_by(year_id=year.id, is_active=True).all()
-        year_books = []
-        for subject in subjects:
-            books = Book.query.filter_by(subject_id=subject.id, is_active=True).all()
-            for book in books:
-                book.subject_name = subject.name
-                book.year_name = year.name
-                year_books.append(book)
-        
-        if year_books:
-            years_with_books.append({
-                'year': year,
-                'books': year_books
-            })
-    
-    return render_template('user/select_books.html', years_with_books=years_with_books)
+    cart = cart_store.get_cart()
+    
+    # Read the year → subject → book tree from the in-memory catalog snapshot
+    snapshot = catalog_cache.get()
+    cart_ids = {item['id'] for item in cart}
+    # Each year's card is a cached fragment keyed on the cart books it shows as added
+    cart_ids_by_year = {}
+    for book_id in sorted(cart_ids):
+        book = snapshot.book(book_id)
+        if book:
+            cart_ids_by_year[book['year_id']] = cart_ids_by_year.get(book['year_id'], ()) + (book_id,)
+    
+    return render_template('user/select_books.html', years_with_books=snapshot.years_with_books(),
+                           cart=cart, cart_ids=cart_ids, cart_ids_by_year=cart_ids_by_year,
+                           catalog_version=snapshot.version)
+
+@app.route('/api/books/search')
+@login_required
+def search_books():
+    """Search active books by book, subject and year name (Arabic-normalized, prefix and fuzzy)"""
+    query = request.args.get('q', '').strip()
+    limit = request.args.get('limit', 20, type=int)
+    results = catalog_search.search(query, limit) if query else []
+    cart_ids = {item['id'] for item in cart_store.get_cart()}
+    return jsonify({
+        'query': query,
+        'results': [{
+            'id': book['id'],
+            'name': book['name'],
+            'page_count': book['page_count'],
+            'subject_name': book['subject_name'],
+            'year_name': book['year_name'],
+            'in_cart': book['id'] in cart_ids,
+            'add_url': url_for('add_to_cart', book_id=book['id'])
+        } for book in results]
+    })
 
 @app.route('/cart/add/<int:book_id>')
 @login_required
@@ -501,37 +602,42 @@ def add_to_cart(book_id):
         flash('ليس لديك صلاحية لإضافة الكتب. يرجى التواصل مع المدير.', 'error')
         return redirect(url_for('admin_login'))
     
-    book = Book.query.get_or_404(book_id)
+    book = catalog_cache.get().book(book_id)
+    if book is None:
+        abort(404)
     
-    if 'cart' not in session:
-        session['cart'] = []
+    cart = cart_store.get_cart()
     
     # Check if book already in cart, if yes increase quantity
-    for item in session['cart']:
+    for item in cart:
         if item['id'] == book_id:
             # Handle old cart items that don't have quantity field
             if 'quantity' not in item:
                 item['quantity'] = 1
             item['quantity'] += 1
-            session.modified = True
-            flash(f'تم زيادة كمية كتاب {book.name} (الكمية: {item["quantity"]})', 'success')
+            cart_store.save_cart(cart)
+            db.session.commit()
+            flash(f'تم زيادة كمية كتاب {book["name"]} (الكمية: {item["quantity"]})', 'success')
             return redirect(url_for('user_select_books'))
     
     # Add new book to cart
-    subject = Subject.query.get(book.subject_id)
-    year = AcademicYear.query.get(subject.year_id)
-    
-    session['cart'].append({
+    cart.append({
         'id': book_id,
-        'name': book.name,
-        'pages': book.page_count,
-        'subject_name': subject.name,
-        'year_name': year.name,
+        'name': book['name'],
+        'pages': book['page_count'],
+        'subject_name': book['subject_name'],
+        'year_name': book['year_name'],
         'quantity': 1
     })
-    session.modified = True
+    try:
+        cart_store.save_cart(cart)
+    except CartTooLargeError as e:
+        db.session.rollback()
+        flash(str(e), 'error')
+        return redirect(url_for('user_select_books'))
+    db.session.commit()
     
-    flash(f'تم إضافة كتاب {book.name} للسلة', 'success')
+    flash(f'تم إضافة كتاب {book["name"]} للسلة', 'success')
     return redirect(url_for('user_select_books'))
 
 @app.route('/cart/remove/<int:book_id>')
@@ -542,9 +648,10 @@ def remove_from_cart(book_id):
         flash('ليس لديك صلاحية لحذف الكتب. يرجى التواصل مع المدير.', 'error')
         return redirect(url_for('admin_login'))
     
-    if 'cart' in session:
-        session['cart'] = [item for item in session['cart'] if item['id'] != book_id]
-        session.modified = True
+    cart = cart_store.get_cart()
+    if cart:
+        cart_store.save_cart([item for item in cart if item['id'] != book_id])
+        db.session.commit()
         flash('تم حذف الكتاب من السلة', 'success')
     
     return redirect(url_for('view_cart'))
@@ -555,105 +662,59 @@ def view_cart():
     """View cart and calculate total cost - admin and employees"""
     # Allow both admin and employees to view cart for cost calculation
     
-    if 'cart' not in session or not session['cart']:
+    cart = cart_store.get_cart()
+    if not cart:
         flash('السلة فارغة', 'info')
         return redirect(url_for('user_select_books'))
     
-    printing_prices = PrintingPrice.query.filter_by(is_active=True).all()
-    addons = AddOn.query.filter_by(is_active=True).all()
+    tables = pricing_engine.get_tables()
     
     return render_template('user/cart.html', 
-                         cart=session['cart'],
-                         printing_prices=printing_prices,
-                         addons=addons)
+                         cart=cart,
+                         printing_prices=tables.printing_prices.values(),
+                         addons=tables.addons.values())
 
 @app.route('/cart/calculate', methods=['POST'])
 def calculate_cart_cost():
     """Calculate total cost for all books in cart"""
-    if 'cart' not in session or not session['cart']:
+    cart = cart_store.get_cart()
+    if not cart:
         flash('السلة فارغة', 'error')
         return redirect(url_for('user_select_books'))
     
     printing_price_id = request.form.get('printing_price_id')
     selected_addons = request.form.getlist('addons')
     
-    printing_price = PrintingPrice.query.get_or_404(printing_price_id)
-    
-    # Calculate cost for each book
-    books_details = []
-    total_printing_cost = 0
-    
-    for cart_item in session['cart']:
-        book = Book.query.get(cart_item['id'])
-        quantity = cart_item.get('quantity', 1)
-        units_needed = math.ceil(book.page_count / printing_price.pages_per_unit)
-        printing_cost_per_copy = units_needed * printing_price.price_per_unit
-        total_printing_cost_for_item = printing_cost_per_copy * quantity
-        total_printing_cost += total_printing_cost_for_item
-        
-        books_details.append({
-            'id': book.id,
-            'name': book.name,
-            'pages': book.page_count,
-            'quantity': quantity,
-            'units_needed': units_needed,
-            'printing_cost_per_copy': printing_cost_per_copy,
-            'total_printing_cost': total_printing_cost_for_item,
-            'subject_name': cart_item['subject_name'],
-            'year_name': cart_item['year_name']
-        })
-    
-    # Calculate add-ons cost
-    addons_cost = 0
-    selected_addon_objects = []
-    if selected_addons:
-        selected_addon_objects = AddOn.query.filter(AddOn.id.in_(selected_addons)).all()
-        addons_cost = sum(addon.price for addon in selected_addon_objects)
-    
-    # Total cost
-    total_cost = total_printing_cost + addons_cost
-    
-    calculation_details = {
-        'books_details': books_details,
-        'printing_price': {
-            'id': printing_price.id,
-            'name': printing_price.name,
-            'price_per_unit': printing_price.price_per_unit,
-            'pages_per_unit': printing_price.pages_per_unit,
-            'description': printing_price.description
-        },
-        'total_printing_cost': total_printing_cost,
-        'selected_addons': [
-            {
-                'id': addon.id,
-                'name': addon.name,
-                'price': addon.price,
-                'description': addon.description
-            } for addon in selected_addon_objects
-        ],
-        'addons_cost': addons_cost,
-        'total_cost': total_cost
-    }
+    # Price every cart line in one pass against the cached price tables
+    try:
+        calculation_details = pricing_engine.price_cart(cart, printing_price_id, selected_addons)
+    except PricingError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('view_cart'))
     
-    # Store calculation in session for invoice printing
-    session['last_calculation'] = calculation_details
-    session.modified = True
+    # Store calculation server-side for invoice printing
+    try:
+        cart_store.save_calculation(calculation_details)
+    except CartTooLargeError as e:
+        db.session.rollback()
+        flash(str(e), 'error')
+        return redirect(url_for('view_cart'))
+    db.session.commit()
     
-    printing_prices = PrintingPrice.query.filter_by(is_active=True).all()
-    addons = AddOn.query.filter_by(is_active=True).all()
+    tables = pricing_engine.get_tables()
     
     return render_template('user/cart.html', 
-                         cart=session['cart'],
-                         printing_prices=printing_prices,
-                         addons=addons,
+                         cart=cart,
+                         printing_prices=tables.printing_prices.values(),
+                         addons=tables.addons.values(),
                          calculation=calculation_details)
 
 @app.route('/invoice/print', methods=['POST'])
 def print_invoice():
     """Generate printable invoice"""
     
-    # Get calculation data from session
-    calculation_data = session.get('last_calculation')
+    # Get calculation data from the server-side cart store
+    calculation_data = cart_store.get_calculation()
     if not calculation_data:
         flash('لا توجد بيانات حساب. يرجى حساب التكلفة أولاً.', 'error')
         return redirect(url_for('view_cart'))
@@ -673,11 +734,11 @@ def print_invoice():
         customer_phone=customer_phone,
         total_cost=calculation_data['total_cost'],
         status='new',
-        printing_type_id=calculation_data['printing_price']['id'],
-        selected_addons=json.dumps([addon['id'] for addon in calculation_data['selected_addons']])
+        printing_type_id=calculation_data['printing_price']['id']
     )
     db.session.add(order)
     db.session.flush()  # Get the order ID
+    record_order_addons(order.id, calculation_data['selected_addons'])
     
     # Save order items
     for book_detail in calculation_data['books_details']:
@@ -690,19 +751,16 @@ def print_invoice():
         )
         db.session.add(order_item)
     
-    db.session.commit()
+    adjust_counter('orders_total', 1)
+    adjust_counter('orders_new', 1)
+    record_orders_created([order.id])
     
-    # Generate QR code for order tracking
-    qr_url = request.url_root + f"order/{order.order_number}"
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(qr_url)
-    qr.make(fit=True)
-    qr_img = qr.make_image(fill_color="black", back_color="white")
+    # Clear cart in the same transaction as the order
+    cart_store.clear()
+    db.session.commit()
     
-    # Convert QR code to base64 for embedding in HTML
-    buffer = io.BytesIO()
-    qr_img.save(buffer, format='PNG')
-    qr_base64 = base64.b64encode(buffer.getvalue()).decode()
+    # The QR code is served (and cached) separately by order_qr
+    qr_url = tracking_url_for(order.order_number)
     
     invoice_data = {
         'order_id': order.order_number,
@@ -712,15 +770,10 @@ def print_invoice():
         'amount_paid': amount_paid,
         'notes': notes,
         'calculation': calculation_data,
-        'qr_code': qr_base64,
+        'qr_code_url': url_for('order_qr', order_number=order.order_number, format='svg'),
         'tracking_url': qr_url
     }
     
-    # Clear cart after successful order
-    session.pop('cart', None)
-    session.pop('last_calculation', None)
-    session.modified = True
-    
     return render_template('user/invoice.html', invoice=invoice_data)
 
 @app.route('/user/year/<int:year_id>')
@@ -741,9 +794,10 @@ def user_select_book(subject_id):
 def user_calculate_cost(book_id):
     """User interface - calculate printing cost"""
     book = Book.query.get_or_404(book_id)
-    printing_prices = PrintingPrice.query.filter_by(is_active=True).all()
-    addons = AddOn.query.filter_by(is_active=True).all()
-    return render_template('user/calculate_cost.html', book=book, printing_prices=printing_prices, addons=addons)
+    tables = pricing_engine.get_tables()
+    return render_template('user/calculate_cost.html', book=book,
+                           printing_prices=tables.printing_prices.values(),
+                           addons=tables.addons.values())
 
 @app.route('/user/calculate', methods=['POST'])
 def calculate_cost():
@@ -753,18 +807,18 @@ def calculate_cost():
     selected_addons = request.form.getlist('addons')
     
     book = Book.query.get_or_404(book_id)
-    printing_price = PrintingPrice.query.get_or_404(printing_price_id)
+    tables = pricing_engine.get_tables()
+    try:
+        printing_price = tables.printing_price(printing_price_id)
+        selected_addon_objects = tables.addon_list(selected_addons)
+    except PricingError:
+        abort(404)
     
     # Calculate printing cost
-    units_needed = math.ceil(book.page_count / printing_price.pages_per_unit)
-    printing_cost = units_needed * printing_price.price_per_unit
+    units_needed, printing_cost, _ = pricing_engine.price_book(book.page_count, printing_price)
     
     # Calculate add-ons cost
-    addons_cost = 0
-    selected_addon_objects = []
-    if selected_addons:
-        selected_addon_objects = AddOn.query.filter(AddOn.id.in_(selected_addons)).all()
-        addons_cost = sum(addon.price for addon in selected_addon_objects)
+    addons_cost = sum(addon['price'] for addon in selected_addon_objects)
     
     # Total cost
     total_cost = printing_cost + addons_cost
@@ -781,25 +835,87 @@ def calculate_cost():
     
     return render_template('user/calculate_cost.html', 
                          book=book, 
-                         printing_prices=PrintingPrice.query.filter_by(is_active=True).all(),
-                         addons=AddOn.query.filter_by(is_active=True).all(),
+                         printing_prices=tables.printing_prices.values(),
+                         addons=tables.addons.values(),
                          calculation=calculation_details)
 
+@app.route('/api/catalog')
+@login_required
+def catalog_api_index():
+    """Catalog and settings versions, so clients can tell whether anything changed"""
+    versions = {'catalog': get_cache_version(CATALOG), 'settings': get_cache_version(SETTINGS)}
+    etag = hashlib.sha1(f"{versions['catalog']}|{versions['settings']}".encode('utf-8')).hexdigest()
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+    else:
+        response = jsonify({
+            'versions': versions,
+            'resources': {name: url_for('catalog_api_resource', resource=name) for name in CATALOG_RESOURCES}
+        })
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    response.cache_control.private = True
+    return response
+
+@app.route('/api/catalog/<resource>')
+@login_required
+def catalog_api_resource(resource):
+    """One page of active years, subjects, books, printing prices or add-ons, ordered by id"""
+    if resource not in CATALOG_RESOURCES:
+        abort(404)
+    try:
+        params = parse_catalog_params(resource, request.args)
+    except CatalogApiError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    # Revalidation costs one version lookup; the page is only built when the version moved
+    etag = catalog_etag(resource, get_cache_version(CATALOG_RESOURCES[resource][0]), params)
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+    else:
+        page = catalog_api.page(resource, params)
+        etag = catalog_etag(resource, page['version'], params)
+        response = jsonify(page)
+    
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    response.cache_control.private = True
+    return response
+
+@app.route('/api/quote', methods=['POST'])
+@login_required
+def api_quote():
+    """Price many (book, quantity, printing type, add-ons) lines in one request"""
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({'success': False, 'errors': [{'line': None, 'error': 'صيغة الطلب غير صحيحة'}]}), 400
+    result, errors = pricing_engine.quote(payload.get('lines'))
+    if errors:
+        return jsonify({'success': False, 'errors': errors}), 400
+    result['success'] = True
+    return jsonify(result)
+
 # Admin Order Management Routes
+def paginate_orders(status_filter, per_page=20):
+    """Keyset-paginate orders newest first, with the total taken from the counters table"""
+    query = Order.query
+    if status_filter != 'all':
+        query = query.filter_by(status=status_filter)
+        total = get_counters().get(order_status_counter(status_filter))
+    else:
+        total = get_counters()['orders_total']
+    
+    return keyset_paginate(query, [Order.created_at, Order.id], [datetime, int],
+                           cursor=request.args.get('cursor'),
+                           direction=request.args.get('direction', 'next'),
+                           per_page=per_page, total=total)
+
 @app.route('/admin/orders')
 @admin_required
 def admin_orders():
     """Admin orders management"""
     status_filter = request.args.get('status', 'all')
-    page = request.args.get('page', 1, type=int)
-    
-    query = Order.query
-    if status_filter != 'all':
-        query = query.filter_by(status=status_filter)
-    
-    orders = query.order_by(Order.created_at.desc()).paginate(
-        page=page, per_page=20, error_out=False
-    )
+    orders = paginate_orders(status_filter)
     
     return render_template('admin/orders.html', 
                          orders=orders, 
@@ -811,26 +927,62 @@ def admin_orders():
 def employee_orders():
     """Employee orders management - read only access"""
     status_filter = request.args.get('status', 'all')
-    page = request.args.get('page', 1, type=int)
-    
-    query = Order.query
-    if status_filter != 'all':
-        query = query.filter_by(status=status_filter)
-    
-    orders = query.order_by(Order.created_at.desc()).paginate(
-        page=page, per_page=20, error_out=False
-    )
+    orders = paginate_orders(status_filter)
     
     return render_template('employee/orders.html', 
                          orders=orders, 
                          status_filter=status_filter,
                          employee_name=session.get('employee_name', 'الموظف'))
 
+def load_order_graph(order_number):
+    """Load an order with its printing type, items and their books in two queries"""
+    return Order.query.options(
+        joinedload(Order.printing_type),
+        selectinload(Order.order_items).joinedload(OrderItem.book)
+    ).filter_by(order_number=order_number).first()
+
+def public_base_url():
+    """Configured public address (PUBLIC_BASE_URL or SERVER_NAME), or None if unset"""
+    if app.config.get('PUBLIC_BASE_URL'):
+        return app.config['PUBLIC_BASE_URL']
+    if app.config.get('SERVER_NAME'):
+        return f"{app.config['PREFERRED_URL_SCHEME']}://{app.config['SERVER_NAME']}"
+    return None
+
+def tracking_url_for(order_number):
+    """Absolute tracking URL, built from the configured base rather than the request Host header"""
+    base = public_base_url()
+    if base is None:
+        return url_for('track_order', order_number=order_number, _external=True)
+    return base + url_for('track_order', order_number=order_number)
+
+def canonical_order_redirect(endpoint, order_number, **values):
+    """404 for numbers no order can have, or a redirect to the canonical spelling (e.g. lowercase ULID)"""
+    number = canonical_order_number(order_number)
+    if number is None:
+        abort(404)
+    if number != order_number:
+        return redirect(url_for(endpoint, order_number=number, **values), 301)
+    return None
+
+def migrated_order_redirect(endpoint, order_number, **values):
+    """The order was not found: follow an old UUID renumbered by migrate-order-numbers, else 404"""
+    migrated = migrated_order_number(order_number)
+    if migrated is None:
+        abort(404)
+    return redirect(url_for(endpoint, order_number=migrated, **values), 301)
+
 @app.route('/admin/orders/<order_number>')
 @login_required
+@query_budget(3)
 def admin_order_detail(order_number):
     """View order details"""
-    order = Order.query.filter_by(order_number=order_number).first_or_404()
+    response = canonical_order_redirect('admin_order_detail', order_number)
+    if response:
+        return response
+    order = load_order_graph(order_number)
+    if order is None:
+        return migrated_order_redirect('admin_order_detail', order_number)
     return render_template('admin/order_detail.html', 
                          order=order,
                          employee_name=session.get('employee_name', 'الموظف'))
@@ -845,17 +997,133 @@ def update_order_status(order_number):
     new_status = request.form.get('status')
     
     if new_status in ['new', 'in_progress', 'completed']:
+        move_order_status(order.status, new_status)
+        # Completion rollups are counted on the completion day: take the old day out first
+        if order.status == 'completed':
+            record_orders_completed([order.id], sign=-1)
         order.status = new_status
         if new_status == 'completed':
             order.completed_at = datetime.utcnow()
         order.employee_id = session.get('employee_id')
+        if new_status == 'completed':
+            record_orders_completed([order.id])
         db.session.commit()
+        order_page_cache.pop(order_number)
         flash(f'تم تحديث حالة الطلب إلى: {get_status_text(new_status)}', 'success')
     else:
         flash('حالة غير صحيحة', 'error')
     
     return redirect(url_for('admin_order_detail', order_number=order_number))
 
+# Upper bound on orders moved by one batch request
+MAX_BATCH_ORDERS = 500
+
+def set_orders_status(order_numbers, new_status, employee_id):
+    """Move many orders to new_status with one UPDATE per current status.
+    
+    Numbers are accepted in any form the tracking page accepts (e.g. lowercase
+    ULIDs, renumbered UUIDs). Returns one result per submitted number: updated,
+    unchanged, not_found, or conflict (the order changed status between the
+    read and the update), with the order's current number for found orders.
+    """
+    canonical = {number: canonical_order_number(number) for number in order_numbers}
+    wanted = {number for number in canonical.values() if number}
+    current = dict(db.session.query(Order.order_number, Order.status)
+                   .filter(Order.order_number.in_(wanted)))
+    migrated = migrated_order_numbers(wanted - current.keys())
+    if migrated:
+        current.update(db.session.query(Order.order_number, Order.status)
+                       .filter(Order.order_number.in_(migrated.values())))
+    resolved = {submitted: migrated.get(number, number) for submitted, number in canonical.items()}
+    
+    results = {}
+    by_status = {}
+    for number in dict.fromkeys(resolved.values()):
+        if number not in current:
+            results[number] = {'result': 'not_found'}
+        elif current[number] == new_status:
+            results[number] = {'result': 'unchanged', 'old_status': new_status}
+        else:
+            by_status.setdefault(current[number], []).append(number)
+    
+    values = {'status': new_status, 'employee_id': employee_id}
+    if new_status == 'completed':
+        values['completed_at'] = datetime.utcnow()
+    updated = set()
+    for old_status, numbers in by_status.items():
+        # The status condition keeps the counters exact under concurrent changes
+        moved = db.session.execute(
+            update(Order)
+            .where(Order.order_number.in_(numbers), Order.status == old_status)
+            .values(**values)
+            .returning(Order.id, Order.order_number)
+        ).all()
+        move_order_status(old_status, new_status, len(moved))
+        if moved and old_status == 'completed':
+            # completed_at is only overwritten when moving to completed
+            record_orders_completed([order_id for order_id, _ in moved], sign=-1)
+        if moved and new_status == 'completed':
+            record_orders_completed([order_id for order_id, _ in moved])
+        updated.update(number for _, number in moved)
+        for number in numbers:
+            results[number] = {'result': 'updated' if number in updated else 'conflict',
+                               'old_status': old_status}
+    db.session.commit()
+    
+    for number in updated:
+        order_page_cache.pop(number)
+    return [{'order_number': submitted, **results[resolved[submitted]]}
+            | ({'current_number': resolved[submitted]} if resolved[submitted] in current else {})
+            for submitted in order_numbers]
+
+@app.route('/admin/orders/status', methods=['POST'])
+@login_required
+def batch_update_order_status():
+    """Update the status of many orders at once (form or JSON)"""
+    payload = request.get_json(silent=True) if request.is_json else None
+    if request.is_json:
+        if not isinstance(payload, dict) or not isinstance(payload.get('order_numbers'), list):
+            return jsonify({'success': False, 'error': 'يجب إرسال order_numbers كقائمة'}), 400
+        order_numbers = payload['order_numbers']
+        new_status = payload.get('status')
+    else:
+        order_numbers = request.form.getlist('order_numbers')
+        new_status = request.form.get('status')
+    # Keep the submitted order, drop duplicates and blanks
+    order_numbers = list(dict.fromkeys(str(number) for number in order_numbers if number))
+    
+    error = None
+    if new_status not in ['new', 'in_progress', 'completed']:
+        error = 'حالة غير صحيحة'
+    elif not order_numbers:
+        error = 'يرجى اختيار طلب واحد على الأقل'
+    elif len(order_numbers) > MAX_BATCH_ORDERS:
+        error = f'لا يمكن تحديث أكثر من {MAX_BATCH_ORDERS} طلب في المرة الواحدة'
+    
+    if error is None:
+        results = set_orders_status(order_numbers, new_status, session.get('employee_id'))
+        # Two spellings of one order count once
+        updated = len({item['current_number'] for item in results if item['result'] == 'updated'})
+    
+    if payload is not None:
+        if error:
+            return jsonify({'success': False, 'error': error}), 400
+        return jsonify({'success': True, 'status': new_status, 'updated': updated, 'results': results})
+    
+    if error:
+        flash(error, 'error')
+    else:
+        skipped = len(results) - updated
+        message = f'تم تحديث {updated} طلب إلى: {get_status_text(new_status)}'
+        if skipped:
+            message += f' (لم يتغير {skipped} طلب)'
+        flash(message, 'success')
+    
+    return_to = request.form.get('return_to')
+    if return_to not in ('admin_orders', 'employee_orders'):
+        return_to = 'employee_orders'
+    return redirect(url_for(return_to, status=request.form.get('status_filter', 'all')))
+
 def get_status_text(status):
     """Get Arabic text for order status"""
     status_map = {
@@ -866,11 +1134,79 @@ def get_status_text(status):
     return status_map.get(status, status)
 
 # Order tracking for customers
+def order_etag(order_number, status, completed_at):
+    """ETag for the tracking page: it only changes when the status or completion time does"""
+    completed = completed_at.isoformat() if completed_at else ''
+    return hashlib.sha1(f'{order_number}|{status}|{completed}'.encode('utf-8')).hexdigest()
+
 @app.route('/order/<order_number>')
+@query_budget(3)
 def track_order(order_number):
     """Customer order tracking page"""
-    order = Order.query.filter_by(order_number=order_number).first_or_404()
-    return render_template('user/track_order.html', order=order)
+    response = canonical_order_redirect('track_order', order_number)
+    if response:
+        return response
+    
+    # Customers refresh this page repeatedly; answer from the order state alone when possible
+    state = db.session.query(Order.status, Order.completed_at).filter_by(order_number=order_number).first()
+    if state is None:
+        return migrated_order_redirect('track_order', order_number)
+    
+    # The navbar and flashed messages depend on the session: only anonymous pages are shared
+    if session.get('admin_logged_in') or session.get('_flashes'):
+        order = load_order_graph(order_number)
+        response = make_response(render_template('user/track_order.html', order=order))
+        response.cache_control.no_cache = True
+        return response
+    
+    etag = order_etag(order_number, state.status, state.completed_at)
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+    else:
+        cached = order_page_cache.get(order_number)
+        if cached is not None and cached[0] == etag:
+            html = cached[1]
+        else:
+            order = load_order_graph(order_number)
+            html = render_template('user/track_order.html', order=order)
+            order_page_cache.set(order_number, (etag, html))
+        response = make_response(html)
+    
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    return response
+
+@app.route('/order/<order_number>/qr')
+def order_qr(order_number):
+    """QR code (PNG or SVG) linking to the order tracking page"""
+    fmt = request.args.get('format', 'png')
+    if fmt not in QR_FORMATS:
+        abort(404)
+    response = canonical_order_redirect('order_qr', order_number, format=fmt)
+    if response:
+        return response
+    
+    tracking_url = tracking_url_for(order_number)
+    etag = qr_etag(tracking_url, fmt)
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+    else:
+        image = qr_cache.get(tracking_url, fmt)
+        if image is None:
+            # Only render codes for orders that exist
+            if not db.session.query(Order.id).filter_by(order_number=order_number).first():
+                return migrated_order_redirect('order_qr', order_number, format=fmt)
+            # Without a configured base the URL comes from the Host header: keep it off the disk cache
+            image = qr_cache.get_or_render(tracking_url, fmt, persist=public_base_url() is not None)
+        response = make_response(image)
+        response.mimetype = QR_FORMATS[fmt]
+    
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    return response
 
 # Error handlers
 # Employee management routes (admin only)
@@ -912,6 +1248,8 @@ def add_employee():
                 password=hashed_password
             )
             db.session.add(employee)
+            adjust_counter('employees_total', 1)
+            adjust_counter('employees_active', 1)
             db.session.commit()
             flash(f'تم إضافة الموظف {full_name} بنجاح', 'success')
     else:
@@ -931,13 +1269,17 @@ def edit_employee(employee_id):
     
     employee.full_name = request.form.get('full_name', employee.full_name)
     employee.phone = request.form.get('phone', employee.phone)
-    employee.is_active = request.form.get('is_active') == 'on'
+    is_active = request.form.get('is_active') == 'on'
+    if bool(employee.is_active) != is_active:
+        adjust_counter('employees_active', 1 if is_active else -1)
+    employee.is_active = is_active
     
     # Update password if provided
     new_password = request.form.get('password')
     if new_password:
         employee.password = generate_password_hash(new_password)
     
+    invalidate_principals()
     db.session.commit()
     flash(f'تم تحديث بيانات {employee.full_name} بنجاح', 'success')
     
@@ -954,11 +1296,15 @@ def delete_employee(employee_id):
     employee = Employee.query.get_or_404(employee_id)
     
     # Prevent deleting admin account
-    if employee.username == 'admin':
+    if employee.role == ROLE_ADMIN:
         flash('لا يمكن حذف حساب المدير', 'error')
         return redirect(url_for('admin_employees'))
     
+    adjust_counter('employees_total', -1)
+    if employee.is_active:
+        adjust_counter('employees_active', -1)
     db.session.delete(employee)
+    invalidate_principals()
     db.session.commit()
     flash(f'تم حذف الموظف {employee.full_name} بنجاح', 'success')
     
@@ -974,16 +1320,13 @@ def employee_dashboard():
         return redirect(url_for('admin_dashboard'))
     
     # Employee can only see orders and basic stats
-    total_orders = Order.query.count()
-    new_orders = Order.query.filter_by(status='new').count()
-    in_progress_orders = Order.query.filter_by(status='in_progress').count()
-    completed_orders = Order.query.filter_by(status='completed').count()
+    counters = get_counters()
     
     return render_template('employee/dashboard.html',
-                         total_orders=total_orders,
-                         new_orders=new_orders,
-                         in_progress_orders=in_progress_orders,
-                         completed_orders=completed_orders,
+                         total_orders=counters['orders_total'],
+                         new_orders=counters['orders_new'],
+                         in_progress_orders=counters['orders_in_progress'],
+                         completed_orders=counters['orders_completed'],
                          employee_name=session.get('employee_name', 'الموظف'))
 
 # Backup Management Routes
@@ -991,32 +1334,50 @@ def employee_dashboard():
 @admin_required
 def admin_backup():
     """إدارة النسخ الاحتياطية"""
+    # مهمة انتهت أثناء متابعتها من الصفحة: عرض نتيجتها ثم الصفحة بدون المتابعة
+    job_id = request.args.get('job', type=int)
+    if job_id:
+        job = db.session.get(Job, job_id)
+        if job is None or job.status in ('succeeded', 'failed'):
+            if job is not None:
+                flash(job_message(job), 'success' if job.status == 'succeeded' else 'error')
+            return redirect(url_for('admin_backup'))
+    
     backup_manager = BackupManager()
     backups = backup_manager.get_backup_list()
     return render_template('admin/backup.html', 
                          backups=backups,
+                         progress=backup_manager.get_progress(),
+                         usage=backup_manager.get_storage_usage(),
+                         schedule=backup_scheduler.get_jobs(),
+                         history=backup_scheduler.get_history(),
+                         job_id=job_id,
                          employee_name=session.get('employee_name', 'المدير'))
 
+@app.route('/admin/backup/progress')
+@admin_required
+def backup_progress():
+    """Progress of the running (or last) database backup as JSON"""
+    return jsonify(BackupManager().get_progress() or {'state': 'idle'})
+
 @app.route('/admin/backup/create', methods=['POST'])
 @admin_required
 def create_backup():
     """إنشاء نسخة احتياطية"""
-    backup_manager = BackupManager()
     backup_type = request.form.get('backup_type', 'full')
+    compress = request.form.get('compress') == '1'
     
-    if backup_type == 'database':
-        result = backup_manager.create_database_backup()
-    elif backup_type == 'export':
-        result = backup_manager.create_data_export()
-    else:  # full backup
-        result = backup_manager.create_full_backup()
-    
-    if result.get('success'):
-        flash('تم إنشاء النسخة الاحتياطية بنجاح', 'success')
+    # النسخ والتصدير يعملان في عامل المهام؛ الطلب يعود فوراً والصفحة تتابع الحالة
+    if backup_type == 'export':
+        job = enqueue('export', {'compress': compress})
     else:
-        flash(f'خطأ في إنشاء النسخة الاحتياطية: {result.get("error", "خطأ غير معروف")}', 'error')
+        if backup_type not in ('database', 'incremental'):
+            backup_type = 'full'
+        job = enqueue('backup', {'backup_type': backup_type, 'compress': compress})
+    db.session.commit()
     
-    return redirect(url_for('admin_backup'))
+    flash('تمت إضافة النسخة الاحتياطية إلى قائمة المهام، يمكنك متابعة التقدم في هذه الصفحة', 'success')
+    return redirect(url_for('admin_backup', job=job.id))
 
 @app.route('/admin/backup/delete/<filename>')
 @admin_required
@@ -1032,6 +1393,124 @@ def delete_backup(filename):
     
     return redirect(url_for('admin_backup'))
 
+@app.route('/admin/backup/snapshot/<snapshot_id>/restore', methods=['POST'])
+@admin_required
+def restore_snapshot(snapshot_id):
+    """Rebuild an incremental snapshot as a database file in the backup folder"""
+    result = BackupManager().restore_snapshot(snapshot_id)
+    
+    if result.get('success'):
+        flash(f'تمت إعادة بناء اللقطة في الملف {result["backup_file"]}', 'success')
+    else:
+        flash(result.get('error'), 'error')
+    
+    return redirect(url_for('admin_backup'))
+
+@app.route('/admin/backup/snapshot/<snapshot_id>/delete', methods=['POST'])
+@admin_required
+def delete_snapshot(snapshot_id):
+    """Delete an incremental snapshot and the chunks only it referenced"""
+    result = BackupManager().delete_snapshot(snapshot_id)
+    
+    if result.get('success'):
+        flash('تم حذف اللقطة بنجاح', 'success')
+    else:
+        flash(result.get('error'), 'error')
+    
+    return redirect(url_for('admin_backup'))
+
+@app.route('/admin/backup/snapshots/prune', methods=['POST'])
+@admin_required
+def prune_snapshots():
+    """Apply the grandfather-father-son retention policy to the snapshots"""
+    result = BackupManager().prune_snapshots()
+    
+    if result.get('success'):
+        flash(f'تم حذف {len(result["removed"])} لقطة وتحرير {result["freed_bytes"] // 1024} كيلوبايت', 'success')
+    else:
+        flash(result.get('error'), 'error')
+    
+    return redirect(url_for('admin_backup'))
+
+@app.route('/admin/backup/validate/<name>', methods=['POST'])
+@admin_required
+def validate_backup(name):
+    """Queue a trial restore of a backup into a scratch file (measures restore time)"""
+    job = enqueue('validate_backup', {'name': name}, max_attempts=1)
+    db.session.commit()
+    flash('تمت إضافة التحقق من النسخة إلى قائمة المهام', 'success')
+    return redirect(url_for('admin_backup', job=job.id))
+
+@app.route('/admin/backup/restore/<name>', methods=['POST'])
+@admin_required
+def restore_backup(name):
+    """Queue a restore of a backup over the live database (a safety backup is taken first)"""
+    job = enqueue('restore_backup', {'name': name}, max_attempts=1)
+    db.session.commit()
+    flash('تمت إضافة استعادة النسخة إلى قائمة المهام', 'success')
+    return redirect(url_for('admin_backup', job=job.id))
+
+@app.route('/admin/jobs')
+@admin_required
+def admin_jobs():
+    """Background job history, newest first"""
+    status_filter = request.args.get('status')
+    query = Job.query
+    if status_filter in JOB_STATUSES:
+        query = query.filter_by(status=status_filter)
+    jobs = query.order_by(Job.created_at.desc(), Job.id.desc()).limit(100).all()
+    return render_template('admin/jobs.html',
+                         jobs=jobs,
+                         status_filter=status_filter,
+                         employee_name=session.get('employee_name', 'المدير'))
+
+@app.route('/admin/jobs/<int:job_id>')
+@admin_required
+def job_status(job_id):
+    """Status of one background job as JSON (polled by the admin pages)"""
+    job = db.session.get(Job, job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job_to_dict(job))
+
+@app.route('/admin/reports')
+@admin_required
+def admin_reports():
+    """Revenue and volume reports, read only from the daily rollup tables"""
+    job_id = request.args.get('job', type=int)
+    if job_id:
+        job = db.session.get(Job, job_id)
+        if job is None or job.status in ('succeeded', 'failed'):
+            if job is not None:
+                flash(job_message(job), 'success' if job.status == 'succeeded' else 'error')
+            return redirect(url_for('admin_reports'))
+    
+    start, end = default_report_range()
+    try:
+        if request.args.get('start'):
+            start = date.fromisoformat(request.args['start'])
+        if request.args.get('end'):
+            end = date.fromisoformat(request.args['end'])
+    except ValueError:
+        flash('تاريخ غير صحيح، تم عرض آخر 30 يوماً', 'error')
+        start, end = default_report_range()
+    if start > end:
+        start, end = end, start
+    
+    return render_template('admin/reports.html',
+                         report=get_report(start, end),
+                         rollups_missing=rollups_missing(),
+                         job_id=job_id)
+
+@app.route('/admin/reports/rebuild', methods=['POST'])
+@admin_required
+def rebuild_reports():
+    """Rebuild the rollup tables from all orders in the background"""
+    job = enqueue('rebuild_rollups', max_attempts=1)
+    db.session.commit()
+    flash('تم بدء إعادة بناء التقارير في الخلفية', 'success')
+    return redirect(url_for('admin_reports', job=job.id))
+
 @app.route('/admin/backup/download/<filename>')
 @admin_required
 def download_backup(filename):
@@ -12,8 +12,9 @@ if __name__ == '__main__':
         import models
         import routes
         
-        # Create all tables
-        db.create_all()
+        # Create all tables and any indexes added since the database was created
+        from schema import upgrade_schema
+        upgrade_schema()
         
         # Initialize default settings if they don't exist
         from werkzeug.security import generate_password_hash
@@ -43,6 +44,7 @@ if __name__ == '__main__':
                 password=generate_password_hash("admin123"),
                 full_name="مدير النظام",
                 phone="01000000000",
+                role=models.ROLE_ADMIN,
                 is_active=True
             )
             db.session.add(admin_employee)
@@ -0,0 +1,51 @@
+import logging
+from sqlalchemy import inspect, text, update
+from sqlalchemy.schema import CreateColumn
+from app import db
+from models import Employee, ROLE_ADMIN
+from order_addons import backfill_order_addons
+from rollups import rebuild_rollups
+
+logger = logging.getLogger(__name__)
+
+
+def _add_missing_columns(inspector):
+    """إضافة الأعمدة الجديدة لجداول موجودة (ALTER TABLE ... ADD COLUMN)"""
+    added = set()
+    for table in db.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                ddl = CreateColumn(column).compile(dialect=db.engine.dialect)
+                with db.engine.begin() as conn:
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {ddl}'))
+                added.add((table.name, column.name))
+                logger.info('Added column %s.%s', table.name, column.name)
+    return added
+
+
+def upgrade_schema():
+    """ترقية قاعدة بيانات موجودة: create_all لا يضيف أعمدة أو فهارس لجداول موجودة مسبقاً
+
+    يُرجع True إذا أعاد بناء التجميعات.
+    """
+    tables_before = set(inspect(db.engine).get_table_names())
+    db.create_all()
+    inspector = inspect(db.engine)
+    added = _add_missing_columns(inspector)
+    if ('employees', 'role') in added:
+        # قبل عمود الدور كان حساب "admin" هو المدير الوحيد
+        db.session.execute(update(Employee).where(Employee.username == 'admin').values(role=ROLE_ADMIN))
+        db.session.commit()
+    for table in db.metadata.sorted_tables:
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(db.engine)
+                logger.info('Created index %s on %s', index.name, table.name)
+    if 'orders' in tables_before and 'order_addons' not in tables_before:
+        # إضافات الطلبات القديمة من عمود JSON، ثم التقارير لتشمل إيراد الإضافات
+        if backfill_order_addons():
+            rebuild_rollups()
+            return True
+    return False
@@ -0,0 +1,242 @@
+import fcntl
+import hashlib
+import json
+import os
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+
+# حجم الجزء: مضاعف لحجم صفحة SQLite حتى تقع الصفحات المتغيرة في أجزاء مستقلة
+CHUNK_SIZE = 64 * 1024
+
+# سياسة الاحتفاظ (الجد - الأب - الابن): آخر لقطة من كل يوم/أسبوع/شهر
+RETENTION_POLICY = {
+    'keep_last': 3,
+    'daily': 7,
+    'weekly': 4,
+    'monthly': 12,
+}
+
+
+class SnapshotError(Exception):
+    """خطأ في مخزن اللقطات (لقطة غير موجودة أو جزء تالف)"""
+    pass
+
+
+def retention_keep(snapshots, policy=None):
+    """معرفات اللقطات التي تحتفظ بها سياسة الجد - الأب - الابن
+
+    snapshots: قائمة (snapshot_id, created_at). أحدث لقطة محفوظة دائماً.
+    """
+    policy = policy or RETENTION_POLICY
+    ordered = sorted(snapshots, key=lambda item: item[1], reverse=True)
+    keep = {snapshot_id for snapshot_id, _ in ordered[:max(1, policy.get('keep_last', 1))]}
+
+    buckets = {
+        'daily': lambda created_at: created_at.date(),
+        'weekly': lambda created_at: created_at.isocalendar()[:2],
+        'monthly': lambda created_at: (created_at.year, created_at.month),
+    }
+    for name, bucket_of in buckets.items():
+        seen = []
+        for snapshot_id, created_at in ordered:
+            bucket = bucket_of(created_at)
+            if bucket in seen:
+                continue
+            if len(seen) >= policy.get(name, 0):
+                break
+            seen.append(bucket)
+            keep.add(snapshot_id)
+    return keep
+
+
+class SnapshotStore:
+    """مخزن لقطات قاعدة البيانات بعنونة المحتوى
+
+    كل لقطة ملف manifest يسرد بصمات (sha256) أجزاء الملف بالترتيب، والأجزاء
+    مضغوطة في chunks/ ومشتركة بين اللقطات، فلا يُخزن إلا ما تغيّر منذ آخر لقطة.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.chunks_dir = os.path.join(root, 'chunks')
+        self.manifests_dir = os.path.join(root, 'manifests')
+
+    @contextmanager
+    def _locked(self):
+        """قفل بين العمليات: الإنشاء والحذف وتنظيف الأجزاء لا تتداخل"""
+        os.makedirs(self.manifests_dir, exist_ok=True)
+        os.makedirs(self.chunks_dir, exist_ok=True)
+        with open(os.path.join(self.root, '.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _chunk_path(self, digest):
+        return os.path.join(self.chunks_dir, digest[:2], digest)
+
+    def _manifest_path(self, snapshot_id):
+        return os.path.join(self.manifests_dir, f'{snapshot_id}.json')
+
+    @staticmethod
+    def _write_atomic(path, data):
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def create(self, db_file, **info):
+        """تخزين ملف قاعدة بيانات (نسخة متسقة) كلقطة جديدة؛ يُرجع الـ manifest"""
+        with self._locked():
+            created_at = datetime.now()
+            snapshot_id = created_at.strftime('snap_%Y%m%d_%H%M%S')
+            suffix = 1
+            while os.path.exists(self._manifest_path(snapshot_id)):
+                suffix += 1
+                snapshot_id = created_at.strftime('snap_%Y%m%d_%H%M%S') + f'_{suffix}'
+
+            chunks = []
+            new_chunks = 0
+            new_bytes = 0
+            file_hash = hashlib.sha256()
+            with open(db_file, 'rb') as f:
+                while True:
+                    data = f.read(CHUNK_SIZE)
+                    if not data:
+                        break
+                    file_hash.update(data)
+                    digest = hashlib.sha256(data).hexdigest()
+                    chunks.append(digest)
+                    path = self._chunk_path(digest)
+                    if not os.path.exists(path):
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                        compressed = zlib.compress(data, 6)
+                        self._write_atomic(path, compressed)
+                        new_chunks += 1
+                        new_bytes += len(compressed)
+
+            manifest = dict(info,
+                            id=snapshot_id,
+                            created_at=created_at.isoformat(),
+                            file_size=os.path.getsize(db_file),
+                            file_sha256=file_hash.hexdigest(),
+                            chunk_size=CHUNK_SIZE,
+                            chunks=chunks,
+                            new_chunks=new_chunks,
+                            new_bytes=new_bytes)
+            # الـ manifest يُكتب أخيراً: اللقطة لا توجد إلا بعد اكتمال كل أجزائها
+            self._write_atomic(self._manifest_path(snapshot_id),
+                               json.dumps(manifest, ensure_ascii=False).encode('utf-8'))
+            return manifest
+
+    def exists(self, snapshot_id):
+        return os.path.isfile(self._manifest_path(snapshot_id))
+
+    def get(self, snapshot_id):
+        try:
+            with open(self._manifest_path(snapshot_id), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise SnapshotError(f'Snapshot not found: {snapshot_id}')
+
+    def list(self):
+        """كل اللقطات (بدون قوائم الأجزاء)، الأحدث أولاً"""
+        if not os.path.isdir(self.manifests_dir):
+            return []
+        snapshots = []
+        for filename in os.listdir(self.manifests_dir):
+            if not filename.endswith('.json'):
+                continue
+            manifest = self.get(filename[:-len('.json')])
+            manifest['chunk_count'] = len(manifest.pop('chunks'))
+            manifest['created_at'] = datetime.fromisoformat(manifest['created_at'])
+            snapshots.append(manifest)
+        snapshots.sort(key=lambda item: item['created_at'], reverse=True)
+        return snapshots
+
+    def restore(self, snapshot_id, target):
+        """إعادة بناء ملف اللقطة في target مع التحقق من بصمة كل جزء والملف كاملاً"""
+        manifest = self.get(snapshot_id)
+        file_hash = hashlib.sha256()
+        tmp_path = f'{target}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as out:
+                for digest in manifest['chunks']:
+                    try:
+                        with open(self._chunk_path(digest), 'rb') as f:
+                            data = zlib.decompress(f.read())
+                    except (OSError, zlib.error) as e:
+                        raise SnapshotError(f'Missing or corrupt chunk {digest}: {e}')
+                    if hashlib.sha256(data).hexdigest() != digest:
+                        raise SnapshotError(f'Chunk checksum mismatch: {digest}')
+                    file_hash.update(data)
+                    out.write(data)
+            if file_hash.hexdigest() != manifest['file_sha256']:
+                raise SnapshotError(f'Snapshot checksum mismatch: {snapshot_id}')
+            os.replace(tmp_path, target)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return manifest
+
+    def delete(self, snapshot_id):
+        """حذف لقطة ثم الأجزاء التي لم تعد أي لقطة تشير إليها"""
+        with self._locked():
+            path = self._manifest_path(snapshot_id)
+            if not os.path.exists(path):
+                raise SnapshotError(f'Snapshot not found: {snapshot_id}')
+            os.remove(path)
+            return self._collect_garbage()
+
+    def prune(self, policy=None):
+        """تطبيق سياسة الاحتفاظ؛ يُرجع المعرفات المحذوفة وعدد الأجزاء المحررة"""
+        with self._locked():
+            snapshots = [(item['id'], item['created_at']) for item in self.list()]
+            keep = retention_keep(snapshots, policy)
+            removed = [snapshot_id for snapshot_id, _ in snapshots if snapshot_id not in keep]
+            for snapshot_id in removed:
+                os.remove(self._manifest_path(snapshot_id))
+            freed_chunks, freed_bytes = self._collect_garbage()
+            return {'removed': removed, 'freed_chunks': freed_chunks, 'freed_bytes': freed_bytes}
+
+    def _collect_garbage(self):
+        """حذف الأجزاء غير المشار إليها (يُستدعى تحت القفل فقط)"""
+        referenced = set()
+        for filename in os.listdir(self.manifests_dir):
+            if filename.endswith('.json'):
+                referenced.update(self.get(filename[:-len('.json')])['chunks'])
+
+        freed_chunks = freed_bytes = 0
+        for prefix in os.listdir(self.chunks_dir):
+            prefix_dir = os.path.join(self.chunks_dir, prefix)
+            for digest in os.listdir(prefix_dir):
+                if digest not in referenced:
+                    path = os.path.join(prefix_dir, digest)
+                    freed_bytes += os.path.getsize(path)
+                    os.remove(path)
+                    freed_chunks += 1
+        return freed_chunks, freed_bytes
+
+    def usage(self):
+        """المساحة الفعلية على القرص مقابل مجموع أحجام اللقطات"""
+        stored_bytes = 0
+        chunk_count = 0
+        for directory in (self.chunks_dir, self.manifests_dir):
+            if not os.path.isdir(directory):
+                continue
+            for dirpath, _dirnames, filenames in os.walk(directory):
+                for filename in filenames:
+                    stored_bytes += os.path.getsize(os.path.join(dirpath, filename))
+                    if directory == self.chunks_dir:
+                        chunk_count += 1
+        snapshots = self.list()
+        return {
+            'snapshots': len(snapshots),
+            'chunks': chunk_count,
+            'stored_bytes': stored_bytes,
+            'logical_bytes': sum(item['file_size'] for item in snapshots),
+        }
@@ -0,0 +1,124 @@
+import logging
+import re
+import threading
+import time
+from collections import deque
+from flask import g, request, current_app, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('sql.requests')
+slow_logger = logging.getLogger('sql.slow')
+
+# عدد الاستعلامات البطيئة المحفوظة في الذاكرة لصفحة الإدارة
+SLOW_QUERY_HISTORY = 200
+
+_lock = threading.Lock()
+_route_stats = {}
+_slow_queries = deque(maxlen=SLOW_QUERY_HISTORY)
+
+_IN_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_SPACE_RE = re.compile(r'\s+')
+
+
+def normalize_sql(statement):
+    """توحيد نص الاستعلام لتجميع الاستعلامات المتشابهة (القيم الحرفية وقوائم IN)"""
+    statement = _STRING_RE.sub('?', statement)
+    statement = _NUMBER_RE.sub('?', statement)
+    statement = _IN_LIST_RE.sub('(?, ...)', statement)
+    return _SPACE_RE.sub(' ', statement).strip()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get('query_start_time')
+    if not start_times:
+        return
+    elapsed = time.perf_counter() - start_times.pop()
+    if not has_request_context() or 'sql_count' not in g:
+        return
+
+    g.sql_count += 1
+    g.sql_time += elapsed
+
+    threshold = g.sql_slow_threshold
+    if threshold is not None and elapsed * 1000 >= threshold:
+        entry = {
+            'time': time.time(),
+            'route': request.endpoint or request.path,
+            'duration_ms': round(elapsed * 1000, 2),
+            'sql': normalize_sql(statement)
+        }
+        with _lock:
+            _slow_queries.append(entry)
+        slow_logger.warning('slow_query route=%s duration_ms=%.2f sql="%s"',
+                            entry['route'], entry['duration_ms'], entry['sql'])
+
+
+def _start_request():
+    g.sql_count = 0
+    g.sql_time = 0.0
+    g.sql_slow_threshold = current_app.config.get('SQL_SLOW_QUERY_MS')
+
+
+def _finish_request(response):
+    if 'sql_count' not in g:
+        return response
+
+    route = request.endpoint or 'unknown'
+    db_ms = g.sql_time * 1000
+    with _lock:
+        stats = _route_stats.get(route)
+        if stats is None:
+            stats = _route_stats[route] = {
+                'route': route, 'requests': 0, 'statements': 0,
+                'db_time_ms': 0.0, 'max_db_time_ms': 0.0, 'max_statements': 0
+            }
+        stats['requests'] += 1
+        stats['statements'] += g.sql_count
+        stats['db_time_ms'] += db_ms
+        stats['max_db_time_ms'] = max(stats['max_db_time_ms'], db_ms)
+        stats['max_statements'] = max(stats['max_statements'], g.sql_count)
+
+    logger.info('request method=%s route=%s status=%s sql_count=%d sql_ms=%.2f',
+                request.method, route, response.status_code, g.sql_count, db_ms)
+
+    if current_app.config.get('SQL_METRICS_HEADERS') or current_app.debug:
+        response.headers['X-SQL-Count'] = str(g.sql_count)
+        response.headers['X-SQL-Time-ms'] = f'{db_ms:.2f}'
+    return response
+
+
+def init_sql_metrics(app):
+    """تسجيل مستمعي أحداث المحرك وخطافات الطلب لقياس تكلفة قاعدة البيانات لكل مسار"""
+    app.config.setdefault('SQL_SLOW_QUERY_MS', 100)
+    app.config.setdefault('SQL_METRICS_HEADERS', False)
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+
+def get_route_stats(limit=20):
+    """أسوأ المسارات حسب إجمالي زمن قاعدة البيانات (لهذه العملية فقط)"""
+    with _lock:
+        stats = [dict(item) for item in _route_stats.values()]
+    for item in stats:
+        item['avg_db_time_ms'] = item['db_time_ms'] / item['requests']
+        item['avg_statements'] = item['statements'] / item['requests']
+    stats.sort(key=lambda item: item['db_time_ms'], reverse=True)
+    return stats[:limit]
+
+
+def get_slow_queries(limit=50):
+    """أحدث الاستعلامات البطيئة"""
+    with _lock:
+        return list(reversed(_slow_queries))[:limit]
@@ -0,0 +1,76 @@
+import os
+import sqlite3
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+# ملفات تعريف إعدادات SQLite؛ تُطبق على كل اتصال جديد
+SQLITE_PROFILES = {
+    # عدة عمليات gunicorn تكتب في نفس الملف
+    'production': {
+        'journal_mode': 'WAL',
+        'busy_timeout': 5000,
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -16000,  # بالكيلوبايت عند الإشارة السالبة (~16MB)
+        'foreign_keys': 'ON',
+        'temp_store': 'MEMORY',
+    },
+    # السلوك السابق: بدون أي PRAGMA (للمقارنة في اختبار الأداء)
+    'legacy': {},
+}
+
+# متغيرات البيئة التي تتجاوز قيم الملف المختار
+_ENV_OVERRIDES = {
+    'busy_timeout': 'SQLITE_BUSY_TIMEOUT_MS',
+    'mmap_size': 'SQLITE_MMAP_SIZE',
+    'cache_size': 'SQLITE_CACHE_SIZE',
+    'synchronous': 'SQLITE_SYNCHRONOUS',
+    'journal_mode': 'SQLITE_JOURNAL_MODE',
+}
+
+
+def get_sqlite_pragmas(profile=None):
+    """قيم PRAGMA لملف التعريف المطلوب (SQLITE_PROFILE) مع تجاوزات البيئة"""
+    profile = profile or os.environ.get('SQLITE_PROFILE', 'production')
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(f'Unknown SQLite profile: {profile}')
+    pragmas = dict(SQLITE_PROFILES[profile])
+    if profile != 'legacy':
+        for name, env_name in _ENV_OVERRIDES.items():
+            if os.environ.get(env_name):
+                pragmas[name] = os.environ[env_name]
+    return pragmas
+
+
+def sqlite_engine_options(pragmas):
+    """خيارات create_engine المناسبة لقاعدة SQLite في ملف"""
+    if not pragmas:
+        return {
+            "pool_recycle": 300,
+            "pool_pre_ping": True,
+        }
+    busy_timeout = int(pragmas.get('busy_timeout', 5000))
+    return {
+        # اتصالات الملف رخيصة وآمنة لإعادة الاستخدام؛ لا حاجة لـ pre_ping أو recycle
+        "poolclass": QueuePool,
+        "pool_size": 5,
+        "max_overflow": 10,
+        "connect_args": {"timeout": busy_timeout / 1000, "check_same_thread": False},
+    }
+
+
+def register_sqlite_pragmas(engine, pragmas):
+    """تطبيق قيم PRAGMA على كل اتصال جديد بالمحرك"""
+    if not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
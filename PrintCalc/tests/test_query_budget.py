@@ -0,0 +1,82 @@
+"""Query budgets of the order pages: a template change that adds a lazy load per item fails here.
+
+Runs against a scratch SQLite file (DATABASE_PATH), never data/printing_costs.db:
+
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+_scratch = tempfile.mkdtemp(prefix='printcalc_tests_')
+os.environ['DATABASE_PATH'] = os.path.join(_scratch, 'test.db')
+os.environ['QR_DISK_CACHE_DIR'] = ''
+os.environ['BACKUP_SCHEDULER_ENABLED'] = '0'
+os.environ['JOB_WORKER_THREADS'] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from app import app, db  # noqa: E402
+import routes  # noqa: E402,F401  (registers the routes)
+from models import (AcademicYear, Subject, Book, PrintingPrice, AddOn, Employee, Order,  # noqa: E402
+                    OrderItem, ROLE_ADMIN)
+from order_addons import record_order_addons  # noqa: E402
+from query_budget import assert_max_queries  # noqa: E402
+from schema import upgrade_schema  # noqa: E402
+
+ITEMS_PER_ORDER = 6
+# @query_budget(3) on both routes; the admin page also reads the principals version for login_required
+TRACK_ORDER_BUDGET = 3
+ORDER_DETAIL_BUDGET = 4
+
+
+@pytest.fixture(scope='module')
+def order_number():
+    app.config['TESTING'] = True
+    with app.app_context():
+        upgrade_schema()
+        db.session.add(Employee(username='admin', password=generate_password_hash('admin123'),
+                                full_name='مدير النظام', role=ROLE_ADMIN, is_active=True))
+        year = AcademicYear(name='الصف الأول')
+        subject = Subject(name='الرياضيات', academic_year=year)
+        price = PrintingPrice(name='وش أسود', price_per_unit=0.5, pages_per_unit=2)
+        addons = [AddOn(name='غلاف', price=7.0), AddOn(name='تجليد', price=5.0)]
+        books = [Book(name=f'كتاب {i}', page_count=40 + i, subject=subject) for i in range(ITEMS_PER_ORDER)]
+        db.session.add_all([year, subject, price, *addons, *books])
+        db.session.flush()
+
+        order = Order(customer_name='عميل', total_cost=100.0, printing_type_id=price.id)
+        db.session.add(order)
+        db.session.flush()
+        for book in books:
+            db.session.add(OrderItem(order_id=order.id, book_id=book.id, quantity=2, unit_cost=10.0, total_cost=20.0))
+        record_order_addons(order.id, [{'id': addon.id, 'price': addon.price} for addon in addons])
+        db.session.commit()
+        return order.order_number
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+def test_track_order_query_budget(client, order_number):
+    client.get(f'/order/{order_number}')  # warm the catalog/settings caches
+    routes.order_page_cache.clear()
+    with assert_max_queries(TRACK_ORDER_BUDGET, 'track_order'):
+        response = client.get(f'/order/{order_number}')
+    assert response.status_code == 200
+    assert 'كتاب 5' in response.get_data(as_text=True)
+
+
+def test_admin_order_detail_query_budget(client, order_number):
+    client.post('/admin/login', data={'username': 'admin', 'password': 'admin123'})
+    client.get(f'/admin/orders/{order_number}')
+    with assert_max_queries(ORDER_DETAIL_BUDGET, 'admin_order_detail'):
+        response = client.get(f'/admin/orders/{order_number}')
+    assert response.status_code == 200
+    assert 'كتاب 5' in response.get_data(as_text=True)
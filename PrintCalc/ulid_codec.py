@@ -0,0 +1,69 @@
+import os
+import threading
+import time
+
+# أبجدية Crockford base32 (بدون I و L و O و U)
+CROCKFORD = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+ULID_LENGTH = 26
+_DECODE = {char: value for value, char in enumerate(CROCKFORD)}
+# حروف تُكتب خطأً بدلاً من الأرقام المشابهة لها
+_DECODE.update({'I': 1, 'L': 1, 'O': 0})
+_RANDOM_BITS = 80
+_RANDOM_MAX = (1 << _RANDOM_BITS) - 1
+
+_lock = threading.Lock()
+_last = (0, 0)
+
+
+def encode_ulid(timestamp_ms, randomness):
+    """26 حرفاً: 48 بت للوقت بالمللي ثانية ثم 80 بت عشوائية (الترتيب النصي = الترتيب الزمني)"""
+    value = (timestamp_ms << _RANDOM_BITS) | randomness
+    chars = []
+    for _ in range(ULID_LENGTH):
+        chars.append(CROCKFORD[value & 31])
+        value >>= 5
+    return ''.join(reversed(chars))
+
+
+def new_ulid(timestamp_ms=None):
+    """معرف ULID جديد؛ متزايد داخل العملية حتى لو تكرر نفس المللي ثانية
+
+    مع timestamp_ms (لترقيم سجلات قديمة بوقت إنشائها) يكون الجزء العشوائي عشوائياً فقط.
+    """
+    global _last
+    if timestamp_ms is not None:
+        return encode_ulid(timestamp_ms, int.from_bytes(os.urandom(10), 'big'))
+    now = int(time.time() * 1000)
+    with _lock:
+        last_ms, last_random = _last
+        if now <= last_ms:
+            now, randomness = last_ms, last_random + 1
+            if randomness > _RANDOM_MAX:
+                now, randomness = last_ms + 1, 0
+        else:
+            randomness = int.from_bytes(os.urandom(10), 'big')
+        _last = (now, randomness)
+    return encode_ulid(now, randomness)
+
+
+def normalize_ulid(text):
+    """الصيغة القياسية (حروف كبيرة، I/L→1، O→0) أو None إذا لم يكن النص ULID صالحاً"""
+    if not text or len(text) != ULID_LENGTH:
+        return None
+    text = text.upper()
+    try:
+        values = [_DECODE[char] for char in text]
+    except KeyError:
+        return None
+    # أول حرف يحمل 3 بتات فقط (128 بت = 26 × 5 - 2)
+    if values[0] > 7:
+        return None
+    return ''.join(CROCKFORD[value] for value in values)
+
+
+def ulid_timestamp(ulid):
+    """وقت الإنشاء (مللي ثانية منذ 1970) المرمّز في أول 10 حروف"""
+    value = 0
+    for char in ulid[:10]:
+        value = (value << 5) | _DECODE[char]
+    return value
@@ -60,4 +60,12 @@ def format_relative_time(utc_datetime):
     elif minutes > 0:
         return f'منذ {minutes} دقيقة' if minutes == 1 else f'منذ {minutes} دقائق'
     else:
-        return 'منذ لحظات'
\ No newline at end of file
+        return 'منذ لحظات'
+
+def format_short_order_number(order_number):
+    """رقم طلب مختصر للجداول: آخر 8 حروف من ULID (أوله وقت متقارب لكل الطلبات) أو أول 8 من UUID قديم"""
+    if not order_number:
+        return ''
+    if len(order_number) == 26:
+        return '...' + order_number[-8:]
+    return order_number[:8] + '...'